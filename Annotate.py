@@ -0,0 +1,119 @@
+'''
+Annotates a feature table of m/z values against the precursor index of a set of lipid classes.
+
+    index = PrecursorIndex.cached(classes_to_generate, tails_to_generate, bases_to_generate)
+    features, annotated = annotate(index, 'features.csv', 'annotated.csv', tolerance=10, unit='ppm')
+
+Features are read in chunks and matched with one vectorised search per chunk, so tables of
+any size are streamed. Each candidate is written as its own row, after the feature's columns.
+'''
+import csv
+import numpy as np
+import Lipids.GenerateLipids as GL
+from Lipids.PrecursorIndex import sumComposition
+
+chunkSize = 50000 # Features matched at once
+
+mzColumns = ['m/z', 'mz', 'mass', 'precursor m/z', 'precursor mz', 'row m/z', 'mzmed']
+polarityColumns = ['polarity', 'ion mode', 'mode']
+polarities = {'+':1, 'pos':1, 'positive':1, '1':1, '-':-1, 'neg':-1, 'negative':-1, '-1':-1}
+
+annotationHeader = ['Class', 'Species', 'Adduct', 'Formula', 'Charge', 'Candidate m/z', 'Error (ppm)']
+
+def find_column(header, names):
+    '''Index of the first column of header named as in names, ignoring case, or None.'''
+    header = [column.strip().lower() for column in header]
+    return next((header.index(name) for name in names if name in header), None)
+
+def read_features(file_name):
+    '''
+    Yields (header, rows, m/z, polarity) for chunks of a CSV or TSV feature table.
+    The m/z column is found by name, or is the first column of a table without a header.
+    Polarity is 1, -1 or 0 where the table does not give one.
+    '''
+    with open(file_name, newline='') as file:
+        sample = file.readline()
+        file.seek(0)
+        reader = csv.reader(file, delimiter='\t' if '\t' in sample else ',')
+        first = next(reader, None)
+        if first is None: return
+
+        mzColumn = find_column(first, mzColumns)
+        if mzColumn is None: # No header, m/z first
+            header, mzColumn, polarityColumn, rows = [], 0, None, [first]
+        else: header, polarityColumn, rows = first, find_column(first, polarityColumns), []
+
+        for row in reader:
+            if not row: continue
+            rows.append(row)
+            if len(rows) == chunkSize:
+                yield header, rows, *parse_chunk(rows, mzColumn, polarityColumn)
+                rows = []
+        if rows: yield header, rows, *parse_chunk(rows, mzColumn, polarityColumn)
+
+def parse_chunk(rows, mzColumn, polarityColumn):
+    try: mz = np.array([float(row[mzColumn]) for row in rows])
+    except (ValueError, IndexError) as error: raise ValueError(f'Could not read m/z from feature table: {error}')
+    if polarityColumn is None: polarity = np.zeros(len(rows), dtype=np.int32)
+    else: polarity = np.array([polarities.get(row[polarityColumn].strip().lower(), 0) if polarityColumn < len(row) else 0
+                               for row in rows], dtype=np.int32)
+    return mz, polarity
+
+def bounds(mz, tolerance, unit):
+    if unit == 'ppm': shift = mz*tolerance/1000000
+    elif unit == 'Da': shift = np.full(len(mz), tolerance)
+    else: raise ValueError(f"Unknown tolerance unit '{unit}', choose from ppm, Da")
+    return mz - shift, mz + shift
+
+def annotate(index, input_file, output_file, tolerance=10, unit='ppm', ionMode='+/-', progress=None):
+    '''
+    Writes every candidate of each feature in input_file within tolerance (ppm or Da) to output_file.
+    ionMode '+' or '-' limits candidates to that polarity, as does a polarity column of the table.
+    progress is called with the number of features read after each chunk.
+    Returns the number of features, and the number with at least one candidate.
+    '''
+    details = {} # Index entry: (class, species, adduct, formula, charge, m/z), shared by features
+    def describe(entry):
+        if entry not in details:
+            cls, adduct, lipid, mz = index.candidate(entry)
+            formula = lipid.formula + GL.adducts[adduct][3]
+            charge = GL.adducts[adduct][2]
+            details[entry] = (cls.__name__, f'{lipid.lipid_class} {sumComposition(lipid)}', adduct, str(formula),
+                              f"{abs(charge) if abs(charge) > 1 else ''}{'+' if charge > 0 else '-'}", mz)
+        return details[entry]
+
+    mode = {'+':1, '-':-1}.get(ionMode, 0)
+    features = annotated = 0
+    with open(output_file, 'w', newline='') as file:
+        writer = csv.writer(file)
+        wroteHeader = False
+
+        for header, rows, mz, polarity in read_features(input_file):
+            if not wroteHeader:
+                writer.writerow((header or ['m/z']) + annotationHeader)
+                wroteHeader = True
+            low, high = bounds(mz, tolerance, unit)
+            if mode: polarity = np.where(polarity == 0, mode, polarity)
+
+            windows, entries = index.matches(low, high)
+            sign = np.sign(index.charges(entries))
+            keep = (polarity[windows] == 0) | (polarity[windows] == sign)
+            if mode: keep &= sign == mode
+            windows, entries = windows[keep], entries[keep]
+
+            candidates = [[] for _ in rows]
+            for window, entry in zip(windows.tolist(), entries.tolist()):
+                candidate = describe(entry)
+                if low[window] <= candidate[5] <= high[window]: candidates[window].append(candidate)
+
+            output = []
+            for row, target, found in zip(rows, mz.tolist(), candidates):
+                for candidate in found:
+                    output.append(row + list(candidate) + [round((candidate[5] - target)/target*1000000, 2)])
+                if not found: output.append(row + ['']*len(annotationHeader))
+                else: annotated += 1
+            writer.writerows(output)
+
+            features += len(rows)
+            if progress: progress(features)
+    return features, annotated
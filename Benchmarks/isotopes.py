@@ -0,0 +1,50 @@
+'''
+Isotope pattern timings for Lipids.Isotopes, for lipids of increasing size.
+
+    python Benchmarks/isotopes.py
+    python Benchmarks/isotopes.py --threshold 1e-6 --json isotopes.json
+'''
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Lipids.GenerateLipids as GL
+from Lipids.Isotopes import isotopeSpectra, modes
+
+formulas = { # Neutral formulas
+    'FA 18:1':            ({'C':18, 'H':34, 'O':2}, -1),
+    'PC 34:1':            ({'C':42, 'H':82, 'N':1, 'O':8, 'P':1}, 1),
+    'TG 54:3':            ({'C':57, 'H':104, 'O':6}, 1),
+    'CL 72:8':            ({'C':81, 'H':142, 'O':17, 'P':2}, -2),
+    'CL 80:8':            ({'C':89, 'H':158, 'O':17, 'P':2}, -2),
+    'GD1a 36:1;O2':       ({'C':84, 'H':148, 'N':4, 'O':39}, -2),
+    'PC 34:1(D9)':        ({'C':42, 'H':73, 'D':9, 'N':1, 'O':8, 'P':1}, 1),
+}
+
+def measure(name, formula, charge, mode, threshold, repeats):
+    formula = GL.Formula(formula)
+    t0 = time.perf_counter()
+    for _ in range(repeats):
+        spectra = isotopeSpectra(formula, charge, threshold, mode)
+    elapsed = (time.perf_counter() - t0)/repeats
+    return {'lipid':name, 'formula':str(formula), 'mode':mode, 'peaks':len(spectra), 'ms':round(elapsed*1000, 3)}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Isotope pattern timings.')
+    parser.add_argument('--threshold', type=float, default=1e-4, help='Smallest isotopologue probability kept')
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--json', help='Optional file to write results to')
+    args = parser.parse_args()
+
+    results = []
+    for name, (formula, charge) in formulas.items():
+        for mode in modes:
+            result = measure(name, formula, charge, mode, args.threshold, args.repeats)
+            results.append(result)
+            print(f"{name:>14} {result['formula']:<22} {mode:>8}: {result['peaks']:>4} peaks in {result['ms']:>7.3f} ms")
+    if args.json:
+        with open(args.json, 'w') as file: json.dump(results, file, indent=2)
@@ -0,0 +1,118 @@
+'''
+Peak memory benchmark for lipid enumeration in Library.Generator.generate_range.
+
+Each measurement runs in a fresh interpreter so that peak RSS is not shared between runs.
+'materialised' reproduces the previous behaviour of building list(product(...)) for a class
+before the first lipid is yielded, 'lazy' is the current generate_range.
+--objects instead reports the memory held by each lipid object, measured with tracemalloc.
+
+    python Benchmarks/memory.py --classes TG,CL --cmin 2 --cmax 30 --dmax 2 --limit 1000
+    python Benchmarks/memory.py --classes PC,TG,CL --cmin 14 --cmax 22 --dmax 4 --limit 20000 --objects
+'''
+import os
+import sys
+import json
+import time
+import argparse
+import itertools
+import subprocess
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def peak_rss():
+    '''Peak resident set size of this process, in bytes.'''
+    try:
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if sys.platform == 'darwin' else rss*1024 # Linux reports kB, macOS bytes.
+    except ImportError:
+        import psutil # Windows
+        return psutil.Process().memory_info().peak_wset
+
+def measure(className, mode, tails, limit):
+    import Library
+    import Lipids.Classes as Classes
+    from itertools import combinations_with_replacement as cwr, product
+
+    cls = getattr(Classes, className)
+    cls.adducts_to_generate = {}
+    generator = Library.Generator(os.devnull, None, [cls], tails, [18, 18, getattr(cls, 'base_types', [])],
+                                  False, False, [], False, [], True)
+
+    t0 = time.perf_counter()
+    count, firstLipid = 0, None
+    if mode == 'lazy':
+        for lipid in generator.generate_range():
+            if firstLipid is None: firstLipid = time.perf_counter() - t0
+            count += 1
+            if count >= limit: break
+    else: # Previous behaviour: every combination tuple is held in memory before the first lipid is built.
+        generator.generate_tail_lists()
+        constituentList = [cwr(pool, r=r) for pool, r in generator.generate_constituents(cls)]
+        combs = list(product(*constituentList))
+        for combination in combs:
+            lipid = cls(*generator.flatten(combination))
+            if firstLipid is None: firstLipid = time.perf_counter() - t0
+            count += 1
+            if count >= limit: break
+
+    return {'class':className, 'mode':mode, 'lipids':count,
+            'first_lipid_s':round(firstLipid or 0, 4), 'peak_rss_mb':round(peak_rss()/1024**2, 1)}
+
+def bytes_per_lipid(className, tails, limit):
+    '''Memory allocated per lipid object, without spectra, for the first limit lipids of a class.'''
+    import Library
+    import Lipids.Classes as Classes
+    import Lipids.GenerateLipids as GL
+
+    cls = getattr(Classes, className)
+    generator = Library.Generator(os.devnull, None, [cls], tails, [18, 18, GL.baseTypes], False, False, [], False, [], True)
+    generator.generate_tail_lists()
+    combinations = list(itertools.islice(generator.lazyProduct(generator.generate_constituents(cls)), limit))
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    lipids = [cls(*generator.flatten(combination)) for combination in combinations]
+    allocated = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return {'class':className, 'lipids':len(lipids), 'bytes_per_lipid':round(allocated/max(len(lipids), 1))}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Peak RSS of lipid enumeration, before and after lazy enumeration.')
+    parser.add_argument('--classes', default='TG,CL')
+    parser.add_argument('--cmin', type=int, default=2)
+    parser.add_argument('--cmax', type=int, default=30)
+    parser.add_argument('--dmin', type=int, default=0)
+    parser.add_argument('--dmax', type=int, default=2)
+    parser.add_argument('--limit', type=int, default=1000, help='Number of lipids to enumerate per run')
+    parser.add_argument('--objects', action='store_true', help='Report bytes held per lipid object instead of peak RSS')
+    parser.add_argument('--mode', choices=['lazy', 'materialised'], help=argparse.SUPPRESS) # Used by child processes
+    parser.add_argument('--json', help='Optional file to write results to')
+    args = parser.parse_args()
+
+    tails = [args.cmin, args.cmax, args.dmin, args.dmax, 0, 0]
+
+    if args.mode:
+        print(json.dumps(measure(args.classes, args.mode, tails, args.limit)))
+    elif args.objects:
+        results = [bytes_per_lipid(className, tails, args.limit) for className in args.classes.split(',')]
+        for result in results:
+            print(f"{result['class']:>8} C{args.cmin}-C{args.cmax} D{args.dmin}-D{args.dmax}: "
+                  f"{result['bytes_per_lipid']:>6} bytes per lipid ({result['lipids']} lipids)")
+        if args.json:
+            with open(args.json, 'w') as file: json.dump(results, file, indent=2)
+    else:
+        results = []
+        for className in args.classes.split(','):
+            for mode in ['materialised', 'lazy']:
+                output = subprocess.run([sys.executable, os.path.abspath(__file__), '--classes', className, '--mode', mode,
+                                         '--cmin', str(args.cmin), '--cmax', str(args.cmax), '--dmin', str(args.dmin),
+                                         '--dmax', str(args.dmax), '--limit', str(args.limit)],
+                                        capture_output=True, text=True, check=True)
+                result = json.loads(output.stdout.strip().splitlines()[-1])
+                results.append(result)
+                print(f"{result['class']:>6} C{args.cmin}-C{args.cmax} D{args.dmin}-D{args.dmax} {result['mode']:>12}: "
+                      f"peak RSS {result['peak_rss_mb']:>8.1f} MB, first lipid after {result['first_lipid_s']:.4f} s")
+        if args.json:
+            with open(args.json, 'w') as file: json.dump(results, file, indent=2)
@@ -0,0 +1,56 @@
+'''
+Precursor index (Lipids.PrecursorIndex) build, load and query timings, for every lipid class and adduct.
+
+    python Benchmarks/precursors.py
+    python Benchmarks/precursors.py --cmax 24 --dmax 6 --ppm 5 --json precursors.json
+'''
+import os
+import sys
+import json
+import time
+import tempfile
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Library
+import Lipids.GenerateLipids as GL
+from Lipids.PrecursorIndex import PrecursorIndex
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Precursor index timings.')
+    parser.add_argument('--cmin', type=int, default=2)
+    parser.add_argument('--cmax', type=int, default=30)
+    parser.add_argument('--dmin', type=int, default=0)
+    parser.add_argument('--dmax', type=int, default=12)
+    parser.add_argument('--ppm', type=float, default=10)
+    parser.add_argument('--queries', type=int, default=1000, help='Random target masses queried')
+    parser.add_argument('--json', help='Optional file to write results to')
+    args = parser.parse_args()
+
+    classes = {cls:list(cls.adducts) for cls in Library.lipid_classes()}
+    tails = [args.cmin, args.cmax, args.dmin, args.dmax, 0, 0]
+    bases = [18, 18, GL.baseTypes]
+
+    t0 = time.perf_counter()
+    index = PrecursorIndex(classes, tails, bases)
+    build = time.perf_counter() - t0
+
+    path = os.path.join(tempfile.mkdtemp(), 'precursors.npz')
+    index.save(path)
+    t0 = time.perf_counter()
+    index = PrecursorIndex.load(path, classes, tails, bases)
+    load = time.perf_counter() - t0
+
+    targets = np.random.default_rng(0).uniform(300, 1500, args.queries)
+    t0 = time.perf_counter()
+    candidates = sum(len(index.query(mz*(1-args.ppm/1e6), mz*(1+args.ppm/1e6))) for mz in targets)
+    query = (time.perf_counter() - t0)/args.queries
+
+    result = {'precursors':len(index), 'build_s':round(build, 4), 'load_s':round(load, 4),
+              'query_ms':round(query*1000, 4), 'candidates_per_query':round(candidates/args.queries, 2)}
+    print(f"{result['precursors']} precursors: built in {build:.3f} s, loaded in {load:.3f} s, "
+          f"{result['query_ms']:.3f} ms and {result['candidates_per_query']} candidates per {args.ppm} ppm query")
+    if args.json:
+        with open(args.json, 'w') as file: json.dump(result, file, indent=2)
@@ -0,0 +1,174 @@
+'''
+Fixed workloads for comparing generation, spectrum resolution and export speed between commits.
+
+Generation workloads write each format for PC, PE, TG, CL and HexCer, at a narrow and a wide tail range.
+Wide ranges are chosen per class so that each workload takes seconds rather than hours.
+'search' is Page 6's mass search: building the precursor index and querying it for random targets.
+'isotopes' is the isotope pattern of every precursor of the wide workload, as reviewed on Page 6.
+Each workload runs in a fresh interpreter, so peak RSS is its own.
+
+    python Benchmarks/suite.py --json before.json
+    python Benchmarks/suite.py --workloads narrow,search --formats msp --json after.json --compare before.json
+'''
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from memory import peak_rss
+
+classes = ['PC', 'PE', 'TG', 'CL', 'HexCer']
+tails = { # Workload: {class: tail range}
+    'narrow': {cls:'16:0-18:2' for cls in classes},
+    'wide': {'PC':'12:0-24:6', 'PE':'12:0-24:6', 'TG':'14:0-22:4', 'CL':'14:0-20:2', 'HexCer':'12:0-24:6'},
+}
+formats = ['msp', 'orb', 'sky', 'iso', 'lsgl']
+searchTails, searchQueries, searchPPM = '12:0-24:6', 1000, 10
+
+def lipid_classes():
+    '''Every lipid class, with its templates as the wizard loads them.'''
+    import Library
+    available = Library.lipid_classes()
+    Library.load_templates(available, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Templates'))
+    return available
+
+def generation(workload, format):
+    '''Writes the classes of workload in format, one class at a time as their tail ranges differ.'''
+    import lsg
+    import Estimate
+
+    lipids = spectra = records = size = elapsed = 0
+    folder = tempfile.mkdtemp()
+    for cls, tailRange in tails[workload].items():
+        file_name = os.path.join(folder, f'{cls}.{format}')
+        generators = []
+        t0 = time.perf_counter()
+        records += lsg.generate(file_name, [cls], tails=tailRange, format=format, varyBases=True, report=generators.append)
+        elapsed += time.perf_counter() - t0
+        estimate = Estimate.estimate(generators[0], samples=0) # Exact counts, without generating again
+        lipids, spectra, size = lipids + estimate.lipids, spectra + estimate.spectra, size + os.path.getsize(file_name)
+        os.remove(file_name)
+    os.rmdir(folder)
+    return {'workload':workload, 'format':format, 'lipids':lipids, 'spectra':spectra, 'records':records,
+            'mb':round(size/1e6, 3), 'seconds':round(elapsed, 3), 'lipids_per_s':round(lipids/elapsed, 1),
+            'spectra_per_s':round(spectra/elapsed, 1), 'mb_per_s':round(size/1e6/elapsed, 3)}
+
+def search():
+    '''Builds the precursor index of every adduct of the classes, then queries it as Page 6.'''
+    import lsg
+    from Lipids.PrecursorIndex import PrecursorIndex
+
+    selection = {cls:list(cls.adducts) for cls in lsg.find_classes(classes, lipid_classes())}
+    cmin, cmax, dmin, dmax = lsg.parse_tails(searchTails)
+
+    t0 = time.perf_counter()
+    index = PrecursorIndex(selection, [cmin, cmax, dmin, dmax, 0, 0], lsg.bases(selection, cmin, cmax, True))
+    build = time.perf_counter() - t0
+
+    targets = np.random.default_rng(0).uniform(index.mz[0], index.mz[-1], searchQueries)
+    t0 = time.perf_counter()
+    candidates = sum(len(index.query(mz*(1-searchPPM/1e6), mz*(1+searchPPM/1e6))) for mz in targets)
+    elapsed = time.perf_counter() - t0
+    return {'workload':'search', 'precursors':len(index), 'build_s':round(build, 3), 'queries':searchQueries,
+            'candidates':candidates, 'seconds':round(elapsed, 3), 'queries_per_s':round(searchQueries/elapsed, 1)}
+
+def isotopes():
+    '''Fine and nominal isotope patterns of every precursor of the wide workload.'''
+    import Library
+    import lsg
+    import Lipids.GenerateLipids as GL
+    from Lipids.Isotopes import isotopeSpectra, modes
+
+    precursors = set() # (formula, charge), as lipids of a sum composition share one
+    for cls in lsg.find_classes(classes, lipid_classes()):
+        cmin, cmax, dmin, dmax = lsg.parse_tails(tails['wide'][cls.__name__])
+        generator = Library.Generator(None, None, [cls], [cmin, cmax, dmin, dmax, 0, 0], lsg.bases([cls], cmin, cmax, True),
+                                      False, False, [], False, [], True)
+        generator.generate_tail_lists()
+        for lipid in generator.generate_class(cls):
+            for adduct in cls.adducts:
+                precursors.add((lipid.formula + GL.adducts[adduct][3], GL.adducts[adduct][2]))
+
+    result = {'workload':'isotopes', 'precursors':len(precursors)}
+    for mode in modes:
+        t0 = time.perf_counter()
+        peaks = sum(len(isotopeSpectra(formula, charge, 1e-4, mode)) for formula, charge in precursors)
+        elapsed = time.perf_counter() - t0
+        result.update({f'{mode}_peaks':peaks, f'{mode}_s':round(elapsed, 3), f'{mode}_per_s':round(len(precursors)/elapsed, 1)})
+    return result
+
+def run(workload, format=None):
+    if workload == 'search': result = search()
+    elif workload == 'isotopes': result = isotopes()
+    else: result = generation(workload, format)
+    result['peak_rss_mb'] = round(peak_rss()/1024**2, 1)
+    return result
+
+def describe(result):
+    if result['workload'] == 'search':
+        return (f"{'search':>8}      : {result['precursors']} precursors built in {result['build_s']:.3f} s, "
+                f"{result['queries_per_s']:>10,.1f} queries/s")
+    if result['workload'] == 'isotopes':
+        return (f"{'isotopes':>8}      : {result['precursors']} precursors, "
+                + ', '.join(f"{mode} {result[f'{mode}_per_s']:,.1f}/s" for mode in ['fine', 'nominal']))
+    return (f"{result['workload']:>8} {result['format']:>5}: {result['lipids_per_s']:>10,.1f} lipids/s, "
+            f"{result['spectra_per_s']:>10,.1f} spectra/s, {result['mb_per_s']:>8.3f} MB/s")
+
+def speed(result):
+    '''The rate compared between runs of a workload.'''
+    if result['workload'] == 'search': return result['queries_per_s']
+    if result['workload'] == 'isotopes': return result['fine_per_s']
+    return result['lipids_per_s']
+
+def name(result):
+    return result['workload'] + (f" {result['format']}" if 'format' in result else '')
+
+def commit():
+    try: return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                               cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError): return None
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generation, search and isotope benchmarks, for comparison between commits.')
+    parser.add_argument('--workloads', default='narrow,wide,search,isotopes')
+    parser.add_argument('--formats', default=','.join(formats))
+    parser.add_argument('--json', help='Optional file to write results to')
+    parser.add_argument('--compare', help='Results of an earlier run, to print the change in speed of each workload')
+    parser.add_argument('--run', nargs='+', help=argparse.SUPPRESS) # Workload and format, used by child processes
+    args = parser.parse_args()
+
+    if args.run:
+        print(json.dumps(run(*args.run)))
+        sys.exit()
+
+    runs = []
+    for workload in args.workloads.split(','):
+        if workload in tails: runs.extend([workload, format] for format in args.formats.split(','))
+        elif workload in ['search', 'isotopes']: runs.append([workload])
+        else: parser.error(f"Unknown workload '{workload}', choose from {', '.join([*tails, 'search', 'isotopes'])}")
+
+    results = []
+    for arguments in runs:
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), '--run', *arguments], capture_output=True, text=True, check=True)
+        result = json.loads(output.stdout.strip().splitlines()[-1])
+        results.append(result)
+        print(f"{describe(result)}, peak RSS {result['peak_rss_mb']:>7.1f} MB")
+
+    if args.compare:
+        with open(args.compare) as file: before = {name(result):result for result in json.load(file)['results']}
+        print(f"Compared with {args.compare}:")
+        for result in results:
+            if name(result) in before:
+                print(f"{name(result):>14}: {speed(result)/speed(before[name(result)]):>6.2f}x speed, "
+                      f"{result['peak_rss_mb'] - before[name(result)]['peak_rss_mb']:>+8.1f} MB peak RSS")
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump({'commit':commit(), 'python':platform.python_version(), 'platform':platform.platform(),
+                       'processor':platform.processor(), 'results':results}, file, indent=2)
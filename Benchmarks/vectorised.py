@@ -0,0 +1,88 @@
+'''
+Vectorised spectra (Lipids.SpectrumEngine) against Lipid.resolve_spectra.
+
+For each class and adduct, times building every spectrum of the tail range object by object,
+and with a SpectrumTemplate, then checks the two agree to 1e-6 for a sample of lipids.
+
+    python Benchmarks/vectorised.py --classes PC,TG,CL --cmin 14 --cmax 20 --dmax 2
+    python Benchmarks/vectorised.py --all --verify 2000
+'''
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import itertools
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Library
+import Lipids.GenerateLipids as GL
+from Lipids.SpectrumEngine import SpectrumTemplate, verify
+
+def tail_indices(constituentList):
+    '''Every tail combination of a class, as indices into the tail pool of each position.'''
+    combinations = [itertools.combinations_with_replacement(range(len(pool)), r) for pool, r in constituentList]
+    return np.array([list(itertools.chain.from_iterable(combination)) for combination in itertools.product(*combinations)], dtype=np.intp)
+
+def measure(generator, cls, adduct, limit, sample):
+    constituentList = generator.generate_constituents(cls)
+    pools = [pool for pool, r in constituentList for _ in range(r)]
+    indices = tail_indices(constituentList)[:limit]
+
+    t0 = time.perf_counter()
+    for combination in indices: # Previous behaviour, object by object
+        lipid = cls(*[pools[p][t] for p, t in enumerate(combination)])
+        lipid.resolve_spectra(adduct, cls.adducts[adduct])
+    objects = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    template = SpectrumTemplate(cls, adduct, pools)
+    build = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    mz, intensity, rows, counts = template.spectra(indices)
+    vectorised = time.perf_counter() - t0
+
+    checked = indices if len(indices) <= sample else indices[sorted(random.Random(0).sample(range(len(indices)), sample))]
+    return {'class':cls.__name__, 'adduct':adduct, 'lipids':len(indices), 'fragments':int(counts.sum()),
+            'objects_s':round(objects, 4), 'template_s':round(build, 4), 'vectorised_s':round(vectorised, 4),
+            **verify(template, checked)}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Vectorised spectra against Lipid.resolve_spectra.')
+    parser.add_argument('--classes', default='PC,TG,CL')
+    parser.add_argument('--all', action='store_true', help='Every lipid class')
+    parser.add_argument('--cmin', type=int, default=14)
+    parser.add_argument('--cmax', type=int, default=20)
+    parser.add_argument('--dmin', type=int, default=0)
+    parser.add_argument('--dmax', type=int, default=2)
+    parser.add_argument('--limit', type=int, default=100000, help='Maximum lipids per class')
+    parser.add_argument('--verify', type=int, default=1000, help='Lipids compared per class and adduct')
+    parser.add_argument('--json', help='Optional file to write results to')
+    args = parser.parse_args()
+
+    classes = Library.lipid_classes()
+    if not args.all:
+        names = args.classes.split(',')
+        classes = [cls for cls in classes if cls.__name__ in names]
+
+    generator = Library.Generator(os.devnull, None, classes, [args.cmin, args.cmax, args.dmin, args.dmax, 0, 0],
+                                  [18, 18, GL.baseTypes], False, False, [], False, [], True)
+    generator.generate_tail_lists()
+
+    results = []
+    for cls in classes:
+        for adduct in cls.adducts:
+            try: result = measure(generator, cls, adduct, args.limit, args.verify)
+            except ValueError as error: # Fragments could not be separated by tail position
+                result = {'class':cls.__name__, 'adduct':adduct, 'error':str(error)}
+                print(f"{cls.__name__:>16} {adduct:<16} unsupported: {error}")
+            else:
+                print(f"{cls.__name__:>16} {adduct:<16} {result['lipids']:>8} lipids: objects {result['objects_s']:>8.3f} s, "
+                      f"vectorised {result['vectorised_s']:>7.3f} s (+{result['template_s']:.3f} s template), "
+                      f"{result['mismatched']} of {result['checked']} differ, max error {result['max_error']:.1e}")
+            results.append(result)
+    if args.json:
+        with open(args.json, 'w') as file: json.dump(results, file, indent=2)
@@ -0,0 +1,266 @@
+'''
+Compiled library format, written by Library.Generator with the "LSG Library (*.lsgl)" filter.
+
+A compiled library holds the same spectra as an .MSP file, as columns which are opened with numpy.memmap,
+so libraries of any size open at once and single spectra are read without parsing the rest of the file.
+
+    library = CompiledLibrary('lipids.lsgl')
+    for i in library.find_mass(760.58, 760.59): print(library.record(i))
+    library.find_name('PC 16:0_18:1 [M+H]+')
+    library.to_msp('lipids.msp') # As the MSP filter would have written it
+
+File layout: 8 byte magic, 8 byte little-endian JSON length, JSON header, padding to 64 bytes, then sections,
+each 64 byte aligned at the offset given in the header, relative to the end of the header padding.
+  Precursor table, one row per spectrum:  precursor_mz, mw, peak_start (one longer), and string ids of
+                                          name, adduct, class, formula, smiles, ionmode
+  Peaks, concatenated:                    peak_mz, peak_intensity, peak_comment (string id)
+  String table:                           string_offsets (one longer), string_data (UTF-8)
+  Indexes:                                mz_order (spectra by precursor m/z), name_hash and name_order
+'''
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import numpy as np
+from array import array
+
+magic = b'LSGLIB\x00\x01'
+alignment = 64
+
+columns = { # section: (array typecode, numpy dtype)
+    'precursor_mz':('d', '<f8'), 'mw':('d', '<f8'), 'peak_start':('Q', '<u8'),
+    'name':('I', '<u4'), 'adduct':('I', '<u4'), 'class':('I', '<u4'), 'formula':('I', '<u4'), 'smiles':('I', '<u4'), 'ionmode':('I', '<u4'),
+    'peak_mz':('d', '<f8'), 'peak_intensity':('d', '<f8'), 'peak_comment':('I', '<u4'),
+    'string_offsets':('Q', '<u8'), 'string_data':('B', '<u1')}
+stringColumns = ['name', 'adduct', 'class', 'formula', 'smiles', 'ionmode']
+sharedColumns = ['adduct', 'class', 'formula', 'ionmode'] # Repeated between spectra, stored once
+
+def msp_text(name, ionmode, mw, precursor, lipidClass, formula, smiles, adduct, peaks):
+    '''One .MSP record, peaks as (m/z, intensity, comment).'''
+    string = (f"NAME: {name}\n"
+              f"IONMODE: {ionmode}\n"
+              f"MW: {mw}\n"
+              f"PRECURSORMZ: {precursor}\n"
+              f"COMPOUNDCLASS: {lipidClass}\n"
+              f"FORMULA: {formula}\n"
+              f"SMILES: {smiles}\n"
+              f"COMMENT: LSG in-silico\n"
+              f"RETENTIONTIME: 0.00\n" # Pointless
+              f"PRECURSORTYPE: {adduct}\n"
+              f"Num Peaks: {len(peaks)}\n")
+    return string + ''.join(f'{mz} {intensity} "{comment}" \n' for mz, intensity, comment in peaks) + '\n'
+
+def name_hash(name):
+    return int.from_bytes(hashlib.blake2b(name.encode(), digest_size=8).digest(), 'little')
+
+class Column:
+    '''Appends values to a temporary file, holding up to bufferSize bytes in memory.'''
+    def __init__(self, typecode, bufferSize):
+        self.values = array(typecode)
+        self.file = tempfile.TemporaryFile()
+        self.limit = max(bufferSize // self.values.itemsize, 1)
+        self.length = 0
+
+    def append(self, value):
+        self.values.append(value)
+        self.length += 1
+        if len(self.values) >= self.limit: self.flush()
+
+    def extend(self, values):
+        self.values.extend(values)
+        self.length += len(values)
+        if len(self.values) >= self.limit: self.flush()
+
+    def flush(self):
+        self.values.tofile(self.file)
+        del self.values[:]
+
+class CompiledWriter:
+    '''
+    Collects compiled library records, see Library.Generator.lsgl_records, and writes the library
+    to a binary file when flushed. Has the interface of Library.BufferedWriter, flush is only called once.
+    '''
+    def __init__(self, file, bufferSize=1 << 20):
+        self.file = file
+        self.columns = {section:Column(typecode, bufferSize) for section, (typecode, dtype) in columns.items()}
+        self.columns['peak_start'].append(0)
+        self.columns['string_offsets'].append(0)
+        self.shared = {} # String: id, for strings repeated between spectra
+        self.strings = 0
+        self.bytes = 0
+        self.names = [] # Hashes of names, to sort once written
+        self.written = 0
+        self.start = time.perf_counter()
+
+    def string(self, text, shared=False):
+        if shared and text in self.shared: return self.shared[text]
+        data = text.encode()
+        self.columns['string_data'].extend(data)
+        self.bytes += len(data)
+        self.columns['string_offsets'].append(self.bytes)
+        self.strings += 1
+        if shared: self.shared[text] = self.strings-1
+        return self.strings-1
+
+    def write(self, record):
+        '''record is a dictionary of the precursor table's values, and the peaks as (m/z, intensity, comment).'''
+        columns = self.columns
+        columns['precursor_mz'].append(record['precursor_mz'])
+        columns['mw'].append(record['mw'])
+        for column in stringColumns:
+            columns[column].append(self.string(str(record[column]), column in sharedColumns))
+        peaks = record['peaks']
+        columns['peak_mz'].extend([peak[0] for peak in peaks])
+        columns['peak_intensity'].extend([peak[1] for peak in peaks])
+        columns['peak_comment'].extend([self.string(peak[2], True) for peak in peaks])
+        columns['peak_start'].append(columns['peak_mz'].length)
+        self.names.append(name_hash(record['name']))
+
+    def flush(self):
+        '''Sorts the indexes, then writes the header and every section.'''
+        for column in self.columns.values(): column.flush()
+        precursors = self.read('precursor_mz')
+        indexes = {'mz_order':np.argsort(precursors, kind='stable').astype('<u8')}
+        hashes = np.array(self.names, dtype='<u8')
+        indexes['name_order'] = np.argsort(hashes, kind='stable').astype('<u8')
+        indexes['name_hash'] = hashes[indexes['name_order']]
+
+        sections, offset = {}, 0
+        for section, (typecode, dtype) in columns.items():
+            sections[section] = {'offset':offset, 'dtype':dtype, 'length':self.columns[section].length}
+            offset = self.aligned(offset + self.columns[section].length*np.dtype(dtype).itemsize)
+        for section, values in indexes.items():
+            sections[section] = {'offset':offset, 'dtype':values.dtype.str, 'length':len(values)}
+            offset = self.aligned(offset + values.nbytes)
+
+        header = json.dumps({'version':1, 'spectra':len(precursors), 'peaks':self.columns['peak_mz'].length,
+                             'strings':self.strings, 'sections':sections}).encode()
+        start = self.aligned(len(magic) + 8 + len(header))
+        self.file.write(magic + len(header).to_bytes(8, 'little') + header)
+        self.file.write(b'\0'*(start - len(magic) - 8 - len(header)))
+
+        position = 0
+        for section in columns:
+            self.pad(sections[section]['offset'] - position)
+            self.columns[section].file.seek(0)
+            shutil.copyfileobj(self.columns[section].file, self.file)
+            self.columns[section].file.close()
+            position = sections[section]['offset'] + self.columns[section].length*np.dtype(columns[section][1]).itemsize
+        for section, values in indexes.items():
+            self.pad(sections[section]['offset'] - position)
+            self.file.write(values.tobytes())
+            position = sections[section]['offset'] + values.nbytes
+        self.file.flush()
+        self.written = start + position
+
+    def read(self, section):
+        self.columns[section].file.seek(0)
+        return np.fromfile(self.columns[section].file, dtype=columns[section][1])
+
+    def aligned(self, offset):
+        return -(-offset // alignment)*alignment
+
+    def pad(self, length):
+        self.file.write(b'\0'*length)
+
+    def throughput(self):
+        elapsed = time.perf_counter() - self.start
+        return self.written/1e6/elapsed if elapsed > 0 else 0
+
+class CompiledLibrary:
+    '''A compiled library, opened read only with numpy.memmap.'''
+    def __init__(self, file_name):
+        self.file_name = file_name
+        with open(file_name, 'rb') as file:
+            if file.read(len(magic)) != magic: raise ValueError(f'{file_name} is not a compiled LSG library')
+            length = int.from_bytes(file.read(8), 'little')
+            self.header = json.loads(file.read(length))
+        start = -(-(len(magic) + 8 + length) // alignment)*alignment
+
+        self.sections = {}
+        for section, layout in self.header['sections'].items():
+            if layout['length']:
+                self.sections[section] = np.memmap(file_name, dtype=layout['dtype'], mode='r',
+                                                   offset=start + layout['offset'], shape=(layout['length'],))
+            else: self.sections[section] = np.zeros(0, dtype=layout['dtype'])
+        self.precursorSorted = None
+
+    def __len__(self):
+        return self.header['spectra']
+
+    def __getitem__(self, section):
+        return self.sections[section]
+
+    def string(self, i):
+        offsets = self.sections['string_offsets']
+        return bytes(self.sections['string_data'][offsets[i]:offsets[i+1]]).decode()
+
+    def peaks(self, i):
+        '''(m/z, intensity, comment) of each peak of spectrum i.'''
+        start, stop = self.sections['peak_start'][i:i+2]
+        comments = [self.string(j) for j in self.sections['peak_comment'][start:stop]]
+        intensities = [int(x) if x.is_integer() else x for x in self.sections['peak_intensity'][start:stop].tolist()]
+        return list(zip(self.sections['peak_mz'][start:stop].tolist(), intensities, comments))
+
+    def record(self, i):
+        '''Every value of spectrum i, as given to CompiledWriter.write.'''
+        record = {column:self.string(self.sections[column][i]) for column in stringColumns}
+        record['precursor_mz'] = float(self.sections['precursor_mz'][i])
+        record['mw'] = float(self.sections['mw'][i])
+        record['peaks'] = self.peaks(i)
+        return record
+
+    def find_mass(self, low, high):
+        '''Spectra with a precursor from low to high m/z, in m/z order.'''
+        if self.precursorSorted is None: # Read once, 8 bytes a spectrum
+            self.precursorSorted = np.asarray(self.sections['precursor_mz'])[self.sections['mz_order']]
+        start = np.searchsorted(self.precursorSorted, low, 'left')
+        stop = np.searchsorted(self.precursorSorted, high, 'right')
+        return np.asarray(self.sections['mz_order'][start:stop], dtype=np.int64)
+
+    def find_name(self, name):
+        '''Spectra named name, e.g. 'PC 16:0_18:1 [M+H]+'.'''
+        key = np.uint64(name_hash(name))
+        start = np.searchsorted(self.sections['name_hash'], key, 'left')
+        stop = np.searchsorted(self.sections['name_hash'], key, 'right')
+        return [int(i) for i in sorted(self.sections['name_order'][start:stop]) if self.string(self.sections['name'][i]) == name]
+
+    def strings(self, ids, cache=None):
+        '''Decoded strings of ids, reading the string table between them at once. cache holds strings to reuse.'''
+        if cache is None: cache = {}
+        ids = np.asarray(ids, dtype=np.int64)
+        offsets = self.sections['string_offsets']
+        missing = [i for i in np.unique(ids).tolist() if i not in cache]
+        if missing:
+            low, high = int(offsets[missing[0]]), int(offsets[missing[-1]+1])
+            data = bytes(self.sections['string_data'][low:high])
+            starts, stops = offsets[missing].tolist(), offsets[np.array(missing)+1].tolist()
+            for i, start, stop in zip(missing, starts, stops): cache[i] = data[start-low:stop-low].decode()
+        return [cache[i] for i in ids.tolist()]
+
+    def to_msp(self, file_name, chunk=10000):
+        '''Writes every spectrum as .MSP text, as the MSP filter writes it, chunk spectra at a time. Returns the number of spectra.'''
+        shared = {} # Strings repeated between spectra, kept between chunks
+        with open(file_name, 'x', newline='') as file:
+            for first in range(0, len(self), chunk):
+                last = min(first+chunk, len(self))
+                spectra = {column:self.strings(self.sections[column][first:last], shared if column in sharedColumns else None)
+                           for column in stringColumns}
+                precursors = self.sections['precursor_mz'][first:last].tolist()
+                mws = self.sections['mw'][first:last].tolist()
+                peakStart = self.sections['peak_start'][first:last+1].tolist()
+
+                low, high = peakStart[0], peakStart[-1]
+                mzs = self.sections['peak_mz'][low:high].tolist()
+                intensities = [int(x) if x.is_integer() else x for x in self.sections['peak_intensity'][low:high].tolist()]
+                comments = self.strings(self.sections['peak_comment'][low:high], shared)
+
+                text = []
+                for i in range(last-first):
+                    start, stop = peakStart[i]-low, peakStart[i+1]-low
+                    text.append(msp_text(spectra['name'][i], spectra['ionmode'][i], mws[i], precursors[i], spectra['class'][i],
+                                         spectra['formula'][i], spectra['smiles'][i], spectra['adduct'][i],
+                                         list(zip(mzs[start:stop], intensities[start:stop], comments[start:stop]))))
+                file.write(''.join(text))
+        return len(self)
@@ -0,0 +1,143 @@
+'''
+Size of a library before it is generated, from the settings of a Library.Generator.
+
+    generator = Library.Generator(None, "MSP (*.msp)", classes_to_generate, tails_to_generate, bases_to_generate, ...)
+    estimate = Estimate.estimate(generator)
+    estimate.lipids, estimate.spectra, estimate.records, estimate.bytes
+    for cls, (lipids, spectra, records, bytes) in estimate.classes.items(): ...
+
+Lipids are counted in closed form from the tail lists, as Generator.count_combinations.
+Species-level spectra (adducts without FA or Cer fragments) are written once per sum composition,
+which are counted as the sumset of the compositions of each constituent's tails, without building lipids.
+Inclusion list precursors are counted as one per sum composition and adduct, so isobaric precursors which
+are merged when written are not counted. Transitions per spectrum and bytes per record are extrapolated
+from a few lipids sampled at random from each class.
+
+chunk_size uses the same samples to size the jobs of Library.Generator.run_parallel.
+'''
+import numpy as np
+
+jobBytes = 1 << 22 # Output aimed for per job of Generator.run_parallel
+minimumChunk, maximumChunk = 100, 20000 # Tail combinations per job
+
+fields = ('c', 'd', 'me', 'oh', 'dt') # Summed into a species-level name, see Library.Generator.addTailNames
+fieldBits = 12
+
+def composition(tail):
+    '''Sum composition fields of a tail packed into one integer, so compositions add as integers.'''
+    return sum(getattr(tail, field) << (fieldBits*i) for i, field in enumerate(fields))
+
+def sumset(a, b):
+    '''Every sum of one of a and one of b.'''
+    return np.unique(np.add.outer(a, b).ravel())
+
+def species(constituentList):
+    '''Number of distinct sum compositions of the combinations lazyProduct yields for constituentList.'''
+    sums = np.zeros(1, dtype=np.int64)
+    for tails, r in constituentList:
+        if not tails: return 0
+        compositions = np.unique(np.array([composition(tail) for tail in tails], dtype=np.int64))
+        for _ in range(r): sums = sumset(sums, compositions) # A multiset of r tails sums as any r tails do
+    return len(sums)
+
+def record_bytes(record):
+    '''Bytes a record adds to the file, for compiled library records as Compiled.CompiledWriter stores them.'''
+    if isinstance(record, str): return len(record)
+    # Precursor table, name and smiles strings and offsets, three index entries, then each peak
+    return 88 + len(record['name']) + len(record['smiles']) + 20*len(record['peaks'])
+
+class Estimate:
+    '''Lipids, spectra, records and bytes of output, by class and in total.'''
+    def __init__(self, noun):
+        self.noun = noun # Records are spectra, precursors, transitions or envelopes
+        self.classes = {} # Class: (lipids, spectra, records, bytes), bytes are None if not sampled
+
+    def add(self, cls, lipids, spectra, records, bytes):
+        self.classes[cls] = (lipids, spectra, records, bytes)
+
+    @property
+    def lipids(self):
+        return sum(values[0] for values in self.classes.values())
+
+    @property
+    def spectra(self):
+        return sum(values[1] for values in self.classes.values())
+
+    @property
+    def records(self):
+        return sum(values[2] for values in self.classes.values())
+
+    @property
+    def bytes(self):
+        if any(values[3] is None for values in self.classes.values()): return None
+        return sum(values[3] for values in self.classes.values())
+
+def sample(generator, recordsMethod, idx, lipids, samples):
+    '''
+    (bytes, count, records, lipids) written by up to samples lipids of class idx of generator.
+    Lipids are random rather than evenly spaced, as the first and last combinations repeat one tail so have fewer peaks.
+    '''
+    bytes = count = records = sampled = 0
+    for rank in sorted(set(np.random.default_rng(idx).integers(0, lipids, samples).tolist())):
+        jobRecords, collapsed = generator.job_records(recordsMethod, idx, rank, rank+1, species=False) # Every lipid, not only the first of a sum composition
+        bytes += sum(record_bytes(record) for key, record, n in jobRecords if record)
+        count += sum(n for key, record, n in jobRecords)
+        records += sum(1 for key, record, n in jobRecords if record)
+        sampled += 1
+    return bytes, count, records, sampled
+
+def chunk_size(generator, recordsMethod, idx, lipids, processes=1, samples=2):
+    '''Tail combinations per job for class idx of a prepared generator, so jobs write about jobBytes, shared between processes.'''
+    if not lipids: return minimumChunk
+    bytes, count, records, sampled = sample(generator, recordsMethod, idx, lipids, samples)
+    size = int(jobBytes*sampled/bytes) if bytes else maximumChunk
+    if processes > 1: size = min(size, -(-lipids//processes))
+    return max(minimumChunk, min(size, maximumChunk))
+
+def species_level(generator, spectra):
+    '''Number of spectra ({adduct:{fragment:intensity}}) written once per sum composition, as Generator.prepare_class finds them.'''
+    return sum(not generator.checklipidAmbiguity({adduct:{k: v for k, v in spectrum.items() if v != 0}}, adduct)
+               for adduct, spectrum in spectra.items())
+
+def estimate(generator, samples=8, filter=None, adducts=None):
+    '''
+    Estimate of the library generator would write, or would write with filter. samples lipids are generated from each class
+    to extrapolate bytes and transitions per spectrum, with none only lipids and spectra are counted.
+    Classes are prepared as for generation, generator's tail lists are generated. adducts, if given, is the selected
+    {adduct:spectrum} of each class, counted without preparing or otherwise changing the classes, so no lipids are sampled.
+    '''
+    recordsMethod, noun, header = generator.formats[filter or generator.filter]
+    result = Estimate(noun)
+    generator.generate_tail_lists()
+    for idx, cls in enumerate(generator.classes_to_generate):
+        if adducts is None:
+            generator.prepare_class(cls)
+            speciesLevel = sum(adduct is not None for adduct in cls.ambiguousSpectra)
+            selected = len(cls.adducts_to_generate)
+        else: speciesLevel, selected = species_level(generator, adducts[cls]), len(adducts[cls])
+        constituentList = generator.generate_constituents(cls)
+        lipids = generator.count_combinations(constituentList)
+        compositions = species(constituentList) if speciesLevel or recordsMethod == 'orb_records' else 0
+        spectra = (selected - speciesLevel)*lipids + speciesLevel*compositions
+
+        if recordsMethod == 'orb_records': records = selected*compositions
+        elif recordsMethod == 'iso_records': records = selected*lipids
+        else: records = spectra # Transitions are counted from samples
+
+        bytes = None
+        if samples and lipids and adducts is None:
+            sampled, count, sampledRecords, _ = sample(generator, recordsMethod, idx, lipids, samples)
+            if recordsMethod == 'sky_records' and sampledRecords: records = round(spectra*count/sampledRecords)
+            bytes = round(records*sampled/count) if count else 0
+        result.add(cls, lipids, spectra, records, bytes)
+    if header and result.bytes is not None and result.classes: # Header row, added to the first class
+        cls = next(iter(result.classes))
+        lipids, spectra, records, bytes = result.classes[cls]
+        result.classes[cls] = (lipids, spectra, records, bytes + len(','.join(header)) + 2)
+    return result
+
+def describe(size):
+    '''Bytes as a short string, e.g. 1.2 GB.'''
+    for unit in ['bytes', 'kB', 'MB', 'GB']:
+        if size < 1000 or unit == 'GB': return f'{size:.0f} {unit}' if unit == 'bytes' else f'{size:.1f} {unit}'
+        size /= 1000
@@ -0,0 +1,1146 @@
+import io
+import sys
+import csv
+import dill
+import time
+import os
+import re
+import fnmatch
+import pickle
+import inspect
+import hashlib
+import heapq
+import multiprocessing
+import Lipids.Classes as Classes
+import Lipids.GenerateLipids as GL
+import Lipids.Isotopes as Isotopes
+import Lipids.Recipes as Recipes
+import Compiled
+import Estimate
+import Profiling
+from math import comb, log, ceil
+from bisect import bisect_left
+from collections import Counter, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+
+chunkSize = None # Tail combinations per job of run_parallel, or None to size the jobs of each class with Estimate.chunk_size
+checkpointInterval = 60 # Seconds between checkpoints of a resumable run
+statusInterval = 0.25 # Seconds between status signals, so the GUI is not flooded
+bufferSize = 1 << 20 # Characters of output held before writing to file, records are ASCII so this is bytes
+parallelSpectra = 100000 # Spectra below which starting worker processes costs more than it saves
+splits = ['class', 'polarity'] # Skyline transition lists can also be written as a file per class or polarity
+
+def lipid_classes():
+    '''Lipid classes available to generate, in the order they are listed.'''
+    # Glycerolipids
+    classes =      [cls for cls in GL.Glycerolipid.__subclasses__() if inspect.getmodule(cls) == Classes]
+    # Sphingolipids
+    classes.extend([cls for cls in GL.Sphingolipid.__subclasses__() if inspect.getmodule(cls) == Classes])
+    # ETC Lipids, Cholesterol ester
+    classes.extend([cls for cls in GL.OtherLipid.__subclasses__()   if inspect.getmodule(cls) == Classes])
+    return classes
+
+def load_templates(classes, templateLocation):
+    '''Applies lipid templates saved from the 'Modify Lipid Templates' window to classes.'''
+    if os.path.exists(templateLocation):
+        for file in os.listdir(templateLocation):
+            if fnmatch.fnmatch(file, '*.pkl'):
+                modifiedLipidTemplate = open(os.path.join(templateLocation, file), 'rb')
+                try:
+                    data = dill.load(modifiedLipidTemplate)
+                    for idx, cls in enumerate(classes):
+                        if cls == data['lipidClass']:
+                            classes[idx].adducts = data['spectra']
+                            combinedAdducts = {**data['adducts'], **GL.adducts}
+                            GL.adducts = combinedAdducts
+                            break
+                except: pass
+                finally: modifiedLipidTemplate.close()
+
+def checkpoint_path(file_name):
+    '''Checkpoint kept beside file_name while it is generated, see Generator.save_checkpoint.'''
+    return f'{file_name}.checkpoint'
+
+def resumable(filter, checkpointInterval, lipidSpecifics):
+    '''Whether checkpoints are kept. Compiled libraries are assembled at the end, so are not resumable.'''
+    return bool(checkpointInterval) and not lipidSpecifics and filter != "LSG Library (*.lsgl)"
+
+def resumes(file_name, filter, checkpointInterval, lipidSpecifics):
+    '''Whether generating file_name continues from its checkpoint, rather than needing a new file.'''
+    return (resumable(filter, checkpointInterval, lipidSpecifics)
+            and os.path.exists(checkpoint_path(file_name)) and os.path.exists(file_name))
+
+def read_tail_list(file_name):
+    '''Reads a tail list exported from Page 2, lines of 'c d type me oh dt'. Unreadable lines are skipped.'''
+    tails = []
+    with open(file_name, 'r') as open_file:
+        lines = [re.split(r'\s{1,}', line.strip()) for line in open_file.readlines()]
+    for line in lines:
+        try:
+            if line[2] in ['Acyl', 'Ether', 'Vinyl']:
+                tails.append(GL.sn(c=int(line[0]), d=int(line[1]),
+                                   type=line[2],   me=int(line[3]),
+                                   oh=int(line[4]),dt=int(line[5])))
+            elif line[2] in GL.baseTypes:
+                tails.append(GL.base(c=int(line[0]),
+                                     type=line[2],
+                                     dt=int(line[5])))
+        except: continue
+    return tails
+
+class Signal:
+    '''
+    Stand-in for a Qt Signal, so the generator can report progress without importing Qt.
+    SaveAs.Generator connects these to its Qt signals, the command line connects them to print.
+    '''
+    def __init__(self):
+        self.slots = []
+    def connect(self, slot):
+        self.slots.append(slot)
+    def emit(self, *args):
+        for slot in self.slots: slot(*args)
+
+class BufferedWriter:
+    '''
+    Collects records and writes them to file once bufferSize characters are held,
+    so records are joined once instead of being concatenated onto a growing string.
+    '''
+    def __init__(self, file, bufferSize=bufferSize):
+        self.file = file
+        self.bufferSize = bufferSize
+        self.buffer = []
+        self.size = 0 # Characters currently held
+        self.written = 0 # Characters written to file
+        self.t0 = time.perf_counter()
+
+    def write(self, record):
+        self.buffer.append(record)
+        self.size += len(record)
+        if self.size >= self.bufferSize: self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.file.write(''.join(self.buffer))
+            self.written += self.size
+            self.buffer = []
+            self.size = 0
+
+    def throughput(self):
+        '''Megabytes written per second since the writer was opened.'''
+        return self.written/1e6/max(time.perf_counter()-self.t0, 1e-9)
+
+class MassIndex:
+    '''
+    Precursor masses already written to an inclusion list.
+    With ppm, a mass within ppm of a written mass also counts as written, so it is merged into that precursor.
+    '''
+    def __init__(self, ppm=0):
+        self.ppm = ppm
+        self.masses = set()
+        self.sorted = [] # Only kept when merging within a ppm window
+
+    def __contains__(self, mass):
+        if mass in self.masses: return True
+        if self.ppm:
+            idx = bisect_left(self.sorted, mass)
+            tolerance = mass*self.ppm/1e6
+            if idx < len(self.sorted) and self.sorted[idx]-mass <= tolerance: return True
+            if idx > 0 and mass-self.sorted[idx-1] <= tolerance: return True
+        return False
+
+    def add(self, mass):
+        if self.ppm and mass not in self.masses: self.sorted.insert(bisect_left(self.sorted, mass), mass)
+        self.masses.add(mass)
+
+    def __len__(self):
+        return len(self.masses)
+
+class BloomFilter:
+    '''
+    Set of (name, adduct) keys in a fixed amount of memory, sized for capacity keys.
+    Membership may be a false positive at errorRate, which would leave out a species-level spectrum,
+    but is never a false negative, so no spectrum is written twice.
+    '''
+    def __init__(self, capacity, errorRate=1e-6):
+        self.size = max(8, ceil(-capacity*log(errorRate)/log(2)**2)) # Bits
+        self.hashes = max(1, round(self.size/capacity*log(2)))
+        self.bits = bytearray((self.size+7)//8)
+        self.count = 0
+
+    def positions(self, key):
+        digest = hashlib.blake2b('\0'.join(key).encode(), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i*h2) % self.size for i in range(self.hashes)]
+
+    def __contains__(self, key):
+        return all(self.bits[bit >> 3] & (1 << (bit & 7)) for bit in self.positions(key))
+
+    def add(self, key):
+        for bit in self.positions(key): self.bits[bit >> 3] |= 1 << (bit & 7)
+        self.count += 1
+
+    def __len__(self):
+        return self.count
+
+class Generator:
+    '''
+    Generates lipids and writes them to file_name in the format given by filter.
+    Has no dependency on Qt, see SaveAs.Generator for use on a QThread.
+    '''
+    def __init__(self, file_name, filter, classes_to_generate, tails_to_generate, bases_to_generate, 
+                 isomerism, lipidSpecifics, lipidList, tailSpecifics, tailList, specificOrganisation,
+                 processes=1, bufferSize=bufferSize, ppm=0, bloomCapacity=0, isotopePeaks=4, cacheFolder=None,
+                 checkpointInterval=None, profile=None, recipes=True, split=None):
+
+        self.finished = Signal()
+        self.progress = Signal()
+        self.fileError = Signal()
+        self.status = Signal() # (combinations done, total, records written, records/s, seconds remaining or None)
+
+        self.file_name = file_name
+        self.filter = filter
+
+        self.classes_to_generate = classes_to_generate
+        self.tails_to_generate = tails_to_generate
+        self.bases_to_generate = bases_to_generate
+
+        self.isomerism = isomerism
+        self.lipidSpecifics = lipidSpecifics
+        self.lipidList = lipidList
+        self.specificAdducts = {} # id(lipid): (adducts_to_generate, ambiguousSpectra) of lipidList, see lipid_adducts
+        self.tailSpecifics = tailSpecifics
+        self.tailList = tailList
+        self.specificOrganisation = specificOrganisation
+        self.processes = processes
+        self.bufferSize = bufferSize
+        self.ppm = ppm # Orbitrap inclusion precursors within ppm of each other are merged
+        self.bloomCapacity = bloomCapacity # Expected species-level spectra, if ambiguous lipids are tracked in a Bloom filter
+        self.isotopePeaks = isotopePeaks # Peaks of each precursor isotope envelope, M to M+isotopePeaks-1
+        self.cacheFolder = cacheFolder # If given, records of each class are kept here and reused while the class is unchanged
+        self.checkpointInterval = checkpointInterval # Seconds between checkpoints, from which a stopped run can be resumed
+        self.profileCapture = profile # None, or a Profiling.captures entry to time the stages of run()
+        self.recipes = Recipes.RecipeBook() if recipes else None # Spectra from compiled recipes, rather than Fragment classes
+        self.split = split # None, or a splits entry to also write Skyline transitions into a file per class or polarity
+        self.splitFiles = [] # Written by split_output
+
+        self.count = 0
+        self.unique_mass = MassIndex(ppm)
+        self.ambiguousLipids = self.ambiguityRegistry()
+        self.collapsed = 0 # Spectra collapsed into an already written species-level spectrum
+        self.megabytes = 0 # Written by BufferedWriter, with throughput in MB/s
+        self.throughput = 0
+        self.reused = 0 # Classes read from cacheFolder rather than generated
+        self.cancelled = False # Set by cancel(), from any thread
+        self.profiler, self.profile = None, None # Profiling.Profiler while running, then its summary
+        self.finished.connect(self.save_profile) # First, so the summary is ready for other slots
+        self.start_status([])
+
+    def run(self):
+        GL.fragmentCache.clear() # Adducts may have been modified since the last run
+        try:
+            #import pydevd;pydevd.settrace(suspend=False)
+            resume = resumes(self.file_name, self.filter, self.checkpointInterval, self.lipidSpecifics)
+            if self.profileCapture: self.profiler = Profiling.Profiler(self.profileCapture)
+            with open(self.file_name, 'r+' if resume else 'x', newline='') as self.save_file:
+                if self.profiler:
+                    self.profiler.install(self)
+                    self.save_file = self.profiler.file(self.save_file)
+                if self.filter not in self.formats:
+                    self.fileError.emit()
+                elif (self.processes > 1 or self.cacheFolder or self.resumable()) and not self.lipidSpecifics:
+                    self.run_parallel()
+                else:
+                    if self.lipidSpecifics: self.lipid_data = self.generate_specific()
+                    else: self.lipid_data = self.generate_range()
+                    if self.filter == "MSP (*.msp)": self.as_msp()
+                    elif self.filter == "Orbitrap Inclusion (*.csv)": self.as_orb()
+                    elif self.filter == "Skyline Transition (*.csv)": self.as_sky()
+                    elif self.filter == "Isotope Envelope (*.csv)": self.as_iso()
+                    elif self.filter == "LSG Library (*.lsgl)": self.as_lsgl()
+        except: 
+            (type, value, traceback) = sys.exc_info()
+            sys.excepthook(type, value, traceback)
+            self.fileError.emit()
+        finally:
+            self.save_profile() # If not finished, so replaced functions are restored
+            if self.recipes: self.recipes.save()
+
+    def save_profile(self):
+        '''Removes the profiler, writing its summary beside the output file.'''
+        if self.profiler is None: return
+        profiler, self.profiler = self.profiler, None
+        profiler.remove()
+        self.profile = profiler.save(self.file_name)
+
+    formats = { # filter: (records method, noun, csv header)
+        "MSP (*.msp)": ('msp_records', 'spectra', None),
+        "Orbitrap Inclusion (*.csv)": ('orb_records', 'precursors',
+            ['Mass [m/z]','Formula [M]','Formula type',
+             'Species','CS [z]','Polarity','Start [min]',
+             'End [min]','(N)CE','(N)CE type','MSX ID','Comment']),
+        "Skyline Transition (*.csv)": ('sky_records', 'transitions',
+            ['Molecule List Name', 'Precursor Name', 'Precursor Formula',
+             'Precursor Adduct', 'Precursor m/z', 'Precursor Charge', 'Product Formula',
+             'Product m/z', 'Product Charge', 'Explicit Retention Time', 'Explicit Collision Energy']),
+        "Isotope Envelope (*.csv)": ('iso_records', 'envelopes', # Followed by m/z and abundance of each isotope peak
+            ['Class', 'Name', 'Precursor Formula', 'Precursor Adduct', 'Precursor m/z', 'Precursor Charge']),
+        "LSG Library (*.lsgl)": ('lsgl_records', 'spectra', None)}
+
+    def csv_header(self):
+        header = self.formats[self.filter][2]
+        if self.filter == "Isotope Envelope (*.csv)":
+            header = header + [f'M+{k} {column}' for k in range(self.isotopePeaks) for column in ['m/z', 'Abn. (%)']]
+        return header
+
+    def run_parallel(self):
+        '''
+        Generates the library with a pool of worker processes.
+        Each class is split into jobs of tail combinations, workers enumerate, resolve spectra
+        and format their job. Jobs are written in submission order, so the file matches a single process run.
+        With a cacheFolder, job results are also kept per class, and classes with an unchanged
+        cache_key are read back instead of generated. Without a pool (one process) jobs run in this process.
+        If resumable, a checkpoint of the written output is kept, and a run stopped before completion
+        continues from its last checkpoint when run again with the same settings.
+        '''
+        recordsMethod, self.noun, header = self.formats[self.filter]
+        self.generate_tail_lists()
+        for cls in self.classes_to_generate: self.prepare_class(cls)
+        totals = [self.count_combinations(self.generate_constituents(cls)) for cls in self.classes_to_generate]
+        if self.cacheFolder or self.resumable():
+            settings = self.cache_settings()
+            keys = [self.cache_key(cls, settings) for cls in self.classes_to_generate]
+
+        # Species-level spectra and precursor masses may be repeated between jobs
+        writtenKeys = MassIndex(self.ppm) if recordsMethod == 'orb_records' else self.ambiguityRegistry()
+        self.position, checkpoint = (0, 0), None # (class, combination offset) of the next job to write
+        if self.resumable():
+            self.checkpointKey = hashlib.blake2b(repr((keys, self.ppm, self.bloomCapacity)).encode(), digest_size=16).hexdigest()
+            checkpoint = self.load_checkpoint()
+            if checkpoint: # Continue after the last checkpointed job, dropping anything written since
+                self.position, writtenKeys = checkpoint['position'], checkpoint['writtenKeys']
+                self.count, self.collapsed = checkpoint['count'], checkpoint['collapsed']
+            self.save_file.seek(checkpoint['offset'] if checkpoint else 0)
+            self.save_file.truncate()
+            self.lastCheckpoint = time.perf_counter()
+        if header and not checkpoint: csv.writer(self.save_file).writerow(self.csv_header())
+        writer = self.writer()
+        position = self.position
+        self.start_status(totals, sum(totals[:position[0]]) + position[1])
+
+        jobs, self.cachePaths, self.cacheFiles = [], {}, {}
+        if self.cacheFolder: os.makedirs(self.cacheFolder, exist_ok=True)
+        for idx, cls in enumerate(self.classes_to_generate):
+            if idx < position[0]: # Written before the checkpoint
+                self.progress.emit(cls)
+                continue
+            first = position[1] if idx == position[0] else 0
+            if self.cacheFolder:
+                self.cachePaths[idx] = os.path.join(self.cacheFolder, f'{keys[idx]}.records')
+                if first == 0 and os.path.exists(self.cachePaths[idx]):
+                    jobs.append((idx, None, None, True)) # Read back from the cache
+                    self.reused += 1
+                    continue
+            total = totals[idx]
+            size = chunkSize or Estimate.chunk_size(self, recordsMethod, idx, total, self.processes)
+            jobs.extend((idx, start, min(start+size, total), start+size >= total) for start in range(first, total, size))
+            if first >= total: jobs.append((idx, first, first, True)) # Class still reports completion
+
+        payload = dill.dumps({'adducts':GL.adducts,
+                              'classes':[(cls, cls.adducts, cls.adducts_to_generate, cls.ambiguousSpectra) for cls in self.classes_to_generate],
+                              'arguments':(self.filter, self.tails_to_generate, self.bases_to_generate, self.isomerism,
+                                           self.tailSpecifics, self.tailList, self.specificOrganisation, self.isotopePeaks),
+                              'profile':self.profiler is not None,
+                              'recipes':self.recipes is not None})
+
+        pool = None
+        if self.processes > 1 and any(start is not None for _, start, _, _ in jobs):
+            pool = ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context('spawn'),
+                                       initializer=initialise_worker, initargs=(payload,))
+        try:
+            pending = deque()
+            for job in jobs: # Keep a bounded number of jobs in flight so output is not held in memory
+                if self.cancelled: break
+                pending.append((job, self.submit(pool, recordsMethod, job)))
+                if len(pending) >= 2*self.processes:
+                    self.write_job(*pending.popleft(), writtenKeys, writer)
+            while pending and not self.cancelled:
+                self.write_job(*pending.popleft(), writtenKeys, writer)
+        finally: # Once cancelled, jobs not yet started are dropped, and those running are waited for
+            if pool: pool.shutdown(wait=True, cancel_futures=True) # So no worker outlives finished
+            for file, temporary in self.cacheFiles.values(): # Classes left incomplete by an error
+                file.close()
+                os.remove(temporary)
+
+        self.close_writer(writer)
+        if self.resumable() and self.cancelled: self.save_checkpoint(self.position, writtenKeys, writer)
+        elif self.resumable(): # Complete, so nothing to resume
+            try: os.remove(checkpoint_path(self.file_name))
+            except FileNotFoundError: pass
+        self.report_status(force=True)
+        self.split_output()
+        self.finished.emit()
+
+    def submit(self, pool, recordsMethod, job):
+        '''Future of a job's (records, collapsed), or None for a class read from the cache.'''
+        idx, start, stop, lastJob = job
+        if start is None: return None
+        if pool: return pool.submit(generate_job, recordsMethod, idx, start, stop)
+        future = Future()
+        future.set_result(self.job_records(recordsMethod, idx, start, stop))
+        return future
+
+    def job_records(self, recordsMethod, idx, start, stop, species=True):
+        '''
+        Records of one job, with duplicates skipped only within the job, and the number collapsed.
+        If species, classes with only species-level spectra are enumerated by sum composition, see generate_species.
+        '''
+        ambiguousLipids, unique_mass, collapsed = self.ambiguousLipids, self.unique_mass, self.collapsed
+        self.ambiguousLipids = set() # Only skip duplicates within this job, write_job merges across jobs
+        self.unique_mass = MassIndex() # Exact duplicates only, merging within ppm depends on earlier jobs so is left to write_job
+        cls = self.classes_to_generate[idx]
+        records = getattr(self, recordsMethod)
+        records = [record for lipid in self.generate_class(cls, start, stop, species and self.species_level(cls, recordsMethod))
+                   for record in records(lipid)]
+        jobCollapsed = self.collapsed - collapsed
+        self.ambiguousLipids, self.unique_mass, self.collapsed = ambiguousLipids, unique_mass, collapsed
+        return records, jobCollapsed
+
+    def write_job(self, job, future, writtenKeys, writer):
+        idx, start, stop, lastJob = job
+        if future is None: results = self.read_cache(idx)
+        else:
+            results = [future.result()]
+            if len(results[0]) == 3: # Times of a profiled worker
+                self.profiler.merge(results[0][2])
+                results = [results[0][:2]]
+            if self.cacheFolder: self.cache_job(idx, results[0], start, lastJob)
+        for records, collapsed in results:
+            self.collapsed += collapsed
+            for key, record, count in records:
+                if key is not None:
+                    if key in writtenKeys:
+                        if isinstance(key, tuple): self.collapsed += 1 # (name, adduct), rather than a precursor mass
+                        continue
+                    writtenKeys.add(key)
+                if record: writer.write(record)
+                self.count += count
+        self.position = (idx+1, 0) if lastJob else (idx, stop)
+        self.done = self.offsets[idx] + (self.totals[idx] if lastJob else stop)
+        if lastJob: self.progress.emit(self.classes_to_generate[idx])
+        if self.resumable() and time.perf_counter() - self.lastCheckpoint >= self.checkpointInterval:
+            self.save_checkpoint(self.position, writtenKeys, writer)
+        self.report_status()
+
+    # ~ # ~ # ~ # Status and cancelling
+
+    def cancel(self):
+        '''Stops generation after the job or lipid being written, leaving a complete file of what was written.'''
+        self.cancelled = True
+
+    def start_status(self, totals, done=0):
+        '''Starts timing for report_status, totals being the combinations of each class.'''
+        self.totals = totals
+        self.offsets = [sum(totals[:idx]) for idx in range(len(totals))]
+        self.total = sum(totals)
+        self.done = self.startDone = done
+        self.startCount = self.count
+        self.t0 = self.lastStatus = time.perf_counter()
+
+    def report_status(self, force=False):
+        '''Emits status, at most once every statusInterval seconds unless forced.'''
+        now = time.perf_counter()
+        if now - self.lastStatus < statusInterval and not force: return
+        self.lastStatus = now
+        elapsed, done = now - self.t0, self.done - self.startDone
+        rate = (self.count - self.startCount)/elapsed if elapsed else 0
+        remaining = elapsed*(self.total - self.done)/done if done else None
+        self.status.emit(self.done, self.total, self.count, rate, remaining)
+
+    # ~ # ~ # ~ # Checkpoints
+
+    def resumable(self):
+        '''Whether checkpoints are kept, see resumable.'''
+        return resumable(self.filter, self.checkpointInterval, self.lipidSpecifics)
+
+    def save_checkpoint(self, position, writtenKeys, writer):
+        '''
+        Syncs the output to disk, then records the position (class, combination offset) of the next job,
+        the length of the output, and what has been written, for load_checkpoint.
+        '''
+        writer.flush()
+        self.save_file.flush()
+        os.fsync(self.save_file.fileno())
+        state = {'key':self.checkpointKey, 'position':position, 'offset':self.save_file.tell(),
+                 'count':self.count, 'collapsed':self.collapsed, 'writtenKeys':writtenKeys}
+        temporary = f'{checkpoint_path(self.file_name)}.tmp'
+        with open(temporary, 'wb') as file:
+            pickle.dump(state, file, pickle.HIGHEST_PROTOCOL)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, checkpoint_path(self.file_name))
+        self.lastCheckpoint = time.perf_counter()
+
+    def load_checkpoint(self):
+        '''The checkpoint of an earlier run of the same settings to this file, or None.'''
+        try:
+            with open(checkpoint_path(self.file_name), 'rb') as file: state = pickle.load(file)
+        except (OSError, EOFError, pickle.UnpicklingError): return None
+        if state.get('key') != self.checkpointKey: return None
+        if os.fstat(self.save_file.fileno()).st_size < state['offset']: return None # Output was changed since
+        return state
+
+    # ~ # ~ # ~ # Class cache
+
+    def cache_settings(self):
+        '''Everything besides a class's own spectra that its records depend on, see cache_key.'''
+        tails = [(tail.type, tail.c, tail.d, tail.me, tail.oh, tail.dt) for tail in self.tailList] if self.tailSpecifics else []
+        bases = [self.bases_to_generate[0], self.bases_to_generate[1], sorted(self.bases_to_generate[2])]
+        return (self.filter, self.isotopePeaks, list(self.tails_to_generate), bases, self.isomerism, self.tailSpecifics, tails,
+                self.specificOrganisation, sorted(GL.adducts.items()), source_fingerprint())
+
+    def cache_key(self, cls, settings):
+        '''
+        Fingerprint of a class's records: its adducts with their fragments and intensities,
+        together with the tails, the adduct table, the output format and the generating code.
+        '''
+        spectra = [(adduct, [(getattr(fragment, '__qualname__', repr(fragment)), intensity) for fragment, intensity in cls.adducts[adduct].items()])
+                   for adduct in cls.adducts_to_generate]
+        return hashlib.blake2b(repr((settings, cls.__module__, cls.__qualname__, spectra)).encode(), digest_size=16).hexdigest()
+
+    def cache_job(self, idx, result, start, lastJob):
+        '''Appends a job's result to its class's cache file, which is only moved into place once the class is complete.'''
+        if idx not in self.cacheFiles:
+            if start != 0: return # Class resumed part way, so not cached by this run
+            temporary = f'{self.cachePaths[idx]}.{os.getpid()}.tmp'
+            self.cacheFiles[idx] = (open(temporary, 'wb'), temporary)
+        file, temporary = self.cacheFiles[idx]
+        pickle.dump(result, file, pickle.HIGHEST_PROTOCOL)
+        if lastJob:
+            file.close()
+            os.replace(temporary, self.cachePaths[idx])
+            del self.cacheFiles[idx]
+
+    def read_cache(self, idx):
+        '''Yields the (records, collapsed) job results cached for a class.'''
+        with open(self.cachePaths[idx], 'rb') as file:
+            while True:
+                try: yield pickle.load(file)
+                except EOFError: return
+
+    # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ #
+
+    def addTailNames(self, lipid):
+        c =  sum(snx.c  for snx in lipid.tails if snx.type != 'Headgroup')
+        d =  sum(snx.d  for snx in lipid.tails if snx.type != 'Headgroup')
+        me = sum(snx.me for snx in lipid.tails if snx.type != 'Headgroup')
+        oh = sum(snx.oh for snx in lipid.tails if snx.type != 'Headgroup')
+        dt = sum(snx.dt for snx in lipid.tails if snx.type != 'Headgroup')
+
+        if 'Ether' in [snx.type for snx in lipid.tails if snx.type != 'Headgroup']:
+            name = f"O-{c}:{d}"
+        elif 'Vinyl' in [snx.type for snx in lipid.tails if snx.type != 'Headgroup']:
+            name = f"P-{c}:{d}"
+        else: name = f"{c}:{d}"
+        
+        if me > 0: # Methyl branching of fatty acid
+            name += f";{me}-M" 
+        if oh > 0: # Hydroxy functionalisation of fatty acid
+            name += f";O{oh}"
+        if dt > 0: # deuterium labelled fatty acids
+            name += f"(D{dt})" # Deuterium doesn't update smiles currently.
+
+        return name
+
+    def checklipidAmbiguity(self, adducts, adduct):
+        try:
+            if not next((k.__name__ for k in adducts[adduct].keys() if 'FA' in k.__name__ or 'Cer' in k.__name__), False):
+                return False
+            else: return True
+        except: return True
+
+    def ambiguityRegistry(self):
+        '''Species-level (name, adduct) keys already written. Exact, unless a Bloom filter capacity is given.'''
+        return BloomFilter(self.bloomCapacity) if self.bloomCapacity else set()
+
+    def redifineAmbiguousLipid(self, lipid, adduct):
+        lipid.ambiguousName = f"{lipid.lipid_class} {self.addTailNames(lipid)}" 
+        if (lipid.ambiguousName, adduct) in self.ambiguousLipids:
+            self.collapsed += 1
+            return False
+        else: self.ambiguousLipids.add((lipid.ambiguousName, adduct))
+        lipid.ambiguoussmiles = ' '
+        return True
+
+    def generate_tail_lists(self):
+
+        self.representatives = {} # Class: first combination of each sum composition, see species_representatives
+        self.acyls = []
+        self.ethers = []
+        self.vinyls = []
+        self.bases = {}
+        self.defaultBases = GL.generate_base_tails(self.bases_to_generate)
+
+        if self.tailSpecifics:
+
+            for tail in self.tailList:
+                if tail.type == 'Acyl':
+                    self.acyls.append(tail)
+                elif tail.type == 'Ether':
+                    self.ethers.append(tail)
+                elif tail.type == 'Vinyl':
+                    self.vinyls.append(tail)
+                elif tail.type in GL.baseTypes:
+                    if tail.type not in self.bases.keys(): self.bases[tail.type] = []
+                    self.bases[tail.type].append(tail)
+            if len(self.bases) < 1: self.bases = self.defaultBases
+
+        else:
+
+            self.acyls = GL.generate_tails(self.tails_to_generate, 'Acyl')
+            self.ethers = GL.generate_tails(self.tails_to_generate, 'Ether')
+            self.vinyls = GL.generate_tails(self.tails_to_generate, 'Vinyl')
+            self.bases = self.defaultBases
+
+    def generate_constituents(self, cls):
+
+        if self.specificOrganisation == True:
+            try:constituents = cls.specificTailOrganisation
+            except: constituents = cls.tailOrganisation
+        else: constituents = cls.tailOrganisation # List of tails and organisation: ['B', 'AA', 'A'], indicates a sphingoid Base,
+        constituentList = [] # a combination of two tails, and another tail independent of the previous combination is needed.
+
+        for x in constituents: # ie, for 'B', 'AA', 'A' in ['B', 'AA', 'A']
+            group = dict(Counter(x)) # ie, {'B':1}, {'A':2}, {'A':1}
+            for key in group: # Each constituent is kept as (tail list, r) so its combinations can be recreated lazily
+                if key == 'B': # In the case of 'B', it indicates a base is needed. Get base list!
+                    constituentList.append((list(self.flatten([self.bases[basetype] if basetype in self.bases.keys() else self.defaultBases[basetype] for basetype in cls.base_types ])), 1))
+                elif key == 'A': # In the case of 'A', it indicates an acyl tail is needed. generate tail combination!
+                    constituentList.append((self.acyls, group[key]))
+                elif key == 'O': # In the case of 'O', it indicates an ether tail is needed. generate tail combination!
+                    constituentList.append((self.ethers, group[key]))
+                elif key == 'P': # In the case of 'P', it indicates a vinyl tail is needed. generate tail combination!
+                    constituentList.append((self.vinyls, group[key]))
+                else: pass
+        return constituentList
+
+    def prepare_class(self, cls):
+        cls.ambiguousSpectra = []             
+        for adduct in cls.adducts_to_generate: # Remove all ions in spectra with an intensity of 0
+            cls.adducts[adduct] = {k: v for k, v in cls.adducts[adduct].items() if v != 0}
+            cls.ambiguousSpectra.append(adduct if not self.checklipidAmbiguity(cls.adducts, adduct) else None)
+
+    def generate_class(self, cls, start=0, stop=None, species=False):
+        if species:
+            yield from self.generate_species(cls, start, stop)
+            return
+        for combination in self.lazyProduct(self.generate_constituents(cls), start, stop):
+            combination = self.flatten(combination)
+            try: lipid = cls(*combination)
+            except: continue
+            yield lipid # Outside of try, so closing the generator early is not swallowed
+
+    speciesRecords = ['msp_records', 'lsgl_records', 'sky_records', 'search_records'] # Write each species-level spectrum once
+
+    def species_level(self, cls, recordsMethod):
+        '''Whether every spectrum recordsMethod writes for a prepared class is species-level, so written once per sum composition.'''
+        return recordsMethod in self.speciesRecords and bool(cls.ambiguousSpectra) and None not in cls.ambiguousSpectra
+
+    def generate_species(self, cls, start=0, stop=None):
+        '''
+        Yields, in the order generate_class would, the first lipid of each sum composition whose combination is
+        between start and stop. Later lipids of a sum composition are not built, but counted as collapsed for each adduct.
+        '''
+        constituentList = self.generate_constituents(cls)
+        total = self.count_combinations(constituentList)
+        stop = total if stop is None else min(stop, total)
+        if start >= stop: return
+        ranks, combinations = self.species_representatives(cls, constituentList)
+        first, last = bisect_left(ranks, start), bisect_left(ranks, stop)
+        for combination in combinations[first:last]:
+            yield cls(*combination)
+        self.collapsed += len(cls.adducts_to_generate)*(stop - start - (last - first))
+
+    def species_representatives(self, cls, constituentList):
+        '''
+        (ranks, combinations) of the first lipid of each sum composition of cls, in the order lazyProduct yields them.
+        The sums reachable from each tail position onwards are found first, so the first combination of a sum is found
+        directly, choosing at each position the first tail from which the rest of the sum can still be reached.
+        '''
+        if cls in self.representatives: return self.representatives[cls]
+
+        positions = [(k, [Estimate.composition(tail) for tail in tails]) for k, (tails, r) in enumerate(constituentList) for _ in range(r)]
+        after = [None]*len(positions) # Per position and tail index, sums reachable by the later positions
+        reachable = [{0}] # Sums reachable from the next position onwards, with any tail index
+        for p in reversed(range(len(positions))):
+            k, keys = positions[p]
+            sameConstituent = p+1 < len(positions) and positions[p+1][0] == k # Tail indices do not decrease within a constituent
+            after[p] = [within[i] if sameConstituent else reachable[0] for i in range(len(keys))]
+            within = [set() for _ in range(len(keys)+1)] # Sums reachable from this position on, with a tail index of at least i
+            for i in reversed(range(len(keys))):
+                within[i] = within[i+1] | {keys[i] + s for s in after[p][i]}
+            reachable = within
+
+        def candidates(p, low, remaining, chosen):
+            '''Tail indices summing to remaining from position p on, in the order lazyProduct yields them.'''
+            if p == len(positions):
+                yield list(chosen)
+                return
+            k, keys = positions[p]
+            nextLow = lambda i: i if p+1 < len(positions) and positions[p+1][0] == k else 0
+            for i in range(low, len(keys)):
+                if remaining - keys[i] in after[p][i]:
+                    chosen.append(i)
+                    yield from candidates(p+1, nextLow(i), remaining - keys[i], chosen)
+                    chosen.pop()
+
+        sizes = [self.count_combinations([constituent]) for constituent in constituentList]
+        def combination(indices):
+            '''(rank, flattened tails) of the combination of tail indices.'''
+            rank, tails, offset = 0, [], 0
+            for (constituentTails, r), size in zip(constituentList, sizes):
+                idx = indices[offset:offset+r]
+                rank = rank*size + self.rank(len(constituentTails), r, idx)
+                tails.extend(constituentTails[i] for i in idx)
+                offset += r
+            return rank, tails
+
+        heap = [] # Next candidate of each sum composition, ranks are unique so tails are never compared
+        for target in (reachable[0] if positions else ()):
+            iterator = candidates(0, 0, target, [])
+            heap.append((*combination(next(iterator)), iterator))
+        heapq.heapify(heap)
+        ranks, combinations = [], []
+        while heap: # The first candidate of each sum composition to build a lipid is kept
+            rank, tails, iterator = heapq.heappop(heap)
+            try: cls(*tails)
+            except:
+                following = next(iterator, None)
+                if following is not None: heapq.heappush(heap, (*combination(following), iterator))
+                continue
+            ranks.append(rank)
+            combinations.append(tails)
+        self.representatives[cls] = (ranks, combinations)
+        return ranks, combinations
+
+    def generate_range(self):
+
+        self.generate_tail_lists()
+        self.start_status([self.count_combinations(self.generate_constituents(cls)) for cls in self.classes_to_generate])
+        recordsMethod = self.formats[self.filter][0] if self.filter in self.formats else None
+
+        for idx, cls in enumerate(self.classes_to_generate):    
+            self.prepare_class(cls)
+            for lipid in self.generate_class(cls, species=self.species_level(cls, recordsMethod)):
+                if self.cancelled: break
+                yield lipid
+                self.done += 1 # Lipids rather than combinations, corrected at the end of the class
+                if not self.done & 255: self.report_status()
+            if self.cancelled: break
+            self.done = self.offsets[idx] + self.totals[idx]
+            self.progress.emit(cls)
+            self.report_status()
+        self.report_status(force=True)
+
+    def count_combinations(self, constituentList):
+        '''Number of combinations lazyProduct yields for constituentList, without enumerating them.'''
+        total = 1
+        for tails, r in constituentList:
+            total *= comb(len(tails)+r-1, r) if tails else 0
+        return total
+
+    def unrank(self, n, r, rank):
+        '''
+        Indices of the rank-th combination of cwr(range(n), r), in the order cwr yields them.
+        Used to start enumeration part way through a class without stepping through every earlier combination.
+        '''
+        indices = []
+        low = 0
+        for position in range(r):
+            remaining = r-position-1
+            for i in range(low, n): # Combinations starting with i choose the remaining tails from i -> n-1
+                size = comb(n-i+remaining-1, remaining)
+                if rank < size: break
+                rank -= size
+            indices.append(i)
+            low = i
+        return indices
+
+    def rank(self, n, r, indices):
+        '''Position of indices among the combinations of cwr(range(n), r), the inverse of unrank.'''
+        rank, low = 0, 0
+        for position, i in enumerate(indices):
+            remaining = r-position-1
+            rank += sum(comb(n-j+remaining-1, remaining) for j in range(low, i))
+            low = i
+        return rank
+
+    def lazyProduct(self, constituentList, start=0, stop=None):
+        '''
+        Yields the same combinations, in the same order, as product(*[cwr(tails, r) for tails, r in constituentList])[start:stop].
+        product() materialises every iterator it is given, whereas here the combination at start is calculated directly
+        and each following one is stepped to from the last. Memory use is therefore independent of library size,
+        and a class can be split into jobs by combination offset.
+        '''
+        sizes = [self.count_combinations([constituent]) for constituent in constituentList]
+        total = self.count_combinations(constituentList)
+        stop = total if stop is None else min(stop, total)
+        if start >= stop: return
+
+        ranks, quotient = [], start # Mixed-radix split of start, last constituent varies fastest as in product()
+        for size in reversed(sizes):
+            ranks.append(quotient % size)
+            quotient //= size
+        indices = [self.unrank(len(tails), r, rank) for (tails, r), rank in zip(constituentList, reversed(ranks))]
+
+        for _ in range(stop-start):
+            yield tuple(tuple(tails[i] for i in idx) for (tails, r), idx in zip(constituentList, indices))
+            for position in reversed(range(len(indices))): # Step to the next combination, as an odometer
+                idx, n = indices[position], len(constituentList[position][0])
+                j = len(idx)-1
+                while j >= 0 and idx[j] == n-1: j -= 1
+                if j >= 0:
+                    idx[j:] = [idx[j]+1]*(len(idx)-j)
+                    break
+                indices[position] = [0]*len(idx) # Constituent wrapped around, carry to the previous one
+
+    def flatten(self, data):
+        if isinstance(data, tuple) or isinstance(data, list):
+            for x in data: yield from self.flatten(x)
+        else: yield data
+
+    def generate_specific(self):
+        lipidList = self.lipidList
+        for lipid, selected_adduct in lipidList: # Kept beside the lipid, as lipids only carry their declared slots
+            adducts = lipid.adductSpectra()
+            adducts_to_generate = {selected_adduct:{k: v for k, v in adducts[selected_adduct].items() if v != 0}} # Remove all ions in spectra with an intensity of 0
+            ambiguousSpectra = [selected_adduct if not self.checklipidAmbiguity(adducts, selected_adduct) else None]
+            self.specificAdducts[id(lipid)] = (adducts_to_generate, ambiguousSpectra)
+        return [x[0] for x in lipidList]
+
+    def lipid_adducts(self, lipid):
+        '''(adducts_to_generate, ambiguousSpectra) of a lipid, its selected adduct if from lipidList, else those of its class.'''
+        return self.specificAdducts.get(id(lipid)) or (lipid.adducts_to_generate, lipid.ambiguousSpectra)
+
+    # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ #
+
+    # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ #
+
+    def as_msp(self):
+        '''
+        Defines how to export data when saved as .MSP.
+        Contains lipid fragmentation informaiton.
+        '''
+        
+        self.noun = 'spectra' # Noun is used in Page 3 console when generation is completed
+        writer = BufferedWriter(self.save_file, self.bufferSize)
+        for lipid in self.lipid_data:
+            for key, record, count in self.msp_records(lipid):
+                writer.write(record)
+                self.count += count
+            del lipid
+        self.close_writer(writer)
+        self.finished.emit()
+
+    def writer(self):
+        '''BufferedWriter for the output file, or a Compiled.CompiledWriter for compiled libraries.'''
+        if self.filter == "LSG Library (*.lsgl)": return Compiled.CompiledWriter(self.save_file.buffer, self.bufferSize)
+        return BufferedWriter(self.save_file, self.bufferSize)
+
+    def close_writer(self, writer):
+        writer.flush()
+        self.megabytes = writer.written/1e6
+        self.throughput = writer.throughput()
+
+    def spectra_to_generate(self, lipid):
+        '''
+        Yields (adduct, key) for each adduct of the lipid with a spectrum to generate, naming the lipid for it.
+        key is (name, adduct) for species-level spectra, which may only be written once, else None.
+        '''
+        if self.specificOrganisation == True: 
+            try: lipid.name = lipid.specificname
+            except:pass
+
+        adducts_to_generate, ambiguousSpectra = self.lipid_adducts(lipid)
+        for adduct in adducts_to_generate:
+
+            lipid.ambiguousName = False
+            lipid.ambiguoussmiles = False
+            if adduct in ambiguousSpectra:
+                generate = self.redifineAmbiguousLipid(lipid, adduct)
+                ambiguousKey = (lipid.ambiguousName, adduct)
+            else: generate, ambiguousKey = True, None
+
+            if generate: yield adduct, ambiguousKey
+
+    def resolve_spectra(self, lipid, adduct):
+        '''Sets lipid.spectra[adduct], from compiled recipes where they reproduce the Fragment classes.'''
+        if self.recipes and lipid.editedAdducts is None: self.recipes.resolve_spectra(lipid, adduct)
+        else: lipid.resolve_spectra(adduct, lipid.adductSpectra()[adduct]) # Recipes are of a class's own adducts
+
+    def msp_records(self, lipid):
+        '''
+        Yields (key, record, count) for each adduct of the lipid, as .MSP text.
+        key is (name, adduct) for species-level spectra, which may only be written once, else None.
+        '''
+        for adduct, ambiguousKey in self.spectra_to_generate(lipid):
+            try:
+                self.resolve_spectra(lipid, adduct)
+                spectrum = lipid.spectra[adduct]
+                yield ambiguousKey, Compiled.msp_text(f"{lipid.ambiguousName if lipid.ambiguousName else lipid.name} {adduct}", GL.adducts[adduct][1],
+                                                      lipid.mass, GL.MA(lipid, adduct, 0).mass, lipid.lipid_class, lipid.formula,
+                                                      lipid.ambiguoussmiles if lipid.ambiguoussmiles else lipid.smiles, adduct,
+                                                      [(peak.mass, peak.intensity, peak.Comment()) for peak in spectrum]), 1
+            except: yield ambiguousKey, '', 0
+
+    def search_records(self, lipid):
+        '''
+        Yields (key, record, count) for each adduct of the lipid, as in msp_records, for Search.SpectralLibrary.
+        record is (name, adduct, class, precursor m/z, fragment m/z, fragment intensities).
+        '''
+        for adduct, ambiguousKey in self.spectra_to_generate(lipid):
+            try:
+                self.resolve_spectra(lipid, adduct)
+                spectrum = lipid.spectra[adduct]
+                yield ambiguousKey, (f"{lipid.ambiguousName if lipid.ambiguousName else lipid.name} {adduct}", adduct, lipid.lipid_class,
+                                     GL.MA(lipid, adduct, 0).mass, [peak.mass for peak in spectrum], [peak.intensity for peak in spectrum]), 1
+            except: yield ambiguousKey, None, 0
+
+    def as_lsgl(self):
+        '''
+        Defines how to export data when saved as .LSGL, see Compiled.
+        Contains the same spectra as .MSP, as memory mapped columns.
+        '''
+        self.noun = 'spectra'
+        writer = self.writer()
+        for lipid in self.lipid_data:
+            for key, record, count in self.lsgl_records(lipid):
+                if record: writer.write(record)
+                self.count += count
+            del lipid
+        self.close_writer(writer)
+        self.finished.emit()
+
+    def lsgl_records(self, lipid):
+        '''
+        Yields (key, record, count) for each adduct of the lipid, as in msp_records, for Compiled.CompiledWriter.
+        '''
+        for adduct, ambiguousKey in self.spectra_to_generate(lipid):
+            try:
+                self.resolve_spectra(lipid, adduct)
+                spectrum = lipid.spectra[adduct]
+                yield ambiguousKey, {'name':f"{lipid.ambiguousName if lipid.ambiguousName else lipid.name} {adduct}",
+                                     'adduct':adduct, 'class':lipid.lipid_class, 'formula':str(lipid.formula),
+                                     'smiles':lipid.ambiguoussmiles if lipid.ambiguoussmiles else lipid.smiles,
+                                     'ionmode':GL.adducts[adduct][1], 'mw':lipid.mass, 'precursor_mz':GL.MA(lipid, adduct, 0).mass,
+                                     'peaks':[(peak.mass, peak.intensity, peak.Comment()) for peak in spectrum]}, 1
+            except: yield ambiguousKey, None, 0
+
+    # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ #
+
+    # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ #
+
+    def as_orb(self):
+        '''
+        Defines how to export data when saved as .CSV.
+        Specifically for use in QE 'Orbitrap' inclusion list.
+        '''
+
+        self.noun = 'precursors' # Noun is used in Page 3 console when generation is completed
+        csv.writer(self.save_file).writerow(self.formats[self.filter][2])
+        writer = BufferedWriter(self.save_file, self.bufferSize)
+
+        for lipid in self.lipid_data:
+            for key, record, count in self.orb_records(lipid):
+                writer.write(record)
+                self.count += count
+            del lipid
+        self.close_writer(writer)
+        self.finished.emit()
+
+    def orb_records(self, lipid):
+        '''
+        Yields (precursor mass, record, count) for each adduct of the lipid, as .CSV rows.
+        Duplicate precursor masses are not yielded.
+        '''
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+
+        if self.specificOrganisation == True: 
+            try: lipid.name = lipid.specificname
+            except:pass
+
+        for adduct in self.lipid_adducts(lipid)[0]:
+            prec = GL.MA(lipid, adduct, 0)
+            if prec.mass not in self.unique_mass:
+                self.unique_mass.add(prec.mass) # Removes all the duplicate precursor masses
+
+                writer.writerow([prec.mass,'','',
+                                 type(lipid).__name__ ,GL.adducts[adduct][2],GL.adducts[adduct][1],'',
+                                 '','','','',adduct])
+                yield prec.mass, buffer.getvalue(), 1
+                buffer.seek(0)
+                buffer.truncate()
+            else: continue
+
+    # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ #
+
+    # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ #
+
+    def as_sky(self):
+        '''
+        Defines how to export data when saved as .CSV.
+        Specifically for use in Skyline Transition list.
+        '''
+
+        self.noun = 'transitions'  # Noun is used in Page 3 console when generation is completed
+        csv.writer(self.save_file).writerow(self.formats[self.filter][2])
+        writer = BufferedWriter(self.save_file, self.bufferSize)
+
+        for lipid in self.lipid_data:
+            for key, record, count in self.sky_records(lipid):
+                writer.write(record)
+                self.count += count
+            del lipid
+        self.close_writer(writer)
+
+        self.split_output()
+        self.finished.emit()
+
+    def sky_records(self, lipid):
+        '''
+        Yields (key, record, count) for each adduct of the lipid, as .CSV rows of transitions.
+        key is (name, adduct) for species-level spectra, which may only be written once, else None.
+        Product formulas are only made for transitions that are written.
+        '''
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+
+        for adduct, ambiguousKey in self.spectra_to_generate(lipid):
+            self.resolve_spectra(lipid, adduct)
+
+            prec_mz = GL.MA(lipid, adduct, 0).mass
+            precursor = [lipid.lipid_class, (lipid.ambiguousName if lipid.ambiguousName else lipid.name), str(lipid.formula),
+                         adduct, prec_mz, GL.adducts[adduct][2]]
+
+            written_masses, rows = set(), []
+            for prod in lipid.spectra[adduct]:
+                if prod.intensity > 0 and prod.mass != prec_mz and prod.mass not in written_masses:
+                    rows.append(precursor + [str(prod.Formula()), prod.mass, prod.Charge(), '', ''])
+                    written_masses.add(prod.mass)
+            writer.writerows(rows)
+
+            yield ambiguousKey, buffer.getvalue(), len(rows)
+            buffer.seek(0)
+            buffer.truncate()
+
+    def split_output(self):
+        '''
+        Copies the transitions of a complete Skyline transition list into one file per class or polarity, as
+        lipids.PC.csv or lipids.Positive.csv beside lipids.csv, so they can be imported into Skyline in parallel.
+        Each has the header of the full list, which is kept.
+        '''
+        self.splitFiles = []
+        if not self.split or self.cancelled or self.filter != "Skyline Transition (*.csv)": return
+        self.save_file.flush()
+        root, extension = os.path.splitext(self.file_name)
+        files, writers, header = {}, {}, self.csv_header()
+        try:
+            with open(self.file_name, newline='') as source:
+                reader = csv.reader(source)
+                next(reader, None) # Header
+                for row in reader:
+                    if self.split == 'class': group = row[0]
+                    else: group = GL.adducts[row[3]][1] if row[3] in GL.adducts else ('Positive' if int(row[5]) > 0 else 'Negative')
+                    if group not in writers:
+                        file_name = root + '.' + re.sub(r'[^\w+-]', '_', group) + extension # Class names as file names
+                        files[group] = open(file_name, 'w', newline='')
+                        writers[group] = csv.writer(files[group])
+                        writers[group].writerow(header)
+                        self.splitFiles.append(file_name)
+                    writers[group].writerow(row)
+        finally:
+            for file in files.values(): file.close()
+
+    # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ #
+
+    # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ #
+
+    def as_iso(self):
+        '''
+        Defines how to export data when saved as .CSV.
+        Isotope envelope of each precursor, for DDA and targeted methods.
+        '''
+
+        self.noun = 'envelopes'  # Noun is used in Page 3 console when generation is completed
+        csv.writer(self.save_file).writerow(self.csv_header())
+        writer = BufferedWriter(self.save_file, self.bufferSize)
+
+        for lipid in self.lipid_data:
+            for key, record, count in self.iso_records(lipid):
+                writer.write(record)
+                self.count += count
+            del lipid
+        self.close_writer(writer)
+        self.finished.emit()
+
+    def iso_records(self, lipid):
+        '''
+        Yields (None, record, 1) for each adduct of the lipid, as a .CSV row of its precursor and isotope peaks.
+        Envelopes are cached by formula, as every lipid of a sum composition has the same one.
+        '''
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+
+        if self.specificOrganisation == True: 
+            try: lipid.name = lipid.specificname
+            except:pass
+
+        for adduct in self.lipid_adducts(lipid)[0]:
+            formula = lipid.formula + GL.adducts[adduct][3]
+            charge = GL.adducts[adduct][2]
+            row = [lipid.lipid_class, lipid.name, str(formula), adduct, GL.MA(lipid, adduct, 0).mass, charge]
+            for mz, abundance in Isotopes.envelope(formula, charge, self.isotopePeaks):
+                row.extend([mz, round(abundance, 2)])
+            writer.writerow(row)
+            yield None, buffer.getvalue(), 1
+            buffer.seek(0)
+            buffer.truncate()
+
+# ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ #
+
+# Worker processes for Generator.run_parallel. Each worker rebuilds a Generator from the
+# payload once, then enumerates and formats the jobs (class, combination offsets) it is given.
+
+worker = None
+
+def initialise_worker(payload):
+    global worker
+    payload = dill.loads(payload)
+    GL.adducts = payload['adducts'] # Adducts and class templates may have been modified in the GUI
+    for cls, adducts, adducts_to_generate, ambiguousSpectra in payload['classes']:
+        cls.adducts = adducts
+        cls.adducts_to_generate = adducts_to_generate
+        cls.ambiguousSpectra = ambiguousSpectra
+    filter, tails_to_generate, bases_to_generate, isomerism, tailSpecifics, tailList, specificOrganisation, isotopePeaks = payload['arguments']
+    worker = Generator(None, filter, [cls for cls, *_ in payload['classes']], tails_to_generate, bases_to_generate,
+                       isomerism, False, [], tailSpecifics, tailList, specificOrganisation, isotopePeaks=isotopePeaks,
+                       recipes=payload['recipes'])
+    worker.generate_tail_lists()
+    if payload['profile']: # Stages only, captures are of the writing process
+        worker.profiler = Profiling.Profiler()
+        worker.profiler.install(worker)
+
+def generate_job(recordsMethod, idx, start, stop):
+    '''(records, collapsed) of a job, followed by the stage times of a profiled worker.'''
+    result = worker.job_records(recordsMethod, idx, start, stop)
+    if worker.recipes: worker.recipes.save() # Workers are not told when the run ends, recipes are only written if changed
+    if worker.profiler: return (*result, worker.profiler.take())
+    return result
+
+def source_fingerprint():
+    '''Hash of the modules records are generated by, so cached records are not reused after they change.'''
+    digest = hashlib.blake2b(digest_size=16)
+    for module in (GL, Classes, Isotopes, Compiled, sys.modules[__name__]):
+        try: digest.update(inspect.getsource(module).encode())
+        except (OSError, TypeError): digest.update(module.__name__.encode()) # No source, as in a frozen build
+    return digest.hexdigest()
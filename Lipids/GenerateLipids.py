@@ -2,7 +2,7 @@ import re
 import copy
 import numpy as np
 from itertools import combinations
-from collections import Counter
+from collections import OrderedDict
 
 adducts = {
   #[Delta_mz,       Polarity,  z,   chnops,              smiles]
@@ -236,16 +236,119 @@ elements = {
 
 # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ #
 
-class Counter(Counter):
-
-    def __le__(self, other):
-        return all( v <= other[k] for k,v in self.items())
-
-    def __lt__(self, other):
-        return all( v < other[k] for k,v in self.items())
+class Formula:
+  '''Molecular formula, as a fixed width vector of element counts packed into one integer\n
+  Each element of elements has a 16 bit signed field, so adding or subtracting formulas is a single
+  integer operation and equal formulas hash equally. Used as a dict of element counts, e.g.
+  Formula({'C':3, 'H':8, 'O':3}), formula['H'], formula.items(), formula.update(other) and
+  formula.subtract({'H':2, 'O':1}), where other is a Formula or a dict.\n
+  a <= b is True if b contains every element of a, in at least the same number.\n
+  str(formula) is the Hill formula with explicit counts, e.g. C3H8O3.
+  '''
+  __slots__ = ('value',)
+
+  symbols = ['C', 'H', 'N', 'O', 'P', 'S', 'D', 'Na', 'K', 'Li', 'Cl', 'As'] # Common elements in the lowest fields
+  symbols += sorted(set(elements) - set(symbols))
+  bits = 16
+  units = dict(zip(symbols, (1 << 16*i for i in range(len(symbols)))))
+  strings = {} # Hill formula of each value, shared as most formulas recur from lipid to lipid
+
+  def __init__(self, chnops=None):
+    if isinstance(chnops, Formula): self.value = chnops.value
+    elif chnops: self.value = self.pack(chnops)
+    else: self.value = 0
+
+  @classmethod
+  def pack(cls, chnops):
+    try: return sum([count*cls.units[element] for element, count in chnops.items()])
+    except KeyError as error: raise ValueError(f"Unknown element {error} in formula") from None
+
+  def update(self, other):
+    self.value += other.value if isinstance(other, Formula) else self.pack(other)
+  def subtract(self, other):
+    self.value -= other.value if isinstance(other, Formula) else self.pack(other)
+  def copy(self):
+    return Formula(self)
+
+  def __iadd__(self, other):
+    self.update(other)
+    return self
+  def __isub__(self, other):
+    self.subtract(other)
+    return self
+  def __add__(self, other):
+    formula = Formula(self)
+    formula.update(other)
+    return formula
+  def __sub__(self, other):
+    formula = Formula(self)
+    formula.subtract(other)
+    return formula
+
+  def counts(self):
+    '''Non-zero (element, count) pairs, in field order'''
+    value, i, counts = self.value, 0, []
+    full = 1 << self.bits
+    while value:
+      count = value & (full-1)
+      if count >= full >> 1: count -= full # Fields are signed
+      if count: counts.append((self.symbols[i], count))
+      value = (value - count) >> self.bits
+      i += 1
+    return counts
+
+  def vector(self):
+    '''Counts of every element in Formula.symbols, as a numpy array'''
+    vector = np.zeros(len(self.symbols), dtype=np.int32)
+    for element, count in self.counts():
+      vector[self.symbols.index(element)] = count
+    return vector
+
+  def items(self):
+    counts = self.counts()
+    if any(element == 'C' for element, count in counts): # Hill order, C then H then alphabetical
+      counts.sort(key=lambda x: (x[0] != 'C', x[0] != 'H', x[0]))
+    else: counts.sort() # Alphabetical without carbon
+    return counts
+  def keys(self):
+    return [element for element, count in self.items()]
+  def values(self):
+    return [count for element, count in self.items()]
+  def __iter__(self):
+    return iter(self.keys())
+  def __len__(self):
+    return len(self.counts())
+
+  def __getitem__(self, element):
+    for symbol, count in self.counts():
+      if symbol == element: return count
+    return 0
+  def __setitem__(self, element, count):
+    self.value += (count - self[element])*self.units[element]
+
+  def __str__(self):
+    string = self.strings.get(self.value)
+    if string is None:
+      if len(self.strings) > 1 << 20: self.strings.clear()
+      string = self.strings[self.value] = ''.join([element+str(count) for element, count in self.items()])
+    return string
+  def __repr__(self):
+    return f"Formula('{self}')"
+
+  def __eq__(self, other): # Equal to a dict or Counter of the same counts
+    if isinstance(other, Formula): return self.value == other.value
+    if not isinstance(other, dict): return NotImplemented
+    try: return self.value == self.pack(other)
+    except ValueError: return False # Has an element no Formula has
+  def __hash__(self):
+    return hash(self.value)
 
-    def __gt__(self, other):
-        return any( v > other[k] for k,v in self.items())
+  def __le__(self, other): # Compared over the elements of self
+    return all(count <= other[element] for element, count in self.counts())
+  def __lt__(self, other):
+    return all(count < other[element] for element, count in self.counts())
+  def __gt__(self, other):
+    return any(count > other[element] for element, count in self.counts())
 
 # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ #
 
@@ -260,10 +363,12 @@ class sn:
   type = 'Acyl', 'Ether', 'Methyl', 'Headgroup', anything else will return water\n
   providing no parameters also returns a water (-OH), which does not modify backbone.
   '''
+  __slots__ = ('type', 'hgtails', 'c', 'd', 'me', 'oh', 'dt', 'name', 'mass', 'formula', 'smiles', 'inverseSmiles')
+
   def __init__(self, c=0, d=0, mass=None, chnops={}, smiles='', type=None, hgtails=[], me=0, oh=0, dt=0):
 
-    self.type = type # Tail list is shared. Deepcopy made as to not overwrite
-    self.hgtails = copy.deepcopy(hgtails) # the tails in the tail list.
+    self.type = type # Tail list is shared. Copies made as to not overwrite the type of
+    self.hgtails = tuple(copy.copy(tail) for tail in hgtails) # the tails in the tail list, the rest is only read.
     string = [] # string is created in list so that constituent order can be reversed
 
     self.c  = c
@@ -276,7 +381,7 @@ class sn:
       self.name = f"{self.c}:{self.d}"
       #           O2 mass     + c*CH2 mass    - d*H2 mass
       self.mass = 31.98982924 + self.c*14.01565007 - self.d*2.01565007
-      self.formula = Counter({'C':self.c, 'H':(2*self.c-2*self.d),'O':2})
+      self.formula = Formula({'C':self.c, 'H':(2*self.c-2*self.d),'O':2})
       string = ['C(=O)',self.d*'C=C',self.oh*'C(O)',(self.c-1-2*self.d-self.oh)*'C']
       # string is used to generate smiles for the tails. Made as a list first
       # in case the order needs to be reversed later on.
@@ -287,7 +392,7 @@ class sn:
       self.name = f"O-{self.c}:{self.d}"
       #           H2O mass      + c*CH2 mass    - d*H2 mass
       self.mass = masses['H2O'] + self.c*14.01565007 - self.d*2.01565007
-      self.formula = Counter({'C':self.c, 'H':(2*self.c-2*(self.d-1)),'O':1})
+      self.formula = Formula({'C':self.c, 'H':(2*self.c-2*(self.d-1)),'O':1})
       string = ['C',self.d*'C=C',self.oh*'C(O)',(self.c-1-2*self.d-self.oh)*'C']
       self.smiles = ''.join(string) # Repeated in each as to not overwrite
       self.inverseSmiles = ''.join(string[::-1]) # self.smiles set for headgroup
@@ -296,7 +401,7 @@ class sn:
       self.name = f"P-{self.c}:{self.d}"
       #           H2O mass      + c*CH2 mass    - d*H2 mass
       self.mass = masses['H2O'] + self.c*14.01565007 - (self.d+1)*2.01565007
-      self.formula = Counter({'C':self.c, 'H':(2*self.c-2*self.d),'O':1})
+      self.formula = Formula({'C':self.c, 'H':(2*self.c-2*self.d),'O':1})
       string = ['\C=C/',self.d*'C=C',self.oh*'C(O)',(self.c-2-2*self.d-self.oh)*'C']
       self.smiles = ''.join(string) # Repeated in each as to not overwrite
       self.inverseSmiles = ''.join(string[::-1]) # self.smiles set for headgroup
@@ -304,7 +409,7 @@ class sn:
     elif self.type == 'Headgroup':
       self.name = 'Headgroup'
       self.mass = mass
-      self.formula = Counter(chnops)
+      self.formula = Formula(chnops)
       self.smiles = smiles
       for tail in self.hgtails: # Headgroup can be acyl-functionalised
         tail.type = 'HeadTail'
@@ -315,7 +420,7 @@ class sn:
     else: # If nothing, just give it values for water
       self.name = '0:0'
       self.mass = masses['H2O']
-      self.formula = Counter({'H':2,'O':1})
+      self.formula = Formula({'H':2,'O':1})
       self.smiles = ''
 
     # Perhaps exclude?  Identical to fatty acid of c = c+m
@@ -369,6 +474,8 @@ class base:
   type = determines oh groups and desaturation [Deoxysphinganine, Sphinganine, Sphingosine, Phytosphingosine]\n
   providing no parameters also returns a water (-OH), which does not modify backbone.
   '''
+  __slots__ = ('type', 'c', 'd', 'me', 'oh', 'dt', 'lipidSuffix', 'name', 'mass', 'formula', 'smiles')
+
   def __init__(self, c=5, type=None, dt=0):
 
     self.type = type
@@ -387,7 +494,7 @@ class base:
       self.name = f"{self.c}:0;O"
       #           H2O mass      + c*CH2 mass         + O mass
       self.mass = masses['H2O'] + self.c*14.01565007 + 15.99491462
-      self.formula = Counter({'C':self.c, 'H':(2+2*self.c),'O':2})
+      self.formula = Formula({'C':self.c, 'H':(2+2*self.c),'O':2})
       self.smiles = 'CC(N)C(O)'
       self.smiles += (self.c-3)*'C'
 
@@ -398,7 +505,7 @@ class base:
       self.name = f"{self.c}:1;O"
       #           H2O mass      + c*CH2 mass         - H2 mass    + O mass
       self.mass = masses['H2O'] + self.c*14.01565007 - 2.01565007 + 15.99491462
-      self.formula = Counter({'C':self.c, 'H':(2*self.c),'O':2})
+      self.formula = Formula({'C':self.c, 'H':(2*self.c),'O':2})
       self.smiles = 'CC(N)C(O)/C=C/'
       self.smiles += (self.c-5)*'C'
 
@@ -409,7 +516,7 @@ class base:
       self.name = f"{self.c}:0;O2"
       #           H2O mass      + c*CH2 mass         + 2* O mass
       self.mass = masses['H2O'] + self.c*14.01565007 + 2*15.99491462
-      self.formula = Counter({'C':self.c, 'H':(2+2*self.c),'O':3})
+      self.formula = Formula({'C':self.c, 'H':(2+2*self.c),'O':3})
       self.smiles = 'OCC(N)C(O)'
       self.smiles += (self.c-3)*'C'
 
@@ -420,7 +527,7 @@ class base:
       self.name = f"{self.c}:1;O2"
       #           H2O mass      + c*CH2 mass         - H2 mass    + 2* O mass
       self.mass = masses['H2O'] + self.c*14.01565007 - 2.01565007 + 2*15.99491462
-      self.formula = Counter({'C':self.c, 'H':(2*self.c),'O':3})
+      self.formula = Formula({'C':self.c, 'H':(2*self.c),'O':3})
       self.smiles = 'OCC(N)C(O)/C=C/'
       self.smiles += (self.c-5)*'C'
 
@@ -431,7 +538,7 @@ class base:
       self.name = f"{self.c}:2;O2"
       #           H2O mass      + c*CH2 mass         - 2*H2 mass    + 2* O mass
       self.mass = masses['H2O'] + self.c*14.01565007 - 2*2.01565007 + 2*15.99491462
-      self.formula = Counter({'C':self.c, 'H':(2*self.c-2),'O':3})
+      self.formula = Formula({'C':self.c, 'H':(2*self.c-2),'O':3})
       self.smiles = 'OCC(N)C(O)/C=C/'
       self.smiles += (self.c-7)*'C'+'C=C'
 
@@ -442,7 +549,7 @@ class base:
       self.name = f"{self.c}:0;O3"
       #           H2O mass      + c*CH2 mass         + 3* O mass
       self.mass = masses['H2O'] + self.c*14.01565007 + 3*15.99491462
-      self.formula = Counter({'C':self.c, 'H':(2+2*self.c),'O':4})
+      self.formula = Formula({'C':self.c, 'H':(2+2*self.c),'O':4})
       self.smiles = 'OCC(N)C(O)C(O)'
       self.smiles += (self.c-4)*'C'
       # Despite being based around an ammonia group, H2O is still
@@ -456,7 +563,7 @@ class base:
       self.lipidSuffix = ''
       self.name = '0:0'
       self.mass = masses['H2O']
-      self.formula = Counter({'H':2,'O':1})
+      self.formula = Formula({'H':2,'O':1})
       self.smiles = ''
 
     if self.dt > 0: # deuterium labels
@@ -490,11 +597,13 @@ baseTypes = ['Dihydrodeoxysphinganine', 'Deoxysphinganine', 'Sphinganine', 'Sphi
 # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ #
 
 class Other:
+  __slots__ = ('name', 'mass', 'formula', 'smiles')
+
   def __init__(self, name='H2O', mass=masses['H2O'], chnops={'H':2,'O':1}, smiles='', dt=0):
     
     self.name = name
     self.mass = mass
-    self.formula = Counter(chnops)
+    self.formula = Formula(chnops)
     self.smiles=smiles
 
     if dt > 0: # deuterium labels
@@ -505,10 +614,21 @@ class Other:
 # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ #
 
 # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ #
-class Lipid:
+class Slotted(type):
+  '''Gives each lipid class empty __slots__ unless it declares its own, so no lipid carries an instance __dict__.'''
+  def __new__(mcls, name, bases, namespace, **kwargs):
+    namespace.setdefault('__slots__', ())
+    return super().__new__(mcls, name, bases, namespace, **kwargs)
+
+class Lipid(metaclass=Slotted):
+  '''Attributes of every lipid are declared below, anything else is of its class (adducts, adducts_to_generate, ...).\n
+  editedAdducts is None, or adducts edited for this lipid alone in the wizard, see adductSpectra.'''
+  __slots__ = ('tails', 'name', 'specificname', 'lipid_class', 'exactMass', 'mass', 'formula', 'smiles',
+               'spectra', 'ambiguousName', 'ambiguoussmiles', 'editedAdducts')
+
   def __init__(self, adducts):
 
-    self.adducts = adducts
+    self.editedAdducts = None if adducts is getattr(type(self), 'adducts', None) else adducts
     self.spectra = {}
     self.smiles = ''
     self.ambiguousName = False
@@ -529,6 +649,10 @@ class Lipid:
           print('Error assigning', fragment)
     self.spectra[adduct] = sorted(set(x), reverse=True)
 
+  def adductSpectra(self):
+    '''{adduct:{fragment:intensity}} of the lipid, its class's unless edited for this lipid.'''
+    return type(self).adducts if self.editedAdducts is None else self.editedAdducts
+
   def __hash__(self):
     return hash(('name', self.name))
   def __eq__(self, other):
@@ -542,19 +666,17 @@ class Glycerolipid(Lipid):
   def __init__(self, adducts, sn1=sn(), sn2=sn(), sn3=sn()):
     super().__init__(adducts)
 
-    self.tails = []
-    if sn3.type in ['Headgroup']: 
-      self.tails.extend([tail for tail in sn3.hgtails])
-    self.tails.extend([sn1, sn2, sn3])
+    self.tails = [*(sn3.hgtails if sn3.type in ['Headgroup'] else ()), sn1, sn2, sn3] # Built at its final size
 
     self.name = f"{self.lipid_class} {'_'.join(snx.name for snx in self.tails if snx.type != 'Headgroup')}" # Headtail mass factored into headgroup
-    self.mass = round(masses['Glycerol'] + sum([snx.mass-masses['H2O'] for snx in self.tails if snx.type != 'HeadTail']), 6)
+    self.exactMass = masses['Glycerol'] + sum([snx.mass-masses['H2O'] for snx in self.tails if snx.type != 'HeadTail']) # Unrounded
+    self.mass = round(self.exactMass, 6)
 
     if sn3.type in ['Acyl', 'Ether', 'Vinyl']: string = sn3.inverseSmiles
     else: string = sn3.smiles # TAGs need the first tail reversed.
     self.smiles = f"{string}OCC(O{sn2.smiles})CO{sn1.smiles}"
 
-    self.formula = Counter({'C':3, 'H':8, 'O':3})  # Glycerol
+    self.formula = Formula({'C':3, 'H':8, 'O':3})  # Glycerol
     for snx in self.tails:  # Works out CHNOPS for lipid
       if snx.type != 'HeadTail': # Headtails factored into headgroup
         self.formula.update(snx.formula)
@@ -568,16 +690,15 @@ class Sphingolipid(Lipid):
   def __init__(self, adducts, base=base(), sn1=sn(), headgroup=sn()):
     super().__init__(adducts)
 
-    self.tails = [base]
-    if headgroup.type in ['Headgroup']:
-      self.tails.extend([tail for tail in headgroup.hgtails])
-    self.tails.extend([sn1, headgroup]) # Base and headgroup included to be consistant with fragment generation
+    self.tails = [base, *(headgroup.hgtails if headgroup.type in ['Headgroup'] else ()), sn1, headgroup]
+    # Base and headgroup included to be consistant with fragment generation
 
     self.name = f"{self.lipid_class}{base.lipidSuffix if base.lipidSuffix not in self.lipid_class else ''} {'_'.join(snx.name for snx in self.tails if snx.name not in ['Headgroup', '0:0'])}"
-    self.mass = round(masses['NH3'] + sum([snx.mass-masses['H2O'] for snx in self.tails if snx.type != 'HeadTail']), 6)
+    self.exactMass = masses['NH3'] + sum([snx.mass-masses['H2O'] for snx in self.tails if snx.type != 'HeadTail']) # Unrounded
+    self.mass = round(self.exactMass, 6)
     self.smiles= f'{headgroup.smiles}{base.smiles[:5]}{sn1.smiles}{base.smiles[5:]}'
 
-    self.formula = Counter({'H':3,'N':1}) # Unlike GPLs, sphingoids built around the base
+    self.formula = Formula({'H':3,'N':1}) # Unlike GPLs, sphingoids built around the base
     for snx in self.tails: # Works out CHNOPS for lipid
       if snx.type != 'HeadTail': # Headtails factored into headgroup
         self.formula.update(snx.formula)
@@ -594,7 +715,8 @@ class OtherLipid(Lipid): # For cholsterols?
     self.tails = [sn1]
     self.lipid_class = type(self).__name__
     self.name = f"{body.name} {(sn1.name if sn1.name not in ['Headgroup', '0:0'] else '')}"
-    self.mass = round(body.mass + sn1.mass - masses['H2O'], 6)
+    self.exactMass = body.mass + sn1.mass - masses['H2O'] # Unrounded
+    self.mass = round(self.exactMass, 6)
     self.smiles = body.smiles
 
     self.formula = body.formula
@@ -749,6 +871,38 @@ gt1a = gt1a.returnFragments()
 #  Isomer-ambiguous as well as isomer-specific fragments are provided.
 #  Fragment list is nowhere near exhaustive, though hopefully sufficient!
 
+class FragmentCache:
+  '''Least recently used cache of fragment mass and comment.\n
+  Only used for fragments with a cacheKey, i.e. those which depend on a tail and
+  adduct rather than the whole lipid, so recur across many lipids.'''
+  def __init__(self, maxsize=100000):
+    self.maxsize = maxsize
+    self.cache = OrderedDict()
+    self.hits = 0
+    self.misses = 0
+
+  def get(self, key, resolve):
+    try:
+      value = self.cache[key]
+      self.cache.move_to_end(key)
+      self.hits += 1
+    except KeyError:
+      value = self.cache[key] = resolve()
+      self.misses += 1
+      if len(self.cache) > self.maxsize:
+        self.cache.popitem(last=False)
+    return value
+
+  def clear(self):
+    self.cache.clear()
+    self.hits = 0
+    self.misses = 0
+
+  def info(self):
+    return {'hits':self.hits, 'misses':self.misses, 'size':len(self.cache), 'maxsize':self.maxsize}
+
+fragmentCache = FragmentCache()
+
 class Fragment:
   ''' Fragments are used to generate mass spectra for lipids'''
   def __init__(self, lipid, adduct, intensity, fragmentType = None):
@@ -756,7 +910,11 @@ class Fragment:
     self.lipid = lipid
     self.adduct = adduct
     self.intensity = intensity
-    self.mass = round(self.MZ(), 6)
+    key = self.cacheKey()
+    if key is None: self.mass = round(self.MZ(), 6)
+    else:
+      self.mass, self.comment = fragmentCache.get((type(self), adduct)+key, self.resolve)
+      self.Comment = self.cachedComment
 
     if fragmentType is not None:
       self.fragmentType = fragmentType
@@ -780,7 +938,7 @@ class Fragment:
     self.mass = round(self.MZ(), 6)
 
     def returnFormula():
-        formula = Counter()
+        formula = Formula()
         for child in self.fragTerms:
             if child[0] == -1:
                 formula.subtract(child[1].formula)
@@ -804,7 +962,15 @@ class Fragment:
   def MZ(self):
     return 0
   def Formula(self):
-    return Counter({})
+    return Formula({})
+  def cacheKey(self):
+    # Values, besides fragment type and adduct, which MZ and Comment depend on.
+    # None if they depend on the lipid, as most do.
+    return None
+  def resolve(self):
+    return round(self.MZ(), 6), self.Comment()
+  def cachedComment(self):
+    return self.comment
   def Charge(self):
     return int((adducts[self.adduct][2]/
     abs(adducts[self.adduct][2])))
@@ -842,7 +1008,7 @@ def defineFragmentTerm(inst, string):
                 mass += elements[a[0]][0][0]*int(a[1] or 1)
                 formula[a[0]] = int(a[1] or 1)
             except: pass # Invalid character
-        fragTerm = FragmentTerm(mass, Counter(formula))
+        fragTerm = FragmentTerm(mass, Formula(formula))
 
     return [sign, fragTerm]
 
@@ -859,7 +1025,7 @@ class MA(Fragment):
   def MZ(self):
     return (self.lipid.mass + adducts[self.adduct][0])/abs(adducts[self.adduct][2])
   def Formula(self):
-    formula = Counter(self.lipid.formula)
+    formula = Formula(self.lipid.formula)
     formula.update(adducts[self.adduct][3])
     return formula
   def Charge(self):
@@ -882,7 +1048,7 @@ class MA_s_H2O(MA):
     return comment
   def Validate(self):
     super().Validate()
-    assert Counter({'O':1, 'H':2}) <= self.lipid.formula
+    assert Formula({'O':1, 'H':2}) <= self.lipid.formula
 
 class MA_s_2H2O(MA):
   '''[ MA - H4O2 ]\n
@@ -899,7 +1065,7 @@ class MA_s_2H2O(MA):
     return comment
   def Validate(self):
     super().Validate()
-    assert Counter({'O':2, 'H':4}) <= self.lipid.formula
+    assert Formula({'O':2, 'H':4}) <= self.lipid.formula
 
 
 class MA_s_PO3(MA):
@@ -917,7 +1083,7 @@ class MA_s_PO3(MA):
     return comment
   def Validate(self):
     super().Validate()
-    assert Counter({'P':1, 'O':3, 'H':1}) <= self.lipid.formula
+    assert Formula({'P':1, 'O':3, 'H':1}) <= self.lipid.formula
 
 class MA_s_PO4(MA):
   '''[ MA - PO4 ]\n
@@ -934,7 +1100,7 @@ class MA_s_PO4(MA):
     return comment
   def Validate(self):
     super().Validate()
-    assert Counter({'P':1, 'O':4, 'H':3}) <= self.lipid.formula
+    assert Formula({'P':1, 'O':4, 'H':3}) <= self.lipid.formula
 
 # ~ # Fragments for DGDG, AcPIMs
 
@@ -954,7 +1120,7 @@ class MA_s_Gal(MA):
     return comment
   def Validate(self):
     super().Validate()
-    assert Counter({'C':6, 'H':12,'O':6}) <= self.lipid.formula
+    assert Formula({'C':6, 'H':12,'O':6}) <= self.lipid.formula
 
 class MA_s_Gal_H2O(MA):
   '''[ MA - Galactose - H2O ]\n
@@ -972,7 +1138,7 @@ class MA_s_Gal_H2O(MA):
     return comment
   def Validate(self):
     super().Validate()
-    assert Counter({'C':6, 'H':14,'O':7}) <= self.lipid.formula
+    assert Formula({'C':6, 'H':14,'O':7}) <= self.lipid.formula
 
 class MA_H2O_s_Gal(MA):
   '''[ MA - Galactose - H2O ]\n
@@ -990,7 +1156,7 @@ class MA_H2O_s_Gal(MA):
     return comment
   def Validate(self):
     super().Validate()
-    assert Counter({'C':6, 'H':10,'O':5}) <= self.lipid.formula
+    assert Formula({'C':6, 'H':10,'O':5}) <= self.lipid.formula
 
 class MA_s_2Gal(MA_s_Gal):
   '''[ MA - Galactose - H2O ]\n
@@ -1008,7 +1174,7 @@ class MA_s_2Gal(MA_s_Gal):
     return comment
   def Validate(self):
     super().Validate()
-    assert Counter({'C':12, 'H':24,'O':12}) <= self.lipid.formula
+    assert Formula({'C':12, 'H':24,'O':12}) <= self.lipid.formula
 
 class MA_H2O_s_2Gal(MA_s_Gal):
   '''[ MA - Galactose - H2O ]\n
@@ -1026,7 +1192,7 @@ class MA_H2O_s_2Gal(MA_s_Gal):
     return comment
   def Validate(self):
     super().Validate()
-    assert Counter({'C':12, 'H':22,'O':11}) <= self.lipid.formula
+    assert Formula({'C':12, 'H':22,'O':11}) <= self.lipid.formula
 
 class MA_2H2O_s_2Gal(MA_H2O_s_Gal):
   '''[ MA - Galactose - H2O ]\n
@@ -1044,7 +1210,7 @@ class MA_2H2O_s_2Gal(MA_H2O_s_Gal):
     return comment
   def Validate(self):
     super().Validate()
-    assert Counter({'C':12, 'H':20,'O':10}) <= self.lipid.formula
+    assert Formula({'C':12, 'H':20,'O':10}) <= self.lipid.formula
 
 # ~ # Fragments for PC+Na/Li
 
@@ -1054,7 +1220,7 @@ class M_s_CH3(Fragment):
   def MZ(self):
     return self.lipid.mass - 15.023475096
   def Formula(self):
-    formula = Counter(self.lipid.formula)
+    formula = Formula(self.lipid.formula)
     formula.subtract({'C':1, 'H':3})
     return formula
   def Charge(self):
@@ -1068,13 +1234,13 @@ class M_s_TMA(Fragment):
   def MZ(self):
     return self.lipid.mass - masses['TMA']
   def Formula(self):
-    formula = Counter(self.lipid.formula)
+    formula = Formula(self.lipid.formula)
     formula.subtract({'C':3, 'H':9 ,'N':1})
     return formula
   def Comment(self):
     return "[M-C3H9N]-"
   def Validate(self):
-    assert Counter({'C':3, 'H':9 ,'N':1}) <= self.lipid.formula
+    assert Formula({'C':3, 'H':9 ,'N':1}) <= self.lipid.formula
 
 class M_s_TMAb(Fragment):
   '''[ M - C3H8N ]\n
@@ -1082,13 +1248,13 @@ class M_s_TMAb(Fragment):
   def MZ(self):
     return self.lipid.mass - masses['TMA'] + masses['H']
   def Formula(self):
-    formula = Counter(self.lipid.formula)
+    formula = Formula(self.lipid.formula)
     formula.subtract({'C':3, 'H':8 ,'N':1})
     return formula
   def Comment(self):
     return "[M-C3H8N]-"
   def Validate(self):
-    assert Counter({'C':3, 'H':8 ,'N':1}) <= self.lipid.formula
+    assert Formula({'C':3, 'H':8 ,'N':1}) <= self.lipid.formula
 
 class MA_s_TMA(MA):
   '''[ MA - C3H9N ]\n
@@ -1106,7 +1272,7 @@ class MA_s_TMA(MA):
     return comment
   def Validate(self):
     super().Validate()
-    assert Counter({'C':3, 'H':9 ,'N':1}) <= self.lipid.formula
+    assert Formula({'C':3, 'H':9 ,'N':1}) <= self.lipid.formula
 
 class MA_s_AZD(MA):
   '''[ MA - C2H5N ]\n
@@ -1124,7 +1290,7 @@ class MA_s_AZD(MA):
     return comment
   def Validate(self):
     super().Validate()
-    assert Counter({'C':2, 'H':5 ,'N':1}) <= self.lipid.formula
+    assert Formula({'C':2, 'H':5 ,'N':1}) <= self.lipid.formula
 
 class MA_s_TMA_H2O(MA_s_TMA):
   '''[ MA - C3H9N ]\n
@@ -1142,7 +1308,7 @@ class MA_s_TMA_H2O(MA_s_TMA):
     return comment
   def Validate(self):
     super().Validate()
-    assert Counter({'C':3, 'H':11 ,'N':1, 'O':1}) <= self.lipid.formula
+    assert Formula({'C':3, 'H':11 ,'N':1, 'O':1}) <= self.lipid.formula
 
 class MA_s_AZD_H2O(MA_s_AZD):
   '''[ MA - C2H5N ]\n
@@ -1160,7 +1326,7 @@ class MA_s_AZD_H2O(MA_s_AZD):
     return comment
   def Validate(self):
     super().Validate()
-    assert Counter({'C':2, 'H':7 ,'N':1, 'O':1}) <= self.lipid.formula
+    assert Formula({'C':2, 'H':7 ,'N':1, 'O':1}) <= self.lipid.formula
 
 # ~ # Fragments for Ceramides
 
@@ -1180,7 +1346,7 @@ class MA_s_MeOH(MA):
     return comment
   def Validate(self):
     super().Validate()
-    assert Counter({'C':1, 'H':4 ,'O':1}) <= self.lipid.formula
+    assert Formula({'C':1, 'H':4 ,'O':1}) <= self.lipid.formula
 
 class MA_s_MeOH_H2O(MA_s_MeOH):
   '''[ MA - CH4O - H2O]\n
@@ -1198,7 +1364,7 @@ class MA_s_MeOH_H2O(MA_s_MeOH):
     return comment
   def Validate(self):
     super().Validate()
-    assert Counter({'C':1, 'H':6 ,'O':2}) <= self.lipid.formula
+    assert Formula({'C':1, 'H':6 ,'O':2}) <= self.lipid.formula
 
 class MA_s_CH2O(MA):
   '''[ MA - CH2O ]\n
@@ -1216,7 +1382,7 @@ class MA_s_CH2O(MA):
     return comment
   def Validate(self):
     super().Validate()
-    assert Counter({'C':1, 'H':2 ,'O':1}) <= self.lipid.formula
+    assert Formula({'C':1, 'H':2 ,'O':1}) <= self.lipid.formula
 
 class MA_s_CH2O_H2O(MA_s_CH2O):
   '''[ MA - CH2O ]\n
@@ -1234,7 +1400,7 @@ class MA_s_CH2O_H2O(MA_s_CH2O):
     return comment  
   def Validate(self):
     super().Validate()
-    assert Counter({'C':1, 'H':4 ,'O':2}) <= self.lipid.formula
+    assert Formula({'C':1, 'H':4 ,'O':2}) <= self.lipid.formula
 
 # ~ # ~ # ~ # [M +/- adduct] - fatty acid
 
@@ -2854,7 +3020,7 @@ class MH(Fragment):
     else:
       return self.lipid.mass - masses['H+']
   def Formula(self):
-    formula = Counter(self.lipid.formula)
+    formula = Formula(self.lipid.formula)
     if adducts[self.adduct][1] == 'Positive':
       formula.update({'H':1})
     else:
@@ -2886,7 +3052,7 @@ class MH_s_H2O(MH):
     return comment  
   def Validate(self):
     super().Validate()
-    assert Counter({'O':1, 'H':2}) <= self.lipid.formula
+    assert Formula({'O':1, 'H':2}) <= self.lipid.formula
 
 class MH_s_2H2O(MH):
   '''[ M(+/-)H - 2H2O ]\n
@@ -2903,7 +3069,7 @@ class MH_s_2H2O(MH):
     return comment  
   def Validate(self):
     super().Validate()
-    assert Counter({'O':2, 'H':4}) <= self.lipid.formula
+    assert Formula({'O':2, 'H':4}) <= self.lipid.formula
 
 class MH_s_PO3(MH):
   '''[ M(+/-)H - PO3 ]\n
@@ -2920,7 +3086,7 @@ class MH_s_PO3(MH):
     return comment
   def Validate(self):
     super().Validate()
-    assert Counter({'H':1, 'P':1,'O':3}) <= self.lipid.formula
+    assert Formula({'H':1, 'P':1,'O':3}) <= self.lipid.formula
 
 class MH_s_PO4(MH):
   '''[ M(+/-)H - PO4 ]\n
@@ -2937,7 +3103,7 @@ class MH_s_PO4(MH):
     return comment  
   def Validate(self):
     super().Validate()
-    assert Counter({'H':3, 'P':1,'O':4}) <= self.lipid.formula
+    assert Formula({'H':3, 'P':1,'O':4}) <= self.lipid.formula
 
 class MH_s_PO4_H2O(MH_s_PO4):
   '''[ M(+/-)H - PO4 -H2O]\n
@@ -2954,7 +3120,7 @@ class MH_s_PO4_H2O(MH_s_PO4):
     return comment  
   def Validate(self):
     super().Validate()
-    assert Counter({'H':5, 'P':1,'O':5}) <= self.lipid.formula
+    assert Formula({'H':5, 'P':1,'O':5}) <= self.lipid.formula
 
 # ~ # Fragments for DGDG
 
@@ -2974,7 +3140,7 @@ class MH_s_Gal_H2O(MH):
     return comment
   def Validate(self):
     super().Validate()
-    assert Counter({'C':6, 'H':10,'O':5}) <= self.lipid.formula
+    assert Formula({'C':6, 'H':10,'O':5}) <= self.lipid.formula
 
 # ~ # Fragments for PE / PC+Na/Li
 
@@ -2993,7 +3159,7 @@ class MH_s_TMA(MH):
     return comment
   def Validate(self):
     super().Validate()
-    assert Counter({'C':3, 'H':9 ,'N':1}) <= self.lipid.formula
+    assert Formula({'C':3, 'H':9 ,'N':1}) <= self.lipid.formula
 
 def MH_s_FA_TMA(lipid, adduct, intensity):
   '''[ MH - (ROOH) - C3H9N ]\n
@@ -3187,7 +3353,7 @@ class MH_s_AZD(MH):
     return comment
   def Validate(self):
     super().Validate()
-    assert Counter({'C':2, 'H':5 ,'N':1}) <= self.lipid.formula
+    assert Formula({'C':2, 'H':5 ,'N':1}) <= self.lipid.formula
 
 # ~ # Fragments for Ceramides
 
@@ -3207,7 +3373,7 @@ class MH_s_MeOH(MH):
     return comment
   def Validate(self):
     super().Validate()
-    assert Counter({'C':1, 'H':4 ,'O':1}) <= self.lipid.formula
+    assert Formula({'C':1, 'H':4 ,'O':1}) <= self.lipid.formula
 
 class MH_s_MeOH_H2O(MH_s_MeOH):
   '''[ MH - CH4O - H2O]\n
@@ -3225,7 +3391,7 @@ class MH_s_MeOH_H2O(MH_s_MeOH):
     return comment
   def Validate(self):
     super().Validate()
-    assert Counter({'C':1, 'H':6 ,'O':2}) <= self.lipid.formula
+    assert Formula({'C':1, 'H':6 ,'O':2}) <= self.lipid.formula
 
 class MH_s_CH2O(MH):
   '''[ MH - CH2O ]\n
@@ -3243,7 +3409,7 @@ class MH_s_CH2O(MH):
     return comment
   def Validate(self):
     super().Validate()
-    assert Counter({'C':1, 'H':2 ,'O':1}) <= self.lipid.formula
+    assert Formula({'C':1, 'H':2 ,'O':1}) <= self.lipid.formula
 
 class MH_s_CH2O_H2O(MH_s_CH2O):
   '''[ MH - CH2O ]\n
@@ -3261,7 +3427,7 @@ class MH_s_CH2O_H2O(MH_s_CH2O):
     return comment  
   def Validate(self):
     super().Validate()
-    assert Counter({'C':1, 'H':4 ,'O':2}) <= self.lipid.formula
+    assert Formula({'C':1, 'H':4 ,'O':2}) <= self.lipid.formula
 
 # ~ # ETC
 
@@ -3280,7 +3446,7 @@ class MH_s_C3H9O6P(MH):
     return comment
   def Validate(self):
     super().Validate()
-    assert Counter({'C':3, 'H':9 ,'O':6, 'P':1}) <= self.lipid.formula
+    assert Formula({'C':3, 'H':9 ,'O':6, 'P':1}) <= self.lipid.formula
 
 class MH_s_HCNO(MH):
   '''[ M(+/-)H - HCNO ]\n
@@ -3298,7 +3464,7 @@ class MH_s_HCNO(MH):
     return comment
   def Validate(self):
     super().Validate()
-    assert Counter({'C':1, 'H':1 ,'O':1, 'N':1}) <= self.lipid.formula
+    assert Formula({'C':1, 'H':1 ,'O':1, 'N':1}) <= self.lipid.formula
 
 class MH_s_C4H7N3O(MH):
   '''[ M(+/-)H - HCNO ]\n
@@ -3316,7 +3482,7 @@ class MH_s_C4H7N3O(MH):
     return comment
   def Validate(self):
     super().Validate()
-    assert Counter({'C':4, 'H':7 ,'O':1, 'N':3}) <= self.lipid.formula
+    assert Formula({'C':4, 'H':7 ,'O':1, 'N':3}) <= self.lipid.formula
 
 # ~ # ~ # ~ # [M +/- H] - fatty acid
 
@@ -4087,7 +4253,7 @@ class M2H(Fragment):
     else:
       return (self.lipid.mass - 2*masses['H+'])/2
   def Formula(self):
-    formula = Counter(self.lipid.formula)
+    formula = Formula(self.lipid.formula)
     if adducts[self.adduct][1] == 'Positive':
       formula.update({'H':2})
     else:
@@ -4119,7 +4285,7 @@ class M2H_s_H2O(M2H):
     return comment  
   def Validate(self):
     super().Validate()
-    assert Counter({'H':2,'O':1}) <= self.lipid.formula
+    assert Formula({'H':2,'O':1}) <= self.lipid.formula
 
 class M2H_s_2H2O(M2H):
   '''[ M(+/-)2H - 2H2O ]\n
@@ -4136,7 +4302,7 @@ class M2H_s_2H2O(M2H):
     return comment  
   def Validate(self):
     super().Validate()
-    assert Counter({'H':4,'O':2}) <= self.lipid.formula
+    assert Formula({'H':4,'O':2}) <= self.lipid.formula
 
 # ~ # ~ # ~ # [M +/- 2H] - fatty acid
 
@@ -4221,13 +4387,15 @@ class FAHx(Fragment):
   def __init__(self, lipid, adduct, intensity, fragmentType, tail):
       self.tail = tail
       super().__init__(lipid, adduct, intensity, fragmentType)
+  def cacheKey(self):
+    return (self.tail.type, self.tail.name, self.tail.mass)
   def MZ(self):
     if adducts[self.adduct][1] == 'Positive':
       return self.tail.mass + masses['H+']
     else:
       return self.tail.mass - masses['H+']
   def Formula(self):
-    formula = Counter(self.tail.formula)
+    formula = Formula(self.tail.formula)
     if adducts[self.adduct][1] == 'Positive':
       formula.update({'H':1})
     else:
@@ -4258,13 +4426,15 @@ class FAH_PUFAx(Fragment):
   def __init__(self, lipid, adduct, intensity, fragmentType, tail):
       self.tail = tail
       super().__init__(lipid, adduct, intensity, fragmentType)
+  def cacheKey(self):
+    return (self.tail.type, self.tail.name, self.tail.mass)
   def MZ(self):
     if adducts[self.adduct][1] == 'Positive':
       return self.tail.mass + masses['H+'] - 43.989829
     else:
       return self.tail.mass - masses['H+'] - 43.989829
   def Formula(self):
-    formula = Counter(self.tail.formula)
+    formula = Formula(self.tail.formula)
     if adducts[self.adduct][1] == 'Positive':
       formula.update({'H':1})
       formula.subtract({'C':1, 'O':2})
@@ -4298,13 +4468,15 @@ class FAH_bx(Fragment):
   def __init__(self, lipid, adduct, intensity, fragmentType, tail):
       self.tail = tail
       super().__init__(lipid, adduct, intensity, fragmentType)
+  def cacheKey(self):
+    return (self.tail.type, self.tail.name, self.tail.mass)
   def MZ(self):
     if adducts[self.adduct][1] == 'Positive':
       return self.tail.mass + masses['H+']
     else:
       return self.tail.mass - masses['H+']
   def Formula(self):
-    formula = Counter(self.tail.formula)
+    formula = Formula(self.tail.formula)
     if adducts[self.adduct][1] == 'Positive':
       formula.update({'H':1})
     else:
@@ -4338,10 +4510,12 @@ class C3H5O4P_FAx(Fragment):
   def __init__(self, lipid, adduct, intensity, fragmentType, tail):
       self.tail = tail
       super().__init__(lipid, adduct, intensity, fragmentType)
+  def cacheKey(self):
+    return (self.tail.type, self.tail.name, self.tail.mass)
   def MZ(self):
     return self.tail.mass + 135.992544 - masses['H+']
   def Formula(self):
-    formula = Counter(self.tail.formula)
+    formula = Formula(self.tail.formula)
     formula.update({'C':3, 'H':4, 'O':4, 'P':1})
     return formula
   def Charge(self):
@@ -4367,10 +4541,12 @@ class C3H7O5P_FAx(Fragment):
   def __init__(self, lipid, adduct, intensity, fragmentType, tail):
       self.tail = tail
       super().__init__(lipid, adduct, intensity, fragmentType)
+  def cacheKey(self):
+    return (self.tail.type, self.tail.name, self.tail.mass)
   def MZ(self):
     return self.tail.mass + 154.003109 - masses['H+']
   def Formula(self):
-    formula = Counter(self.tail.formula)
+    formula = Formula(self.tail.formula)
     formula.update({'C':3, 'H':6, 'O':5, 'P':1})
     return formula
   def Charge(self):
@@ -4387,7 +4563,7 @@ class C11H19N2O2S_FA(Fragment):
   def MZ(self):
     return self.lipid.tails[0].mass + 243.116175
   def Formula(self):
-    formula = Counter(self.lipid.tails[0].formula)
+    formula = Formula(self.lipid.tails[0].formula)
     formula.update({'C':11, 'H':19, 'N':2, 'O':2, 'S':1})
     return formula
   def Charge(self):
@@ -4411,10 +4587,12 @@ class C3H7O2_FA_s_H2Ox(Fragment):
   def __init__(self, lipid, adduct, intensity, fragmentType, tail):
       self.tail = tail
       super().__init__(lipid, adduct, intensity, fragmentType)
+  def cacheKey(self):
+    return (self.tail.type, self.tail.name, self.tail.mass)
   def MZ(self):
     return self.tail.mass + 74.036779 -masses["H2O"] + masses['H+']
   def Formula(self):
-    formula = Counter(self.tail.formula)
+    formula = Formula(self.tail.formula)
     formula.update({'C':3, 'H':5, 'O':1})
     return formula
   def Charge(self):
@@ -4450,13 +4628,15 @@ class FAkHx(Fragment):
   def __init__(self, lipid, adduct, intensity, fragmentType, tail):
     self.tail = tail
     super().__init__(lipid, adduct, intensity, fragmentType)
+  def cacheKey(self):
+    return (self.tail.type, self.tail.name, self.tail.mass)
   def MZ(self):
     if adducts[self.adduct][1] == 'Positive':
       return self.tail.mass - masses['H2O'] + masses['H+']
     else:
       return self.tail.mass - masses['H2O'] - masses['H+']
   def Formula(self):
-    formula = Counter(self.tail.formula)
+    formula = Formula(self.tail.formula)
     if adducts[self.adduct][1] == 'Positive':
       formula.subtract({'H':1, 'O':1})
       return formula
@@ -4488,10 +4668,12 @@ class FAkAx(Fragment):
   def __init__(self, lipid, adduct, intensity, fragmentType, tail):
       self.tail = tail
       super().__init__(lipid, adduct, intensity, fragmentType)
+  def cacheKey(self):
+    return (self.tail.type, self.tail.name, self.tail.mass)
   def MZ(self):
     return (self.tail.mass - masses['H2O'] + adducts[self.adduct][0])/abs(adducts[self.adduct][2])
   def Formula(self):
-    formula = Counter(self.tail.formula)
+    formula = Formula(self.tail.formula)
     formula.subtract({'H':2, 'O':1})
     formula.update(adducts[self.adduct][3])
     return formula
@@ -4514,7 +4696,7 @@ class Cer_B(Fragment):
     else:
       return (self.lipid.tails[0].mass - masses['H2O'] + masses['NH3'] - masses['H+'])
   def Formula(self):
-    formula = Counter(self.lipid.tails[0].formula)
+    formula = Formula(self.lipid.tails[0].formula)
     if adducts[self.adduct][1] == 'Positive':
       formula.update({'N':1, 'H':2, 'O':-1})
     else:
@@ -4560,7 +4742,7 @@ class Cer_C(Fragment):
     else:
       return (self.lipid.tails[0].mass - 32.026214784 - masses['H2O'] + masses['NH3'] - masses['H+'])
   def Formula(self):
-    formula = Counter(self.lipid.tails[0].formula)
+    formula = Formula(self.lipid.tails[0].formula)
     if adducts[self.adduct][1] == 'Positive':
       formula.update({'N':1, 'C':-1, 'H':-2, 'O':-2})
     else:
@@ -4586,7 +4768,7 @@ class Cer_D(Fragment):
     else:
       return (self.lipid.tails[0].mass - 48.021129 - masses['H2O'] + masses['NH3'] - masses['H+'])
   def Formula(self):
-    formula = Counter(self.lipid.tails[0].formula)
+    formula = Formula(self.lipid.tails[0].formula)
     if adducts[self.adduct][1] == 'Positive':
       formula.update({'N':1, 'C':-1, 'H':-2, 'O':-3})
     else:
@@ -4612,7 +4794,7 @@ class Cer_P(Fragment):
     else:
       return (self.lipid.tails[0].mass - 62.036779432 - masses['H+'])
   def Formula(self):
-    formula = Counter(self.lipid.tails[0].formula)
+    formula = Formula(self.lipid.tails[0].formula)
     if adducts[self.adduct][1] == 'Positive':
       formula.subtract({'C':2, 'H':5, 'O':2})
     else:
@@ -4635,7 +4817,7 @@ class Cer_Q(Fragment):
   def MZ(self):
     return (self.lipid.tails[0].mass - 92.047344116 - masses['H+'])
   def Formula(self):
-    formula = Counter(self.lipid.tails[0].formula)
+    formula = Formula(self.lipid.tails[0].formula)
     formula.subtract({'C':3, 'H':8, 'O':3})
     return formula
   def Charge(self):
@@ -4657,7 +4839,7 @@ class Cer_R(Fragment):
     else:
       return (self.lipid.tails[0].mass - 2*masses['H2O'] - masses['H+'])
   def Formula(self):
-    formula = Counter(self.lipid.tails[0].formula)
+    formula = Formula(self.lipid.tails[0].formula)
     if adducts[self.adduct][1] == 'Positive':
       formula.update({'N':1, 'H':-2, 'O':-3})
     else:
@@ -4685,7 +4867,7 @@ class Cer_R_s_H2O(Fragment):
     else:
       return (self.lipid.tails[0].mass - 3*masses['H2O'] - masses['H+'])
   def Formula(self):
-    formula = Counter(self.lipid.tails[0].formula)
+    formula = Formula(self.lipid.tails[0].formula)
     if adducts[self.adduct][1] == 'Positive':
       formula.update({'N':1, 'H':-4, 'O':-4})
     else:
@@ -4709,7 +4891,7 @@ class Cer_Rb(Fragment):
   def MZ(self):
     return (self.lipid.tails[0].mass - 50.036779432 - masses['H+'])
   def Formula(self):
-    formula = Counter(self.lipid.tails[0].formula)
+    formula = Formula(self.lipid.tails[0].formula)
     formula.subtract({'C':1, 'H':7, 'O':2})
     return formula
   def Charge(self):
@@ -4727,7 +4909,7 @@ class Cer_S(Fragment):
   def MZ(self):
     return (self.lipid.tails[1].mass + (59.037113785-masses['H2O']-masses['H+']))
   def Formula(self):
-    formula = Counter(self.lipid.tails[1].formula)
+    formula = Formula(self.lipid.tails[1].formula)
     formula.update({'C':2, 'H':2, 'N':1})
     return formula
   def Charge(self):
@@ -4745,7 +4927,7 @@ class Cer_T(Fragment):
   def MZ(self):
     return (self.lipid.tails[1].mass + (43.042199165-masses['H2O']-masses['H+']))
   def Formula(self):
-    formula = Counter(self.lipid.tails[1].formula)
+    formula = Formula(self.lipid.tails[1].formula)
     formula.update({'C':2, 'H':2, 'N':1, 'O':-1})
     return formula
   def Charge(self):
@@ -4763,7 +4945,7 @@ class FA_C2H3N(Fragment):
   def MZ(self):
     return (self.lipid.tails[1].mass + 41.026549101 - masses['OH-'])
   def Formula(self):
-    formula = Counter(self.lipid.tails[1].formula)
+    formula = Formula(self.lipid.tails[1].formula)
     formula.update({'C':2, 'H':2, 'N':1, 'O':-1})
     return formula
   def Charge(self):
@@ -4789,7 +4971,7 @@ class Cer_U(Fragment):
     else:
       return (self.lipid.tails[1].mass + (masses['NH3']-masses['H2O']-masses['H+']))
   def Formula(self):
-    formula = Counter(self.lipid.tails[1].formula)
+    formula = Formula(self.lipid.tails[1].formula)
     if adducts[self.adduct][1] == 'Positive':
       formula.update({'N':1, 'H':2, 'O':-1})
     else:  
@@ -4816,7 +4998,7 @@ class Cer_W(Fragment):
   def MZ(self):
     return (self.lipid.tails[1].mass + 43.042199165 - masses['H+'])
   def Formula(self):
-    formula = Counter(self.lipid.tails[1].formula)
+    formula = Formula(self.lipid.tails[1].formula)
     formula.update({'C':2, 'H':4, 'N':1})
     return formula
   def Charge(self):
@@ -4834,7 +5016,7 @@ class Cer_X(Fragment):
   def MZ(self):
     return (self.lipid.tails[1].mass + 55.042199165 - masses['H+'])
   def Formula(self):
-    formula = Counter(self.lipid.tails[1].formula)
+    formula = Formula(self.lipid.tails[1].formula)
     formula.update({'C':3, 'H':4, 'N':1})
     return formula
   def Charge(self):
@@ -5009,7 +5191,7 @@ class MH_PO4_s_HG(MH):
     return comment
   def Validate(self):
     super().Validate()
-    assert Counter({'P':1, 'O':4, 'H':3}) <= self.lipid.formula
+    assert Formula({'P':1, 'O':4, 'H':3}) <= self.lipid.formula
 
 # ~ #  Sometimes the headgroup leaves a phosphate and glycerol behind
 
@@ -5038,7 +5220,7 @@ class MH_PG_s_HG(MH):
     return comment
   def Validate(self):
     super().Validate()
-    assert Counter({'P':1, 'O':6, 'H':9, 'C':3}) <= self.lipid.formula
+    assert Formula({'P':1, 'O':6, 'H':9, 'C':3}) <= self.lipid.formula
 
 class MA_P2O6_s_HG(MA):
   '''[ MA - Headgroup + P2O6 ]\n
@@ -5066,7 +5248,7 @@ class MA_P2O6_s_HG(MA):
     return comment
   def Validate(self):
     super().Validate()
-    assert Counter({'P':2, 'O':6, 'H':2}) <= self.headgroup.formula
+    assert Formula({'P':2, 'O':6, 'H':2}) <= self.headgroup.formula
 
 def MA_P2O6_s_HG_FA(lipid, adduct, intensity):
   '''[ MA - Headgroup + H2O - (ROOH) ]\n
@@ -5150,7 +5332,7 @@ class MH_P2O6_s_HG(MH):  # Headgroup neutral loss
   def Validate(self):
     super().Validate()
     assert self.headgroup 
-    assert Counter({'P':2, 'O':6, 'H':2}) <= self.headgroup.formula
+    assert Formula({'P':2, 'O':6, 'H':2}) <= self.headgroup.formula
 
 class MA_PO4_s_HG(MA):
   '''[ MA - Headgroup + PO4 ]\n
@@ -5181,7 +5363,7 @@ class MA_PO4_s_HG(MA):
   def Validate(self):
     super().Validate()
     assert self.headgroup.mass > masses['PO4H3']
-    assert Counter({'P':1, 'O':4, 'H':3}) <= self.headgroup.formula
+    assert Formula({'P':1, 'O':4, 'H':3}) <= self.headgroup.formula
 
 
 class MA_C3H8O8P2_s_HG(MA):
@@ -5209,7 +5391,7 @@ class MA_C3H8O8P2_s_HG(MA):
     return comment
   def Validate(self):
     super().Validate()
-    assert Counter({'C':3, 'H':8, 'O':8, 'P':2}) <= self.headgroup.formula
+    assert Formula({'C':3, 'H':8, 'O':8, 'P':2}) <= self.headgroup.formula
 
 class MH_PO4_s_HG_H2O(MH_PO4_s_HG):
   '''[ M(+/-)H - Headgroup - H2O + PO4 ]\n
@@ -5528,7 +5710,7 @@ class HGA(Fragment):  # Headgroup + Adduct
   def MZ(self):
     return (self.headgroup.mass + adducts[self.adduct][0])/abs(adducts[self.adduct][2])
   def Formula(self):
-    formula = Counter(self.headgroup.formula)
+    formula = Formula(self.headgroup.formula)
     formula.update(adducts[self.adduct][3])
     return formula
   def Charge(self):
@@ -5556,6 +5738,8 @@ class HGA_FA_s_H2Ox(HGA):
   def __init__(self, lipid, adduct, intensity, fragmentType, tail):
       self.tail = tail
       super().__init__(lipid, adduct, intensity, fragmentType)
+  def cacheKey(self):
+    return (self.headgroup.mass, self.tail.type, self.tail.name, self.tail.mass)
   def MZ(self):
     return super().MZ() + (self.tail.mass/abs(adducts[self.adduct][2])) - (masses['H2O']/abs(adducts[self.adduct][2]))
   def Formula(self):
@@ -5580,6 +5764,8 @@ class HGA_FA_s_PO4x(HGA):
   def __init__(self, lipid, adduct, intensity, fragmentType, tail):
       self.tail = tail
       super().__init__(lipid, adduct, intensity, fragmentType)
+  def cacheKey(self):
+    return (self.headgroup.mass, self.tail.type, self.tail.name, self.tail.mass)
   def MZ(self):
     return super().MZ() + (self.tail.mass/abs(adducts[self.adduct][2])) - (masses['PO4H3'])/abs(adducts[self.adduct][2])
   def Formula(self):
@@ -5604,6 +5790,8 @@ class HGA_FA_s_H2O_PO4x(HGA):
   def __init__(self, lipid, adduct, intensity, fragmentType, tail):
       self.tail = tail
       super().__init__(lipid, adduct, intensity, fragmentType)
+  def cacheKey(self):
+    return (self.headgroup.mass, self.tail.type, self.tail.name, self.tail.mass)
   def MZ(self):
     return super().MZ() + (self.tail.mass/abs(adducts[self.adduct][2])) - (masses['H2O']/abs(adducts[self.adduct][2]))  - (masses['PO4H3'])/abs(adducts[self.adduct][2])
   def Formula(self):
@@ -5624,14 +5812,14 @@ class HGA_s_H2O(HGA):  # Headgroup + Adduct - H2O
   def MZ(self):
     return super().MZ() - (masses['H2O'])/abs(adducts[self.adduct][2])
   def Formula(self):
-    formula = Counter(self.headgroup.formula)
+    formula = Formula(self.headgroup.formula)
     formula.subtract({'H':2, 'O':1})
     return formula
   def Charge(self):
     return adducts[self.adduct][2]
   def Comment(self):
     comment = self.adduct
-    chnops = Counter(self.headgroup.formula)
+    chnops = Formula(self.headgroup.formula)
     chnops.subtract({'H':2, 'O':1})
     new_chnops = {k: v for k, v in chnops.items() if v != 0}
     headgroup = ''.join(''.join((key, str(val))) for (key, val) in new_chnops.items())
@@ -5639,20 +5827,20 @@ class HGA_s_H2O(HGA):  # Headgroup + Adduct - H2O
     return comment
   def Validate(self):
     super().Validate()
-    assert Counter({'H':2, 'O':1}) <= super().Formula()
+    assert Formula({'H':2, 'O':1}) <= super().Formula()
 
 class HGA_s_2H2O(HGA):  # Headgroup + Adduct - H2O
   def MZ(self):
     return super().MZ() - (2*masses['H2O'])/abs(adducts[self.adduct][2])
   def Formula(self):
-    formula = Counter(self.headgroup.formula)
+    formula = Formula(self.headgroup.formula)
     formula.subtract({'H':4, 'O':2})
     return formula
   def Charge(self):
     return adducts[self.adduct][2]
   def Comment(self):
     comment = self.adduct
-    chnops = Counter(self.headgroup.formula)
+    chnops = Formula(self.headgroup.formula)
     chnops.subtract({'H':4, 'O':2})
     new_chnops = {k: v for k, v in chnops.items() if v != 0}
     headgroup = ''.join(''.join((key, str(val))) for (key, val) in new_chnops.items())
@@ -5660,7 +5848,7 @@ class HGA_s_2H2O(HGA):  # Headgroup + Adduct - H2O
     return comment
   def Validate(self):
     super().Validate()
-    assert Counter({'H':4, 'O':2}) <= super().Formula()
+    assert Formula({'H':4, 'O':2}) <= super().Formula()
 
 class HGA_s_PO3(HGA):  # Headgroup + Adduct - H2O
   def MZ(self):
@@ -5673,7 +5861,7 @@ class HGA_s_PO3(HGA):  # Headgroup + Adduct - H2O
     return super().Charge()
   def Comment(self):
     comment = self.adduct
-    chnops = Counter(self.headgroup.formula)
+    chnops = Formula(self.headgroup.formula)
     chnops.subtract({'H':2, 'P':1, 'O':3})
     new_chnops = {k: v for k, v in chnops.items() if v != 0}
     headgroup = ''.join(''.join((key, str(val))) for (key, val) in new_chnops.items())
@@ -5681,7 +5869,7 @@ class HGA_s_PO3(HGA):  # Headgroup + Adduct - H2O
     return comment
   def Validate(self):
     super().Validate()
-    assert Counter({'H':1, 'P':1, 'O':3}) <= super().Formula()
+    assert Formula({'H':1, 'P':1, 'O':3}) <= super().Formula()
 
 class HGA_s_PO4(HGA):  # Headgroup + Adduct - H2O
   def MZ(self):
@@ -5694,7 +5882,7 @@ class HGA_s_PO4(HGA):  # Headgroup + Adduct - H2O
     return super().Charge()
   def Comment(self):
     comment = self.adduct
-    chnops = Counter(self.headgroup.formula)
+    chnops = Formula(self.headgroup.formula)
     chnops.subtract({'H':3, 'P':1, 'O':4})
     new_chnops = {k: v for k, v in chnops.items() if v != 0}
     headgroup = ''.join(''.join((key, str(val))) for (key, val) in new_chnops.items())
@@ -5702,7 +5890,7 @@ class HGA_s_PO4(HGA):  # Headgroup + Adduct - H2O
     return comment
   def Validate(self):
     super().Validate()
-    assert Counter({'H':3, 'P':1, 'O':4}) <= super().Formula()
+    assert Formula({'H':3, 'P':1, 'O':4}) <= super().Formula()
 
 class HGA_s_PO4_H2O(HGA_s_PO4):  # Headgroup + Adduct - H2O
   def MZ(self):
@@ -5715,7 +5903,7 @@ class HGA_s_PO4_H2O(HGA_s_PO4):  # Headgroup + Adduct - H2O
     return super().Charge()
   def Comment(self):
     comment = self.adduct
-    chnops = Counter(self.headgroup.formula)
+    chnops = Formula(self.headgroup.formula)
     chnops.subtract({'H':5, 'P':1, 'O':5})
     new_chnops = {k: v for k, v in chnops.items() if v != 0}
     headgroup = ''.join(''.join((key, str(val))) for (key, val) in new_chnops.items())
@@ -5723,28 +5911,28 @@ class HGA_s_PO4_H2O(HGA_s_PO4):  # Headgroup + Adduct - H2O
     return comment
   def Validate(self):
     super().Validate()
-    assert Counter({'H':5, 'P':1, 'O':5}) <= self.headgroup.formula
+    assert Formula({'H':5, 'P':1, 'O':5}) <= self.headgroup.formula
 
 class HGA_s_PG(HGA):  # Headgroup + Adduct - H2O
   def MZ(self):
     return super().MZ() - (masses['PO4H3'])/abs(adducts[self.adduct][2]) - (masses['Glycerol']-masses['H2O'])/abs(adducts[self.adduct][2])
   def Formula(self):
     formula = super().Formula()
-    formula.subtract({'C':3, '9':3, 'P':1, 'O':6})
+    formula.subtract({'C':3, 'H':9, 'P':1, 'O':6})
     return formula
   def Charge(self):
     return super().Charge()
   def Comment(self):
     comment = self.adduct
-    chnops = Counter(self.headgroup.formula)
-    chnops.subtract({'C':3, '9':3, 'P':1, 'O':6})
+    chnops = Formula(self.headgroup.formula)
+    chnops.subtract({'C':3, 'H':9, 'P':1, 'O':6})
     new_chnops = {k: v for k, v in chnops.items() if v != 0}
     headgroup = ''.join(''.join((key, str(val))) for (key, val) in new_chnops.items())
     comment = comment.replace('M', headgroup)
     return comment
   def Validate(self):
     super().Validate()
-    assert Counter({'C':3, '9':3, 'P':1, 'O':6}) <= super().Formula()
+    assert Formula({'C':3, 'H':9, 'P':1, 'O':6}) <= super().Formula()
 
 class HGH(Fragment):  # Headgroup + Adduct
   def __init__(self, lipid, adduct, intensity, fragmentType=None):
@@ -5758,7 +5946,7 @@ class HGH(Fragment):  # Headgroup + Adduct
     else:
       return (self.headgroup.mass - masses['H+'])
   def Formula(self):
-    formula = Counter(self.headgroup.formula)
+    formula = Formula(self.headgroup.formula)
     if adducts[self.adduct][1] == 'Positive':
       formula.update({'H':1})
     else:
@@ -5795,7 +5983,7 @@ class HGH_s_H2O(HGH):  # Headgroup + Adduct - H2O
       comment = '[M+H]+'
     else:
       comment = '[M-H]-'
-    chnops = Counter(self.headgroup.formula)
+    chnops = Formula(self.headgroup.formula)
     chnops.subtract({'H':2, 'O':1})
     new_chnops = {k: v for k, v in chnops.items() if v != 0}
     headgroup = ''.join(''.join((key, str(val))) for (key, val) in new_chnops.items())
@@ -5803,7 +5991,7 @@ class HGH_s_H2O(HGH):  # Headgroup + Adduct - H2O
     return comment
   def Validate(self):
     super().Validate()
-    assert Counter({'H':2, 'O':1}) <= super().Formula()
+    assert Formula({'H':2, 'O':1}) <= super().Formula()
 
 class HGH_s_PO3(HGH):  # Headgroup + Adduct - H2O
   def MZ(self):
@@ -5819,7 +6007,7 @@ class HGH_s_PO3(HGH):  # Headgroup + Adduct - H2O
       comment = '[M+H]+'
     else:
       comment = '[M-H]-'
-    chnops = Counter(self.headgroup.formula)
+    chnops = Formula(self.headgroup.formula)
     chnops.subtract({'H':2, 'P':1, 'O':3})
     new_chnops = {k: v for k, v in chnops.items() if v != 0}
     headgroup = ''.join(''.join((key, str(val))) for (key, val) in new_chnops.items())
@@ -5827,7 +6015,7 @@ class HGH_s_PO3(HGH):  # Headgroup + Adduct - H2O
     return comment
   def Validate(self):
     super().Validate()
-    assert Counter({'H':1, 'P':1, 'O':3}) <= super().Formula()
+    assert Formula({'H':1, 'P':1, 'O':3}) <= super().Formula()
 
 class HGH_s_PO4(HGH):  # Headgroup + Adduct - H2O
   def MZ(self):
@@ -5843,7 +6031,7 @@ class HGH_s_PO4(HGH):  # Headgroup + Adduct - H2O
       comment = '[M+H]+'
     else:
       comment = '[M-H]-'
-    chnops = Counter(self.headgroup.formula)
+    chnops = Formula(self.headgroup.formula)
     chnops.subtract({'H':3, 'P':1, 'O':4})
     new_chnops = {k: v for k, v in chnops.items() if v != 0}
     headgroup = ''.join(''.join((key, str(val))) for (key, val) in new_chnops.items())
@@ -5851,7 +6039,7 @@ class HGH_s_PO4(HGH):  # Headgroup + Adduct - H2O
     return comment
   def Validate(self):
     super().Validate()
-    assert Counter({'H':3, 'P':1, 'O':4}) <= super().Formula()
+    assert Formula({'H':3, 'P':1, 'O':4}) <= super().Formula()
 
 class HGH_s_PO4_H2O(HGH_s_PO4):  # Headgroup + Adduct - H2O
   def MZ(self):
@@ -5867,7 +6055,7 @@ class HGH_s_PO4_H2O(HGH_s_PO4):  # Headgroup + Adduct - H2O
       comment = '[M+H]+'
     else:
       comment = '[M-H]-'
-    chnops = Counter(self.headgroup.formula)
+    chnops = Formula(self.headgroup.formula)
     chnops.subtract({'H':5, 'P':1, 'O':5})
     new_chnops = {k: v for k, v in chnops.items() if v != 0}
     headgroup = ''.join(''.join((key, str(val))) for (key, val) in new_chnops.items())
@@ -5875,7 +6063,7 @@ class HGH_s_PO4_H2O(HGH_s_PO4):  # Headgroup + Adduct - H2O
     return comment
   def Validate(self):
     super().Validate()
-    assert Counter({'H':5, 'P':1, 'O':5}) <= self.headgroup.formula
+    assert Formula({'H':5, 'P':1, 'O':5}) <= self.headgroup.formula
 
 # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ # ~ #
 
@@ -5887,7 +6075,7 @@ class C10H16N5O10P2(Fragment):
   def MZ(self):
       return 428.03669
   def Formula(self):
-    formula = Counter({'C':10, 'H':16, 'N':5, 'O':10, 'P':2,})
+    formula = Formula({'C':10, 'H':16, 'N':5, 'O':10, 'P':2,})
     return formula
   def Charge(self):
       return 1
@@ -5903,7 +6091,7 @@ class C15H27O13(Fragment):
   def MZ(self):
       return 415.145715
   def Formula(self):
-    formula = Counter({'C':15, 'H':27, 'O':13})
+    formula = Formula({'C':15, 'H':27, 'O':13})
     return formula
   def Charge(self):
       return -1
@@ -5919,7 +6107,7 @@ class C15H25O12(Fragment):
   def MZ(self):
       return 397.13515
   def Formula(self):
-    formula = Counter({'C':15, 'H':25, 'O':12})
+    formula = Formula({'C':15, 'H':25, 'O':12})
     return formula
   def Charge(self):
       return -1
@@ -5935,7 +6123,7 @@ class C15H23O11(Fragment):
   def MZ(self):
       return 379.124585
   def Formula(self):
-    formula = Counter({'C':15, 'H':23, 'O':11})
+    formula = Formula({'C':15, 'H':23, 'O':11})
     return formula
   def Charge(self):
       return -1
@@ -5951,7 +6139,7 @@ class C6H10NaO11P2(Fragment):
   def MZ(self):
     return 342.960152
   def Formula(self):
-    formula = Counter({'C':6, 'H':10, 'Na':1, 'O':11, 'P':2})
+    formula = Formula({'C':6, 'H':10, 'Na':1, 'O':11, 'P':2})
     return formula
   def Charge(self):
       return -1
@@ -5967,7 +6155,7 @@ class C6H8NaO10P2(Fragment):
   def MZ(self):
     return 324.949587
   def Formula(self):
-    formula = Counter({'C':6, 'H':8, 'Na':1, 'O':10, 'P':2})
+    formula = Formula({'C':6, 'H':8, 'Na':1, 'O':10, 'P':2})
     return formula
   def Charge(self):
       return -1
@@ -5983,7 +6171,7 @@ class C6H11O11P2(Fragment):
   def MZ(self):
     return 320.978207
   def Formula(self):
-    formula = Counter({'C':6, 'H':11, 'O':11, 'P':2})
+    formula = Formula({'C':6, 'H':11, 'O':11, 'P':2})
     return formula
   def Charge(self):
       return -1
@@ -5999,7 +6187,7 @@ class C9H16O10P(Fragment):
   def MZ(self):
     return 315.048656
   def Formula(self):
-    formula = Counter({'C':9, 'H':16, 'O':10, 'P':1})
+    formula = Formula({'C':9, 'H':16, 'O':10, 'P':1})
     return formula
   def Charge(self):
       return -1
@@ -6015,7 +6203,7 @@ class C6H9O10P2(Fragment):
   def MZ(self):
     return 302.967642
   def Formula(self):
-    formula = Counter({'C':6, 'H':9, 'O':10, 'P':2})
+    formula = Formula({'C':6, 'H':9, 'O':10, 'P':2})
     return formula
   def Charge(self):
       return -1
@@ -6031,7 +6219,7 @@ class C9H14O9P(Fragment):
   def MZ(self):
     return 297.038092
   def Formula(self):
-    formula = Counter({'C':9, 'H':14, 'O':9, 'P':1})
+    formula = Formula({'C':9, 'H':14, 'O':9, 'P':1})
     return formula
   def Charge(self):
       return -1
@@ -6047,7 +6235,7 @@ class C5H7O9P2(Fragment):
   def MZ(self):
     return 272.957077
   def Formula(self):
-    formula = Counter({'C':5, 'H':7, 'O':9, 'P':2})
+    formula = Formula({'C':5, 'H':7, 'O':9, 'P':2})
     return formula
   def Charge(self):
       return -1
@@ -6063,7 +6251,7 @@ class C6H12O9P(Fragment):
   def MZ(self):
     return 259.022442
   def Formula(self):
-    formula = Counter({'C':6, 'H':12, 'O':9, 'P':1})
+    formula = Formula({'C':6, 'H':12, 'O':9, 'P':1})
     return formula
   def Charge(self):
       return -1
@@ -6079,7 +6267,7 @@ class C9H13O8(Fragment):
   def MZ(self):
     return 249.061591
   def Formula(self):
-    formula = Counter({'C':9, 'H':13, 'O':8})
+    formula = Formula({'C':9, 'H':13, 'O':8})
     return formula
   def Charge(self):
       return -1
@@ -6095,7 +6283,7 @@ class C6H10O8P(Fragment):
   def MZ(self):
     return 241.011876845
   def Formula(self):
-    formula = Counter({'C':6, 'H':10, 'O':8, 'P':1})
+    formula = Formula({'C':6, 'H':10, 'O':8, 'P':1})
     return formula
   def Charge(self):
       return -1
@@ -6111,7 +6299,7 @@ class C6H9O8S(Fragment):
   def MZ(self):
     return 241.002360812
   def Formula(self):
-    formula = Counter({'C':6, 'H':9, 'O':8, 'S':1})
+    formula = Formula({'C':6, 'H':9, 'O':8, 'S':1})
     return formula
   def Charge(self):
       return -1
@@ -6127,7 +6315,7 @@ class C9H15O7(Fragment):
   def MZ(self):
       return 235.082326
   def Formula(self):
-    formula = Counter({'C':9, 'H':15, 'O':7})
+    formula = Formula({'C':9, 'H':15, 'O':7})
     return formula
   def Charge(self):
       return -1
@@ -6143,7 +6331,7 @@ class C6H12O7P(Fragment):
   def MZ(self):
       return 227.032612
   def Formula(self):
-    formula = Counter({'C':6, 'H':12, 'O':7, 'P':1})
+    formula = Formula({'C':6, 'H':12, 'O':7, 'P':1})
     return formula
   def Charge(self):
       return -1
@@ -6159,7 +6347,7 @@ class C6H9O7S(Fragment):
   def MZ(self):
       return 225.007446
   def Formula(self):
-    formula = Counter({'C':6, 'H':9, 'O':7, 'S':1})
+    formula = Formula({'C':6, 'H':9, 'O':7, 'S':1})
     return formula
   def Charge(self):
       return -1
@@ -6175,7 +6363,7 @@ class C6H8O7P(Fragment):
   def MZ(self):
     return 223.001312
   def Formula(self):
-    formula = Counter({'C':6, 'H':8, 'O':7, 'P':1})
+    formula = Formula({'C':6, 'H':8, 'O':7, 'P':1})
     return formula
   def Charge(self):
       return -1
@@ -6191,7 +6379,7 @@ class C3H5O7P2(Fragment):
   def MZ(self):
     return 214.951598
   def Formula(self):
-    formula = Counter({'C':3, 'H':5, 'O':7, 'P':2})
+    formula = Formula({'C':3, 'H':5, 'O':7, 'P':2})
     return formula
   def Charge(self):
       return -1
@@ -6207,7 +6395,7 @@ class C5H11NO5P(Fragment):
   def MZ(self):
       return 196.038032
   def Formula(self):
-    formula = Counter({'C':5, 'H':11, 'N':1, 'O':5, 'P':1})
+    formula = Formula({'C':5, 'H':11, 'N':1, 'O':5, 'P':1})
     return formula
   def Charge(self):
       return -1
@@ -6223,7 +6411,7 @@ class C3H7NaO6P(Fragment):
   def MZ(self):
     return 192.988343
   def Formula(self):
-    formula = Counter({'C':3, 'H':7, 'Na':1, 'O':6, 'P':1})
+    formula = Formula({'C':3, 'H':7, 'Na':1, 'O':6, 'P':1})
     return formula
   def Charge(self):
       return -1
@@ -6239,7 +6427,7 @@ class C4H10O6P(Fragment):
   def MZ(self):
       return 185.022048
   def Formula(self):
-    formula = Counter({'C':4, 'H':10, 'O':6, 'P':1})
+    formula = Formula({'C':4, 'H':10, 'O':6, 'P':1})
     return formula
   def Charge(self):
       return -1
@@ -6255,7 +6443,7 @@ class C5H15NO4P(Fragment):
   def MZ(self):
     return 184.0733204
   def Formula(self):
-    formula = Counter({'C':5, 'H':15, 'N':1, 'O':4, 'P':1})
+    formula = Formula({'C':5, 'H':15, 'N':1, 'O':4, 'P':1})
     return formula
   def Charge(self):
       return 1
@@ -6271,7 +6459,7 @@ class C3H8O6P(Fragment):
   def MZ(self):
     return 171.006397541
   def Formula(self):
-    formula = Counter({'C':3, 'H':8, 'O':6, 'P':1})
+    formula = Formula({'C':3, 'H':8, 'O':6, 'P':1})
     return formula
   def Charge(self):
       return -1
@@ -6287,7 +6475,7 @@ class C4H13NO4P(Fragment):
   def MZ(self):
       return 170.05767
   def Formula(self):
-    formula = Counter({'C':4,'H':13,'N':1, 'O':4, 'P':1})
+    formula = Formula({'C':4,'H':13,'N':1, 'O':4, 'P':1})
     return formula
   def Charge(self):
       return 1
@@ -6303,7 +6491,7 @@ class C4H11NO4P(Fragment):
   def MZ(self):
       return 168.043117
   def Formula(self):
-    formula = Counter({'C':4, 'H':11, 'N':1, 'O':4, 'P':1})
+    formula = Formula({'C':4, 'H':11, 'N':1, 'O':4, 'P':1})
     return formula
   def Charge(self):
       return -1
@@ -6319,7 +6507,7 @@ class C4H8O5P(Fragment):
   def MZ(self):
       return 167.011483
   def Formula(self):
-    formula = Counter({'C':4, 'H':8, 'O':5, 'P':1})
+    formula = Formula({'C':4, 'H':8, 'O':5, 'P':1})
     return formula
   def Charge(self):
       return -1
@@ -6335,7 +6523,7 @@ class HO6P2(Fragment):
   def MZ(self):
       return 158.925383317
   def Formula(self):
-    formula = Counter({'H':1, 'O':6, 'P':2})
+    formula = Formula({'H':1, 'O':6, 'P':2})
     return formula
   def Charge(self):
       return -1
@@ -6351,7 +6539,7 @@ class C3H11NO4P(Fragment):
   def MZ(self):
       return 156.04202
   def Formula(self):
-    formula = Counter({'C':3,'H':11,'N':1, 'O':4, 'P':1})
+    formula = Formula({'C':3,'H':11,'N':1, 'O':4, 'P':1})
     return formula
   def Charge(self):
       return 1
@@ -6367,7 +6555,7 @@ class C3H6O5P(Fragment):
   def MZ(self):
     return 152.995832857
   def Formula(self):
-    formula = Counter({'C':3, 'H':6, 'O':5, 'P':1})
+    formula = Formula({'C':3, 'H':6, 'O':5, 'P':1})
     return formula
   def Charge(self):
       return -1
@@ -6383,7 +6571,7 @@ class C2H5NaO4P(Fragment):
   def MZ(self):
     return 146.981766
   def Formula(self):
-    formula = Counter({'C':2, 'H':5, 'Na':1, 'O':4, 'P':1})
+    formula = Formula({'C':2, 'H':5, 'Na':1, 'O':4, 'P':1})
     return formula
   def Charge(self):
       return 1
@@ -6399,7 +6587,7 @@ class C7H14N1O2(Fragment):
   def MZ(self):
     return 144.101905128
   def Formula(self):
-    formula = Counter({'C':7, 'H':14, 'N':1, 'O':2})
+    formula = Formula({'C':7, 'H':14, 'N':1, 'O':2})
     return formula
   def Charge(self):
       return 1
@@ -6415,7 +6603,7 @@ class C2H7NO4P(Fragment):
   def MZ(self):
       return 140.011817274
   def Formula(self):
-    formula = Counter({'C':2, 'H':7, 'N':1, 'O':4, 'P':1})
+    formula = Formula({'C':2, 'H':7, 'N':1, 'O':4, 'P':1})
     return formula
   def Charge(self):
       return -1
@@ -6431,7 +6619,7 @@ class C6H14NO2(Fragment):
   def MZ(self):
     return 132.101905
   def Formula(self):
-    formula = Counter({'C':6, 'H':14, 'N':1, 'O':2})
+    formula = Formula({'C':6, 'H':14, 'N':1, 'O':2})
     return formula
   def Charge(self):
       return 1
@@ -6447,7 +6635,7 @@ class C6H5O3(Fragment):
   def MZ(self):
       return 125.024418
   def Formula(self):
-    formula = Counter({'C':6, 'H':5, 'O':3})
+    formula = Formula({'C':6, 'H':5, 'O':3})
     return formula
   def Charge(self):
       return -1
@@ -6463,7 +6651,7 @@ class C2H6O4P(Fragment):
   def MZ(self):
     return 124.999821
   def Formula(self):
-    formula = Counter({'C':2, 'H':6, 'O':4, 'P':1})
+    formula = Formula({'C':2, 'H':6, 'O':4, 'P':1})
     return formula
   def Charge(self):
       return 1
@@ -6479,7 +6667,7 @@ class C2H4O4P(Fragment):
   def MZ(self):
       return 122.985268
   def Formula(self):
-    formula = Counter({'C':2, 'H':4, 'O':4, 'P':1})
+    formula = Formula({'C':2, 'H':4, 'O':4, 'P':1})
     return formula
   def Charge(self):
       return -1
@@ -6495,7 +6683,7 @@ class CH4O4P(Fragment):
   def MZ(self):
       return 110.985268
   def Formula(self):
-    formula = Counter({'C':1, 'H':4, 'O':4, 'P':1})
+    formula = Formula({'C':1, 'H':4, 'O':4, 'P':1})
     return formula
   def Charge(self):
       return -1
@@ -6511,7 +6699,7 @@ class C5H14NO(Fragment):
   def MZ(self):
     return 104.10699
   def Formula(self):
-    formula = Counter({'C':5, 'H':14, 'N':1, 'O':1})
+    formula = Formula({'C':5, 'H':14, 'N':1, 'O':1})
     return formula
   def Charge(self):
       return 1
@@ -6527,7 +6715,7 @@ class H2O4P(Fragment):
   def MZ(self):
       return 96.969618109
   def Formula(self):
-    formula = Counter({'H':2, 'O':4, 'P':1})
+    formula = Formula({'H':2, 'O':4, 'P':1})
     return formula
   def Charge(self):
       return -1
@@ -6543,7 +6731,7 @@ class C5H5O2(Fragment):
   def MZ(self):
       return 97.028406
   def Formula(self):
-    formula = Counter({'C':5, 'H':5, 'O':2})
+    formula = Formula({'C':5, 'H':5, 'O':2})
     return formula
   def Charge(self):
       return 1
@@ -6559,7 +6747,7 @@ class O4SH(Fragment):
   def MZ(self):
       return 96.960102077
   def Formula(self):
-    formula = Counter({'H':1, 'O':4, 'S':1})
+    formula = Formula({'H':1, 'O':4, 'S':1})
     return formula
   def Charge(self):
       return -1
@@ -6575,7 +6763,7 @@ class C5H12N(Fragment):
   def MZ(self):
     return 86.096426
   def Formula(self):
-    formula = Counter({'C':5, 'H':12, 'N':1})
+    formula = Formula({'C':5, 'H':12, 'N':1})
     return formula
   def Charge(self):
       return 1
@@ -6591,7 +6779,7 @@ class O3SH(Fragment):
   def MZ(self):
       return 80.965187457
   def Formula(self):
-    formula = Counter({'H':1, 'O':3, 'S':1})
+    formula = Formula({'H':1, 'O':3, 'S':1})
     return formula
   def Charge(self):
       return -1
@@ -6607,7 +6795,7 @@ class O3P(Fragment):
   def MZ(self):
       return 78.959053425
   def Formula(self):
-    formula = Counter({'O':3, 'P':1})
+    formula = Formula({'O':3, 'P':1})
     return formula
   def Charge(self):
       return -1
@@ -6624,7 +6812,7 @@ class H2O2P(Fragment):
   def MZ(self):
       return 64.979789
   def Formula(self):
-    formula = Counter({'H':2, 'O':2, 'P':1})
+    formula = Formula({'H':2, 'O':2, 'P':1})
     return formula
   def Charge(self):
       return -1
@@ -6640,7 +6828,7 @@ class C2H8NO(Fragment):
   def MZ(self):
     return 62.06004
   def Formula(self):
-    formula = Counter({'C':2, 'H':8, 'N':1, 'O':1})
+    formula = Formula({'C':2, 'H':8, 'N':1, 'O':1})
     return formula
   def Charge(self):
       return 1
@@ -6656,7 +6844,7 @@ class C3H10N(Fragment):
   def MZ(self):
       return 60.080776
   def Formula(self):
-    formula = Counter({'C':3, 'H':10, 'N':1})
+    formula = Formula({'C':3, 'H':10, 'N':1})
     return formula
   def Charge(self):
       return 1
@@ -6672,7 +6860,7 @@ class C2O2H3(Fragment):
   def MZ(self):
       return 59.013853
   def Formula(self):
-    formula = Counter({'C':2, 'O':2, 'H':3})
+    formula = Formula({'C':2, 'O':2, 'H':3})
     return formula
   def Charge(self):
       return -1
@@ -6688,7 +6876,7 @@ class C13H19(Fragment):
   def MZ(self):
       return 175.148127043
   def Formula(self):
-    formula = Counter({'C':13, 'H':19})
+    formula = Formula({'C':13, 'H':19})
     return formula
   def Charge(self):
       return 1
@@ -6704,7 +6892,7 @@ class C12H17(Fragment):
   def MZ(self):
       return 161.132476979
   def Formula(self):
-    formula = Counter({'C':12, 'H':17})
+    formula = Formula({'C':12, 'H':17})
     return formula
   def Charge(self):
       return 1
@@ -6720,7 +6908,7 @@ class C11H15(Fragment):
   def MZ(self):
       return 147.116826915
   def Formula(self):
-    formula = Counter({'C':11, 'H':15})
+    formula = Formula({'C':11, 'H':15})
     return formula
   def Charge(self):
       return 1
@@ -6736,7 +6924,7 @@ class C10H15(Fragment):
   def MZ(self):
       return 135.116826915
   def Formula(self):
-    formula = Counter({'C':10, 'H':15})
+    formula = Formula({'C':10, 'H':15})
     return formula
   def Charge(self):
       return 1
@@ -6754,7 +6942,7 @@ class AsC7H14O4(Fragment):
   def MZ(self):
       return 122.978563
   def Formula(self):
-    formula = Counter({'As':1, 'C':7, 'H':14, 'O':4})
+    formula = Formula({'As':1, 'C':7, 'H':14, 'O':4})
     return formula
   def Charge(self):
       return 1
@@ -6770,7 +6958,7 @@ class AsC2H8O(Fragment):
   def MZ(self):
       return 122.978563
   def Formula(self):
-    formula = Counter({'As':1, 'C':2, 'H':8, 'O':1})
+    formula = Formula({'As':1, 'C':2, 'H':8, 'O':1})
     return formula
   def Charge(self):
       return 1
@@ -6786,7 +6974,7 @@ class AsC2H6(Fragment):
   def MZ(self):
       return 104.967999
   def Formula(self):
-    formula = Counter({'As':1, 'C':2, 'H':6})
+    formula = Formula({'As':1, 'C':2, 'H':6})
     return formula
   def Charge(self):
       return 1
@@ -6802,7 +6990,7 @@ class AsC2H4(Fragment):
   def MZ(self):
       return 102.952349
   def Formula(self):
-    formula = Counter({'As':1, 'C':2, 'H':4})
+    formula = Formula({'As':1, 'C':2, 'H':4})
     return formula
   def Charge(self):
       return 1
@@ -0,0 +1,101 @@
+''' Isotope patterns of molecular formulas.
+
+Each element's isotopologues are enumerated as a chain of binomials, the most abundant
+isotope taking whatever atoms remain, and the elements are then convolved together.
+Every partial probability is at least the probability of any pattern built from it, so
+branches below the threshold are pruned without losing any peak above it.
+
+  isotopeSpectra(Formula({'C':90, 'H':160, 'O':17, 'P':2}), charge=-1)                 # Fine structure
+  isotopeSpectra(Formula({'C':90, 'H':160, 'O':17, 'P':2}), charge=-1, mode='nominal') # M, M+1, M+2...
+
+Both return [[m/z, abundance (%)]], with the most abundant peak at 100%.
+envelope() gives the first nominal peaks of a precursor, cached by formula for whole libraries. '''
+
+import math
+import numpy as np
+from Lipids.GenerateLipids import elements, Formula, FragmentCache
+
+modes = ['fine', 'nominal']
+
+def binomial(n, p, threshold, scale=1):
+  '''(k, scale*P(k)) for k successes in n trials of probability p, where scale*P(k) >= threshold'''
+  if p <= 0: return [(0, scale)]
+  if p >= 1: return [(n, scale)]
+  mode = int((n+1)*p)
+  logMode = math.lgamma(n+1) - math.lgamma(mode+1) - math.lgamma(n-mode+1) + mode*math.log(p) + (n-mode)*math.log1p(-p)
+  pmf = scale*math.exp(logMode)
+  if pmf < threshold: return []
+
+  terms, odds = [(mode, pmf)], p/(1-p)
+  x, k = pmf, mode
+  while k < n: # Walk up from the mode, terms decrease
+    x *= (n-k)/(k+1)*odds
+    k += 1
+    if x < threshold: break
+    terms.append((k, x))
+  x, k = pmf, mode
+  while k > 0: # and down
+    x *= k/((n-k+1)*odds)
+    k -= 1
+    if x < threshold: break
+    terms.append((k, x))
+  return terms
+
+def elementDistribution(element, count, threshold):
+  '''Isotopologues of count atoms of element, as (mass, probability, extra neutrons), each of probability >= threshold'''
+  isotopes = sorted(elements[element], key=lambda isotope: -isotope[1]) # Most abundant takes the remainder
+  major = isotopes[0]
+  distribution = []
+
+  def branch(i, remaining, mass, probability, neutrons, left):
+    if i == len(isotopes):
+      distribution.append((mass + remaining*major[0], probability, neutrons))
+      return
+    isotope = isotopes[i]
+    for k, p in binomial(remaining, isotope[1]/left if left > 0 else 0, threshold, probability):
+      branch(i+1, remaining-k, mass + k*isotope[0], p, neutrons + k*(round(isotope[0])-round(major[0])), left-isotope[1])
+
+  branch(1, count, 0.0, 1.0, 0, 1.0)
+  return distribution
+
+def isotopeSpectra(formula, charge=1, threshold=1e-4, mode='fine'):
+  '''
+  Isotope pattern of formula (a GL.Formula or an element:count dict) at the given charge.
+  Peaks less probable than threshold are dropped. mode 'fine' keeps every isotopologue, equal masses
+  summed, 'nominal' sums them by nominal mass, at their abundance weighted mean m/z.
+  Returns [[m/z, abundance (%)]] sorted by m/z.
+  '''
+  if mode not in modes: raise ValueError(f"Unknown isotope mode '{mode}', choose from {', '.join(modes)}")
+  charge = charge or 1
+  masses, probabilities, neutrons = np.zeros(1), np.ones(1), np.zeros(1, dtype=int)
+
+  for element, count in formula.items():
+    if count <= 0: continue
+    distribution = elementDistribution(element, count, threshold)
+    if not distribution: return []
+    m, p, n = (np.array(x) for x in zip(*distribution))
+    masses = np.add.outer(masses, m).ravel()
+    probabilities = np.multiply.outer(probabilities, p).ravel()
+    neutrons = np.add.outer(neutrons, n).ravel()
+    keep = probabilities >= threshold # Probabilities only decrease as elements are added
+    masses, probabilities, neutrons = masses[keep], probabilities[keep], neutrons[keep]
+    if not len(masses): return []
+
+  masses = (masses - elements['e'][0][0]*charge)/abs(charge) # Electrons lost or gained by the charge
+  if mode == 'nominal':
+    peaks, group = np.unique(neutrons, return_inverse=True)
+  else:
+    peaks, group = np.unique(np.round(masses, 6), return_inverse=True)
+  abundance = np.bincount(group, weights=probabilities)
+  mz = np.bincount(group, weights=probabilities*masses)/abundance
+
+  abundance = 100*abundance/abundance.max()
+  return [[round(float(x), 6), float(y)] for x, y in zip(mz, abundance)]
+
+envelopeCache = FragmentCache() # Lipids of one sum composition share an envelope
+
+def envelope(formula, charge=1, peaks=4, threshold=1e-4):
+  '''The first peaks nominal isotope peaks (M, M+1, ...) of formula, as in isotopeSpectra, cached by formula.'''
+  formula = Formula(formula)
+  key = (formula.value, charge, peaks, threshold)
+  return envelopeCache.get(key, lambda: isotopeSpectra(formula, charge, threshold, 'nominal')[:peaks])
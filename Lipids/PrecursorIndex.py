@@ -0,0 +1,202 @@
+''' Precursor m/z of every sum composition of a set of lipid classes and adducts, as sorted arrays.
+
+Each tail of a class is drawn from the same tail range as in generation, and sum compositions are the
+distinct sums of (C, DB, Me, OH, D) reachable with one tail per position, so only species the selected
+tails can form are listed. Each is represented by the first combination found to reach it.
+Lipid mass is linear in the mass of each tail, so one lipid per class gives every precursor m/z.
+
+  index = PrecursorIndex.cached({Classes.PC:['[M+H]+'], Classes.PE:['[M+H]+', '[M-H]-']}, tails, bases)
+  for cls, adduct, lipid, mz in index.query(760.58, 760.59): ...
+
+Indexes are kept in memory and as .npz files, so they are only built once for the same selection. '''
+
+import os
+import hashlib
+import tempfile
+import numpy as np
+import Lipids.GenerateLipids as GL
+
+chainTypes = {'A':'Acyl', 'O':'Ether', 'P':'Vinyl'}
+version = 2 # Of how indexes are built, so indexes saved by earlier versions are rebuilt
+
+def composition(tail):
+  '''(C, DB, Me, OH, D) of a tail, summed into a sum composition.'''
+  return (tail.c, tail.d, tail.me, tail.oh, tail.dt)
+
+def pools(cls, tails_to_generate, bases_to_generate, tailLists=None):
+  '''Candidate tails for each argument of cls, one per composition.
+  tailLists, if given, keeps generated tail lists to share between classes.'''
+  tailLists = {} if tailLists is None else tailLists
+  if 'B' not in tailLists: tailLists['B'] = GL.generate_base_tails(bases_to_generate)
+
+  tailPools = []
+  for key in ''.join(cls.tailOrganisation): # e.g. ['B', 'AA'] -> 'BAA'
+    if key == 'B': tails = [base for baseType in cls.base_types for base in tailLists['B'].get(baseType, [])]
+    else:
+      if key not in tailLists: tailLists[key] = GL.generate_tails(tails_to_generate, chainTypes[key])
+      tails = tailLists[key]
+    unique = {} # First tail of each composition
+    for tail in tails: unique.setdefault(composition(tail), tail)
+    tailPools.append(list(unique.values()))
+  return tailPools
+
+def sumCompositions(tailPools):
+  '''Tail indices into each pool of one combination per distinct sum composition, as a running sumset.'''
+  sums = {(0,)*5:()}
+  for pool in tailPools:
+    keys = [composition(tail) for tail in pool]
+    following = {}
+    for total, indices in sums.items():
+      for i, key in enumerate(keys):
+        following.setdefault(tuple(a+b for a, b in zip(total, key)), indices + (i,))
+    sums = following
+  return np.array(list(sums.values()), dtype=np.int32).reshape(len(sums), len(tailPools))
+
+def sumComposition(lipid):
+  '''Sum composition of a lipid's tails, e.g. '34:1;O2'.'''
+  c =  sum(snx.c  for snx in lipid.tails if snx.type != 'Headgroup')
+  d =  sum(snx.d  for snx in lipid.tails if snx.type != 'Headgroup')
+  me = sum(snx.me for snx in lipid.tails if snx.type != 'Headgroup')
+  oh = sum(snx.oh for snx in lipid.tails if snx.type != 'Headgroup')
+  dt = sum(snx.dt for snx in lipid.tails if snx.type != 'Headgroup')
+
+  name = f"{c}:{d}"
+  if me > 0: name += f";{me}-M" # Methyl branching of fatty acid
+  if oh > 0: name += f";O{oh}" # Hydroxy functionalisation of fatty acid
+  if dt > 0: name += f"(D{dt})" # Deuterium labelled fatty acids
+  return name
+
+class PrecursorIndex:
+  '''
+  Sum compositions of each class in classes ({class:[adducts]}), sorted by precursor m/z.
+  tails_to_generate and bases_to_generate are as given to Library.Generator.
+  '''
+  def __init__(self, classes, tails_to_generate, bases_to_generate):
+    self.classes = list(classes)
+    self.adducts = sorted({adduct for adducts in classes.values() for adduct in adducts})
+    self.tails_to_generate = list(tails_to_generate)
+    self.bases_to_generate = bases_to_generate
+    self.pools, self.tailLists = {}, {}
+
+    mz, classIdx, adductIdx, ranks = [], [], [], []
+    for c, cls in enumerate(self.classes):
+      try: lipidMass = self.lipidMasses(cls)
+      except Exception: continue # Class can not be built from these tails
+      for adduct in classes[cls]:
+        delta, charge = GL.adducts[adduct][0], GL.adducts[adduct][2]
+        mz.append(np.round((lipidMass + delta)/abs(charge), 6)) # As GL.MA
+        classIdx.append(np.full(len(lipidMass), c, dtype=np.int32))
+        adductIdx.append(np.full(len(lipidMass), self.adducts.index(adduct), dtype=np.int32))
+        ranks.append(np.arange(len(lipidMass), dtype=np.int64))
+
+    mz = np.concatenate(mz) if mz else np.zeros(0)
+    order = np.argsort(mz, kind='stable')
+    self.mz = mz[order]
+    self.classIdx = np.concatenate(classIdx)[order] if classIdx else np.zeros(0, dtype=np.int32)
+    self.adductIdx = np.concatenate(adductIdx)[order] if adductIdx else np.zeros(0, dtype=np.int32)
+    self.ranks = np.concatenate(ranks)[order] if ranks else np.zeros(0, dtype=np.int64)
+
+  def combinations(self, cls):
+    '''(tail pools, tail indices of each sum composition) of cls, built once.'''
+    if cls not in self.pools:
+      tailPools = pools(cls, self.tails_to_generate, self.bases_to_generate, self.tailLists)
+      self.pools[cls] = (tailPools, sumCompositions(tailPools))
+    return self.pools[cls]
+
+  def lipidMasses(self, cls):
+    '''Rounded mass of every sum composition of cls, in rank order.'''
+    tailPools, combinations = self.combinations(cls)
+    if not len(combinations): return np.zeros(0)
+    first = cls(*[pool[0] for pool in tailPools])
+    exactMass = np.full(len(combinations), first.exactMass)
+    for p, pool in enumerate(tailPools):
+      exactMass += (np.array([tail.mass for tail in pool]) - pool[0].mass)[combinations[:, p]]
+    lipidMass = np.round(exactMass, 6)
+
+    last = self.lipid(cls, len(lipidMass)-1)
+    if abs(last.mass - lipidMass[-1]) > 1e-6: # Not linear in tail mass, build every lipid
+      lipidMass = np.array([self.lipid(cls, rank).mass for rank in range(len(lipidMass))])
+    return lipidMass
+
+  def lipid(self, cls, rank):
+    '''The lipid of cls with the sum composition of rank.'''
+    tailPools, combinations = self.combinations(cls)
+    return cls(*[pool[i] for pool, i in zip(tailPools, combinations[rank])])
+
+  def candidate(self, i):
+    '''(class, adduct, lipid, m/z) of entry i, m/z as given by GL.MA.'''
+    cls, adduct = self.classes[self.classIdx[i]], self.adducts[self.adductIdx[i]]
+    lipid = self.lipid(cls, int(self.ranks[i]))
+    return cls, adduct, lipid, GL.MA(lipid, adduct, 0).mass
+
+  def query(self, low, high):
+    '''(class, adduct, lipid, m/z) of every precursor from low to high m/z.'''
+    start = np.searchsorted(self.mz, low - 1e-6, 'left') # Summed masses may round 1e-6 from the lipid's own
+    stop = np.searchsorted(self.mz, high + 1e-6, 'right')
+    return [candidate for candidate in map(self.candidate, range(start, stop)) if low <= candidate[3] <= high]
+
+  def matches(self, low, high):
+    '''
+    Every entry within each window of the arrays low and high, as (window, entry) index arrays.
+    As query, windows are widened by 1e-6, so m/z should be checked against candidate().
+    '''
+    start = np.searchsorted(self.mz, np.asarray(low) - 1e-6, 'left')
+    stop = np.searchsorted(self.mz, np.asarray(high) + 1e-6, 'right')
+    counts = stop - start
+    windows = np.repeat(np.arange(len(counts)), counts)
+    entries = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(start, counts)
+    return windows, entries
+
+  def charges(self, entries):
+    '''Charge of the adduct of each entry.'''
+    return np.array([GL.adducts[adduct][2] for adduct in self.adducts], dtype=np.int32)[self.adductIdx[entries]]
+
+  def __len__(self):
+    return len(self.mz)
+
+  # ~ # ~ # ~ # Persistence
+
+  @staticmethod
+  def key(classes, tails_to_generate, bases_to_generate):
+    '''Identifies an index by its classes, adducts (as currently defined) and tail ranges.'''
+    selection = [(cls.__name__, [(adduct, GL.adducts[adduct][0], GL.adducts[adduct][2]) for adduct in sorted(adducts)])
+                 for cls, adducts in classes.items()]
+    bases = [bases_to_generate[0], bases_to_generate[1], sorted(bases_to_generate[2])]
+    return hashlib.sha1(repr((version, selection, list(tails_to_generate), bases)).encode()).hexdigest()
+
+  def save(self, path):
+    np.savez(path, mz=self.mz, classIdx=self.classIdx, adductIdx=self.adductIdx, ranks=self.ranks,
+             classes=np.array([cls.__name__ for cls in self.classes]), adducts=np.array(self.adducts))
+
+  @classmethod
+  def load(cls, path, classes, tails_to_generate, bases_to_generate):
+    '''Reads an index saved for the same classes, adducts and tail ranges.'''
+    with np.load(path) as data:
+      index = cls.__new__(cls)
+      lookup = {lipidClass.__name__:lipidClass for lipidClass in classes}
+      index.classes = [lookup[name] for name in data['classes'].tolist()]
+      index.adducts = data['adducts'].tolist()
+      index.tails_to_generate = list(tails_to_generate)
+      index.bases_to_generate = bases_to_generate
+      index.mz, index.classIdx, index.adductIdx, index.ranks = data['mz'], data['classIdx'], data['adductIdx'], data['ranks']
+    index.pools, index.tailLists = {}, {} # Regenerated as lipids are looked up
+    return index
+
+  indexes = {} # Built this session, by key
+
+  @classmethod
+  def cached(cls, classes, tails_to_generate, bases_to_generate, folder=os.path.join(tempfile.gettempdir(), 'LSG')):
+    '''The index for this selection, from memory, from folder, or built and saved to folder.'''
+    key = cls.key(classes, tails_to_generate, bases_to_generate)
+    if key in cls.indexes: return cls.indexes[key]
+
+    path = os.path.join(folder, f'precursors_{key}.npz')
+    try: index = cls.load(path, classes, tails_to_generate, bases_to_generate)
+    except (OSError, KeyError, ValueError):
+      index = cls(classes, tails_to_generate, bases_to_generate)
+      try:
+        os.makedirs(folder, exist_ok=True)
+        index.save(path)
+      except OSError: pass # Kept in memory only
+    cls.indexes[key] = index
+    return index
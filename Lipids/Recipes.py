@@ -0,0 +1,340 @@
+''' Spectra of a lipid class compiled into flat recipes, evaluated without constructing Fragments.
+
+Within one class and adduct, each fragment is linear in the lipid and its tails: its m/z times its
+charge is a constant, plus a multiple of the lipid mass, plus a multiple of the mass of each tail,
+and its formula likewise. The first lipid of each signature (adduct, and the type, flags and
+repeats of the tail at each position) is resolved as usual, and each fragment it generates is
+measured into a Row by nudging the lipid and tail masses and formulas. Comments become templates,
+with tail names replaced by placeholders.
+
+Recipes are checked against Lipid.resolve_spectra whenever a lipid has a tail the signature has not
+been checked with, so fragments which depend on a tail in any other way fall back to the Fragment
+classes, as do m/z too close to a rounding boundary to be evaluated identically.
+
+  recipes = RecipeBook()
+  recipes.resolve_spectra(lipid, adduct) # As lipid.resolve_spectra(adduct, lipid.adducts[adduct])
+  recipes.save()
+
+Recipes, with the tails they have been checked with, are kept per class in folder, keyed by the
+class's templates, the adduct table and the source of the Fragment classes. They are unpickled when
+loaded, so folder is beside the incremental cache, not in the shared temporary folder. '''
+
+import os
+import re
+import math
+import pickle
+import hashlib
+import inspect
+import ResourcePath as RP
+import Lipids.GenerateLipids as GL
+import Lipids.Classes as Classes
+from Lipids.SpectrumEngine import entryFragments
+
+formulaPattern = re.compile(r'(?:[A-Z][a-z]?-?\d+)+') # As str(Formula), e.g. C6H11O9P1
+water = GL.Formula({'H':2, 'O':1}).value
+carbon = GL.Formula({'C':1}).value
+nudge = 0.1234567 # Added to a mass to measure its coefficient, not a whole number so rounding shows
+denominator = 12 # Coefficients are multiples of 1/denominator, as masses are divided by charge
+tolerance = 1e-9 # Of a coefficient from a multiple of 1/denominator
+boundary = 1e-4 # Closest m/z*1e6 may be to x.5 to be rounded as the Fragment would be
+
+class Unsafe(Exception):
+  '''A recipe can not reproduce the Fragment classes for this lipid.'''
+
+def coefficient(change):
+  '''Coefficient measured from the change in a value when a mass is nudged, if linear.'''
+  value = round(change/nudge*denominator)
+  if abs(change/nudge*denominator - value) > tolerance*denominator: raise Unsafe(f'Non-linear m/z, coefficient {change/nudge}')
+  return value/denominator
+
+def layout(lipid):
+  '''
+  (signature, groups, keys) of a lipid. groups are its distinct tail objects, in order of appearance.
+  signature is, for each position of lipid.tails, its type, flags fragments depend on,
+  and the first position holding the same tail object or a tail of the same name.
+  keys identify the tail of each group, for the tails a recipe has been checked with.
+  '''
+  groups, names, signature = [], [], []
+  for tail in lipid.tails:
+    for g, other in enumerate(groups):
+      if other is tail: break
+    else:
+      g = len(groups)
+      groups.append(tail)
+    name = names.index(tail.name) if tail.name in names else len(names)
+    names.append(tail.name)
+    signature.append((tail.type, g, name, tail.d > 0, tail.oh > 0, tail.me > 0, tail.dt > 0,
+                      tail.dt > 0 and tail.formula['H'] == 1)) # Fully deuterated
+  return tuple(signature), groups, [key(tail) for tail in groups]
+
+def key(tail):
+  '''Identifies a tail, for the tails a recipe has been checked with. A headgroup built around tails of the
+  lipid is identified by its own part, as the tails are checked as groups of their own.'''
+  hgtails = getattr(tail, 'hgtails', ())
+  if not hgtails: return (tail.name, tail.mass, tail.formula.value)
+  mass = tail.mass - sum(hgtail.mass - GL.masses['H2O'] for hgtail in hgtails)
+  formula = tail.formula.value - sum(hgtail.formula.value - water for hgtail in hgtails)
+  return (tail.name, round(mass, 6), formula, len(hgtails))
+
+class Row:
+  '''One fragment of a spectrum template, as m/z = (offset + slope*lipid mass + coefficient*tail mass, ...)/divisor.'''
+  __slots__ = ('offset', 'slope', 'coefficients', 'divisor', 'intensity', 'charge', 'comment', 'commentFormulas',
+               'formulaSlope', 'formulaCoefficients', 'formulaDelta')
+
+  def __init__(self, lipid, groups, fragment):
+    self.intensity = fragment.intensity
+    self.charge = fragment.Charge()
+    self.divisor = abs(self.charge) or 1
+    numerator = lambda: fragment.MZ()*self.divisor
+    formula = lambda: fragment.Formula().value
+
+    lipidFormula = lipid.formula.value
+    n, f = numerator(), formula()
+    if n != numerator() or f != formula() or lipid.formula.value != lipidFormula:
+      raise Unsafe(f'{type(fragment).__name__} is not repeatable')
+
+    self.slope = coefficient(self.nudged(lipid, numerator) - n)
+    self.coefficients = tuple((g, c) for g, c in enumerate(coefficient(self.nudged(tail, numerator) - n) for tail in groups) if c)
+    self.offset = n - self.slope*lipid.mass - sum(c*groups[g].mass for g, c in self.coefficients)
+
+    self.formulaSlope = self.nudgedFormula(lipid, formula, f)
+    self.formulaCoefficients = tuple((g, c) for g, c in enumerate(self.nudgedFormula(tail, formula, f) for tail in groups) if c)
+    self.formulaDelta = f - self.formulaSlope*lipidFormula - sum(c*groups[g].formula.value for g, c in self.formulaCoefficients)
+
+    self.comment, self.commentFormulas = comment_template(fragment, groups)
+
+  @staticmethod
+  def nudged(source, numerator):
+    mass = source.mass
+    source.mass = mass + nudge
+    try: return numerator()
+    finally: source.mass = mass
+
+  @staticmethod
+  def nudgedFormula(source, formula, value):
+    '''Carbons of formula per carbon of source's formula, value being formula's unchanged.'''
+    original = source.formula
+    source.formula = original + {'C':1}
+    try: change = formula() - value
+    finally: source.formula = original
+    if abs(change) > 64: raise Unsafe(f'Non-linear formula, coefficient {change}')
+    return change
+
+def formulas(comment):
+  '''(start, end, Formula value) of each formula written into comment.'''
+  tokens = []
+  for match in formulaPattern.finditer(comment):
+    try: tokens.append((match.start(), match.end(), GL.Formula({element:int(count) for element, count in re.findall(r'([A-Z][a-z]?)(-?\d+)', match.group())}).value))
+    except ValueError: pass # Not elements
+  return tokens
+
+def comment_template(fragment, groups):
+  '''
+  (template, formula terms) of fragment's comment. Tail names become placeholders {g}, as in template, and formulas
+  written into the comment which change with the formula of a tail group, as of a headgroup built around the lipid's
+  tails, become placeholders {len(groups)+k}, with (delta, ((group, coefficient), ...)) as Row's formula.
+  '''
+  comment = fragment.Comment()
+  tokens = formulas(comment)
+  terms = [[] for _ in tokens]
+  for g, tail in enumerate(groups):
+    original = tail.formula
+    tail.formula = original + {'C':1}
+    try: nudged = fragment.Comment()
+    finally: tail.formula = original
+    if nudged == comment: continue
+    nudgedTokens = formulas(nudged)
+    if len(nudgedTokens) != len(tokens): raise Unsafe('Comment does not change with formula alone')
+    for k, ((start, end, value), (nudgedStart, nudgedEnd, nudgedValue)) in enumerate(zip(tokens, nudgedTokens)):
+      change = nudgedValue - value
+      if change and change % carbon: raise Unsafe(f'Non-linear comment formula {comment}')
+      if change: terms[k].append((g, change//carbon))
+    plain = lambda text, spans: [text[end:start] for (_, end, _), (start, _, _) in zip([(0, 0, 0)] + spans, spans + [(len(text), 0, 0)])]
+    if plain(comment, tokens) != plain(nudged, nudgedTokens): raise Unsafe('Comment does not change with formula alone')
+
+  pieces, commentFormulas, last = [], [], 0
+  for (start, end, value), coefficients in zip(tokens, terms):
+    if not coefficients: continue
+    pieces.append(template(comment[last:start], groups))
+    pieces.append(f'{{{len(groups) + len(commentFormulas)}}}')
+    commentFormulas.append((value - sum(c*groups[g].formula.value for g, c in coefficients), tuple(coefficients)))
+    last = end
+  pieces.append(template(comment[last:], groups))
+  return ''.join(pieces), tuple(commentFormulas)
+
+def template(comment, groups):
+  '''comment with the name of each tail group replaced by a format placeholder, longest names first.'''
+  index = {}
+  for g, tail in enumerate(groups):
+    if tail.name: index.setdefault(tail.name, g)
+  comment = comment.replace('{', '{{').replace('}', '}}')
+  if not index: return comment
+  pattern = '|'.join(re.escape(name) for name in sorted(index, key=len, reverse=True))
+  return re.sub(pattern, lambda match: f'{{{index[match.group()]}}}', comment)
+
+class Peak:
+  '''A fragment evaluated from a Row, used as a Fragment is once resolved. Compares by mass as Fragments do.'''
+  __slots__ = ('mass', 'intensity', 'row', 'source')
+
+  def __init__(self, mass, row, source):
+    self.mass = mass
+    self.intensity = row.intensity
+    self.row = row
+    self.source = source # (lipid, groups, names), shared by the peaks of a spectrum
+
+  def Comment(self):
+    row, (lipid, groups, names) = self.row, self.source
+    if not row.commentFormulas: return row.comment.format(*names)
+    written = []
+    for delta, coefficients in row.commentFormulas:
+      formula = GL.Formula()
+      formula.value = delta + sum(c*groups[g].formula.value for g, c in coefficients)
+      written.append(str(formula))
+    return row.comment.format(*names, *written)
+  def Charge(self):
+    return self.row.charge
+  def Formula(self):
+    row, (lipid, groups, names) = self.row, self.source
+    formula = GL.Formula()
+    formula.value = row.formulaSlope*lipid.formula.value + row.formulaDelta + sum(c*groups[g].formula.value for g, c in row.formulaCoefficients)
+    return formula
+
+  def __hash__(self):
+    return hash(('mass', self.mass))
+  def __eq__(self, other):
+    return self.mass == other.mass
+  def __lt__(self, other):
+    return self.mass < other.mass
+
+class Recipe:
+  '''Rows of every fragment of one class, adduct and signature, in template order.'''
+  def __init__(self, lipid, adduct, groups):
+    self.rows = [Row(lipid, groups, fragment) for fragmentClass, intensity in lipid.adducts[adduct].items()
+                 for fragment in entryFragments(lipid, adduct, fragmentClass, intensity)]
+    self.terms = [(row.offset, row.slope, row.coefficients, 1e6/row.divisor, row) for row in self.rows] # As evaluated
+
+  def evaluate(self, lipid, groups):
+    '''Spectrum of lipid as Lipid.resolve_spectra sorts it. Raises Unsafe where an m/z is too close to a rounding boundary.'''
+    source = (lipid, groups, [tail.name for tail in groups])
+    masses = [tail.mass for tail in groups]
+    lipidMass = lipid.mass
+    peaks = {}
+    for offset, slope, coefficients, scale, row in self.terms:
+      mz = offset + slope*lipidMass
+      for g, c in coefficients: mz += c*masses[g]
+      scaled = mz*scale # m/z*1e6
+      whole = math.floor(scaled)
+      fraction = scaled - whole
+      if -boundary < fraction - 0.5 < boundary: raise Unsafe(f'{scaled/1e6} is too close to a rounding boundary')
+      mass = (whole + (fraction > 0.5))/1e6 # As round(m/z, 6), the nearest float to the rounded decimal
+      if mass not in peaks: peaks[mass] = Peak(mass, row, source) # The first of equal masses is kept, as by set()
+    return [peaks[mass] for mass in sorted(peaks, reverse=True)]
+
+def same(peaks, fragments):
+  '''True if peaks are written as fragments would be, in every format.'''
+  if len(peaks) != len(fragments): return False
+  try:
+    return all(peak.mass == fragment.mass and peak.intensity == fragment.intensity and peak.Charge() == fragment.Charge()
+               and peak.Comment() == fragment.Comment() and peak.Formula().value == fragment.Formula().value
+               for peak, fragment in zip(peaks, fragments))
+  except Exception: return False
+
+fingerprint = None
+
+def source_fingerprint():
+  '''Hash of the modules recipes are compiled from.'''
+  global fingerprint
+  if fingerprint is None:
+    digest = hashlib.blake2b(digest_size=16)
+    for module in (GL, Classes, inspect.getmodule(source_fingerprint)):
+      try: digest.update(inspect.getsource(module).encode())
+      except (OSError, TypeError): digest.update(module.__name__.encode()) # No source, as in a frozen build
+    fingerprint = digest.hexdigest()
+  return fingerprint
+
+class ClassRecipes:
+  '''Recipes of one lipid class, by (adduct, signature), None where a signature could not be compiled,
+  with the tails of each group each has been checked with or rejected for.'''
+  def __init__(self, cls):
+    spectra = [(adduct, [(getattr(fragment, '__qualname__', repr(fragment)), intensity) for fragment, intensity in cls.adducts[adduct].items()],
+                GL.adducts[adduct]) for adduct in sorted(cls.adducts)]
+    self.key = hashlib.blake2b(repr((source_fingerprint(), cls.__module__, cls.__qualname__, spectra)).encode(), digest_size=16).hexdigest()
+    self.recipes, self.verified, self.rejected = {}, {}, {}
+    self.dirty = False
+
+  def load(self, folder):
+    try:
+      with open(os.path.join(folder, f'recipes_{self.key}.pickle'), 'rb') as file:
+        self.recipes, self.verified, self.rejected = pickle.load(file)
+    except (OSError, EOFError, ValueError, AttributeError, pickle.UnpicklingError): pass # Compiled again as lipids are resolved
+
+  def save(self, folder):
+    path = os.path.join(folder, f'recipes_{self.key}.pickle')
+    temporary = f'{path}.{os.getpid()}.tmp'
+    try:
+      os.makedirs(folder, exist_ok=True)
+      with open(temporary, 'wb') as file: pickle.dump((self.recipes, self.verified, self.rejected), file, pickle.HIGHEST_PROTOCOL)
+      os.replace(temporary, path)
+      self.dirty = False
+    except OSError: pass # Kept in memory only
+
+  def compile(self, lipid, adduct, key, groups):
+    try: self.recipes[key] = Recipe(lipid, adduct, groups)
+    except Exception: self.recipes[key] = None # Resolved by the Fragment classes
+    self.verified[key], self.rejected[key] = [set() for _ in groups], [set() for _ in groups]
+    self.dirty = True
+    return self.recipes[key]
+
+class RecipeBook:
+  '''
+  Resolves spectra from the recipes of each class, compiled as lipids are first resolved.
+  Templates must not change while in use, classes are keyed by their templates when first resolved.
+  '''
+  def __init__(self, folder=RP.exe_path(os.path.join('Cache', 'Recipes'))):
+    self.folder = folder
+    self.classes = {}
+    self.lipid, self.layout = None, None # Of the last lipid, as each adduct is resolved in turn
+    self.evaluated = self.resolved = 0
+
+  def recipes(self, cls):
+    if cls not in self.classes:
+      self.classes[cls] = ClassRecipes(cls)
+      if self.folder: self.classes[cls].load(self.folder)
+    return self.classes[cls]
+
+  def resolve_spectra(self, lipid, adduct):
+    '''Sets lipid.spectra[adduct] as lipid.resolve_spectra(adduct, lipid.adducts[adduct]) would.'''
+    if lipid is not self.lipid: self.lipid, self.layout = lipid, layout(lipid)
+    signature, groups, keys = self.layout
+    classRecipes = self.recipes(type(lipid))
+    key = (adduct, signature)
+    if key in classRecipes.recipes: recipe = classRecipes.recipes[key]
+    else: recipe = classRecipes.compile(lipid, adduct, key, groups)
+    if recipe is None: return self.fallback(lipid, adduct)
+
+    verified, rejected = classRecipes.verified[key], classRecipes.rejected[key]
+    if all(k in tails for k, tails in zip(keys, verified)):
+      try:
+        lipid.spectra[adduct] = recipe.evaluate(lipid, groups)
+        self.evaluated += 1
+        return
+      except Unsafe: return self.fallback(lipid, adduct)
+
+    if any(k in tails for k, tails in zip(keys, rejected)): return self.fallback(lipid, adduct)
+    self.fallback(lipid, adduct) # Tails not yet checked, the spectrum is written as resolved
+    try: peaks = recipe.evaluate(lipid, groups)
+    except Unsafe: return
+    matched = same(peaks, lipid.spectra[adduct])
+    for g, k in enumerate(keys):
+      if k not in verified[g]: (verified if matched else rejected)[g].add(k)
+    classRecipes.dirty = True
+
+  def fallback(self, lipid, adduct):
+    lipid.resolve_spectra(adduct, lipid.adducts[adduct])
+    self.resolved += 1
+
+  def save(self):
+    '''Writes the recipes of classes compiled or checked since they were loaded.'''
+    if not self.folder: return
+    for classRecipes in self.classes.values():
+      if classRecipes.dirty: classRecipes.save(self.folder)
@@ -0,0 +1,147 @@
+''' Vectorised spectra for a whole lipid class.
+
+Within one lipid class and adduct, each fragment m/z is a multiple of the rounded
+lipid mass, plus a constant, plus one term for the tail at each position. Those terms
+are measured once from the Fragment classes, by generating the spectrum of a reference
+lipid and of that lipid with each candidate tail substituted into each position.
+The spectra of any number of tail combinations are then an array gather and sum.
+
+  template = SpectrumTemplate(Classes.PC, '[M+H]+', [acyls, acyls])
+  mz, intensity, rows, counts = template.spectra(indices) # indices: (lipids, positions) into the pools
+
+verify() compares the result against Lipid.resolve_spectra. '''
+
+import copy
+import numpy as np
+
+def entryFragments(lipid, adduct, fragment, intensity):
+  '''Fragments generated by one entry of a spectra template, as in Lipid.resolve_spectra'''
+  x = []
+  fgmt = fragment(lipid, adduct, intensity)
+  try: x.extend(fgmt)
+  except: x.append(fgmt)
+  return x
+
+class SpectrumTemplate:
+  '''Fragment m/z and intensity of one lipid class and adduct,\n
+  as a function of the tail at each position of the class.\n
+  cls = lipid class, e.g. Classes.PC\n
+  adduct = adduct to generate spectra for, e.g. '[M+H]+'\n
+  pools = candidate tails for each argument of cls, e.g. [acyls, acyls] for PC\n
+  spectra = fragment:intensity dictionary, defaults to cls.adducts[adduct]\n
+  Raises ValueError where the fragments of a class can not be separated by position.'''
+  def __init__(self, cls, adduct, pools, spectra=None):
+
+    self.cls = cls
+    self.adduct = adduct
+    self.pools = [list(pool) for pool in pools]
+    self.fragments = spectra if spectra is not None else cls.adducts[adduct]
+
+    # Reference lipid: for each position, the tail which generates the most fragments.
+    self.reference = [pool[0] for pool in self.pools]
+    for p, pool in enumerate(self.pools):
+      self.reference[p] = max(pool, key=lambda tail: len(self.probe(p, tail)[1]))
+
+    referenceMass, referenceRows = self.probe()
+    self.rows = list(referenceRows) # (spectrum entry, positions referenced, ordinal)
+    self.base = np.array([referenceRows[row][0] for row in self.rows]) # m/z less lipid mass term
+    self.slope = np.array([referenceRows[row][1] for row in self.rows]) # m/z per lipid mass
+    self.intensity = np.array([list(self.fragments.values())[k] for k, refs, ordinal in self.rows], dtype=float)
+    self.baseMass = referenceMass
+
+    # Per position, the change in each term for each tail, and whether the fragment exists.
+    self.massContributions, self.contributions, self.exists = [], [], []
+    for p, pool in enumerate(self.pools):
+      massContribution = np.zeros(len(pool))
+      contribution = np.zeros((len(self.rows), len(pool)))
+      exists = np.zeros((len(self.rows), len(pool)), dtype=bool)
+      for t, tail in enumerate(pool):
+        mass, probeRows = self.probe(p, tail)
+        if not probeRows.keys() <= referenceRows.keys():
+          raise ValueError(f'{cls.__name__} {adduct}: {tail.name} at position {p+1} generates fragments the reference lipid does not')
+        massContribution[t] = mass - referenceMass
+        for r, row in enumerate(self.rows):
+          if row in probeRows:
+            contribution[r, t] = probeRows[row][0] - referenceRows[row][0]
+            exists[r, t] = True
+      self.massContributions.append(massContribution)
+      self.contributions.append(contribution)
+      self.exists.append(exists)
+
+  def probe(self, position=None, tail=None):
+    '''Spectrum of the reference lipid, with tail at position if given.\n
+    Returns the unrounded lipid mass, and {(spectrum entry, positions referenced, ordinal): (m/z less lipid mass term, m/z per lipid mass)}'''
+    args = [copy.copy(t) for t in self.reference] # Copies, so each position can be told apart by identity
+    if position is not None: args[position] = copy.copy(tail)
+    lipid = self.cls(*args)
+    positions = {id(arg):p for p, arg in enumerate(args)}
+
+    rows = {}
+    for k, (fragment, intensity) in enumerate(self.fragments.items()):
+      ordinals = {}
+      for fgmt in entryFragments(lipid, self.adduct, fragment, intensity):
+        referenced = [getattr(fgmt, 'tail', None)] + list(getattr(fgmt, 'tails', None) or [])
+        refs = tuple(sorted(positions[id(t)] for t in referenced if id(t) in positions))
+        ordinal = ordinals[refs] = ordinals.get(refs, -1) + 1
+        mz = fgmt.MZ()
+        lipid.mass += 1 # Fragments read the (rounded) lipid mass when MZ is called
+        slope = fgmt.MZ() - mz
+        lipid.mass -= 1
+        rows[(k, refs, ordinal)] = (mz - slope*lipid.mass, slope)
+    return lipid.exactMass, rows
+
+  def spectra_matrix(self, indices):
+    '''Unsorted (lipids x fragments) m/z and existence, in template row order.'''
+    indices = np.asarray(indices, dtype=np.intp).reshape(-1, len(self.pools))
+    mass = np.full(len(indices), self.baseMass)
+    mz = np.tile(self.base, (len(indices), 1))
+    exists = np.ones(mz.shape, dtype=bool)
+    for p in range(len(self.pools)):
+      mass += self.massContributions[p][indices[:, p]]
+      mz += self.contributions[p][:, indices[:, p]].T
+      exists &= self.exists[p][:, indices[:, p]].T
+    mz += np.outer(np.round(mass, 6), self.slope) # Lipid masses are rounded before fragments are calculated
+    return np.round(mz, 6), exists
+
+  def spectra(self, indices):
+    '''
+    Spectra for tail combinations given as an (lipids x positions) array of indices into pools.
+    Returns m/z, intensity and template row arrays of (lipids x fragments), each lipid's fragments
+    de-duplicated and sorted by descending m/z as in Lipid.resolve_spectra, padded with nan, 0 and -1.
+    Also returns the number of fragments of each lipid.
+    '''
+    mz, exists = self.spectra_matrix(indices)
+    rows = np.broadcast_to(np.arange(len(self.rows)), mz.shape)
+    mz = np.where(exists, mz, np.nan)
+
+    order = np.lexsort((rows, -mz), axis=-1) # By m/z, then by template order
+    mz = np.take_along_axis(mz, order, axis=-1)
+    rows = np.take_along_axis(rows, order, axis=-1)
+    duplicate = np.zeros(mz.shape, dtype=bool) # Equal masses are one peak, the first generated is kept
+    duplicate[:, 1:] = mz[:, 1:] == mz[:, :-1]
+    keep = ~np.isnan(mz) & ~duplicate
+
+    order = np.argsort(~keep, axis=-1, kind='stable') # Move removed fragments to the end
+    keep = np.take_along_axis(keep, order, axis=-1)
+    mz = np.where(keep, np.take_along_axis(mz, order, axis=-1), np.nan)
+    rows = np.where(keep, np.take_along_axis(rows, order, axis=-1), -1)
+    intensity = np.where(keep, self.intensity[rows], 0)
+    return mz, intensity, rows, keep.sum(axis=-1)
+
+def verify(template, indices, tolerance=1e-6):
+  '''Compares template.spectra against Lipid.resolve_spectra for each tail combination in indices.'''
+  indices = np.asarray(indices, dtype=np.intp).reshape(-1, len(template.pools))
+  mz, intensity, rows, counts = template.spectra(indices)
+  mismatched, maxError = 0, 0.0
+  for i, combination in enumerate(indices):
+    lipid = template.cls(*[template.pools[p][t] for p, t in enumerate(combination)])
+    lipid.resolve_spectra(template.adduct, template.fragments)
+    expected = lipid.spectra[template.adduct]
+    if len(expected) != counts[i]:
+      mismatched += 1
+      continue
+    error = max((abs(peak.mass-m) for peak, m in zip(expected, mz[i])), default=0)
+    maxError = max(maxError, error)
+    if error > tolerance+1e-9 or any(peak.intensity != x for peak, x in zip(expected, intensity[i])):
+      mismatched += 1
+  return {'checked':len(indices), 'mismatched':mismatched, 'max_error':float(maxError)}
@@ -1,12 +1,8 @@
 import sys
 import psutil
-import inspect
-import dill
-import fnmatch
-import os
+import multiprocessing
+import Library
 import ResourcePath as RP
-import Lipids.Classes as Classes
-import Lipids.GenerateLipids as GL
 
 from PySide6.QtCore import QTimer
 from PySide6.QtWidgets import QApplication, QWizard
@@ -61,12 +57,7 @@ class CreateWindow(QWizard):
         self.timer.timeout.connect(self.update_cpu_usage)
         self.timer.start(1000)  # Update every second
 
-        # Glycerolipids
-        self.classes_to_generate =      [cls for cls in GL.Glycerolipid.__subclasses__() if inspect.getmodule(cls) == Classes]
-        # Sphingolipids
-        self.classes_to_generate.extend([cls for cls in GL.Sphingolipid.__subclasses__() if inspect.getmodule(cls) == Classes])
-        # ETC Lipids, Cholesterol ester
-        self.classes_to_generate.extend([cls for cls in GL.OtherLipid.__subclasses__()   if inspect.getmodule(cls) == Classes])
+        self.classes_to_generate = Library.lipid_classes()
 
         #print('Classes: ', len(self.classes_to_generate)) # Used to check number of classes available in console
 
@@ -77,20 +68,7 @@ class CreateWindow(QWizard):
 
         templateLocation = RP.exe_path('Templates')
 
-        if os.path.exists(templateLocation):
-            for file in os.listdir(templateLocation):
-                if fnmatch.fnmatch(file, '*.pkl'):
-                    modifiedLipidTemplate = open(f'{templateLocation}\{file}', 'rb')
-                    try:
-                        data = dill.load(modifiedLipidTemplate)
-                        for idx, cls in enumerate(self.classes_to_generate):
-                            if cls == data['lipidClass']:
-                                self.classes_to_generate[idx].adducts = data['spectra']
-                                combinedAdducts = {**data['adducts'], **GL.adducts}
-                                GL.adducts = combinedAdducts
-                                break
-                    except: pass
-                    finally: modifiedLipidTemplate.close()
+        Library.load_templates(self.classes_to_generate, templateLocation)
 
         # Add Wizard Pages
         self.setPage(0, Page0.Page(self)) # Define range for lipid tails   or   choose to generate specific lipids.
@@ -110,6 +88,7 @@ class CreateWindow(QWizard):
         self.setButtonText(QWizard.CustomButton2, f"CPU Usage: {cpu_usage:.2f}%")
 
 if __name__ == '__main__':
+    multiprocessing.freeze_support() # Library generation spawns worker processes, required when bundled
     app = QApplication(sys.argv)
     mainWindow = CreateWindow()
     mainWindow.show()
@@ -0,0 +1,224 @@
+'''
+Cumulative time and calls of each stage of generation, by lipid class and by fragment type.
+
+    generator = Library.Generator('lipids.msp', "MSP (*.msp)", ..., profile='stages')
+    generator.run()
+    generator.profile['stages']['spectra'], generator.profile['classes']['PC'], generator.profile['fragments'], ...
+
+The summary is also written beside the output file ('lipids.msp.profile.json'). Stages nest,
+so their times are cumulative rather than exclusive:
+    lipids       Generator.generate_class, enumerating tail combinations and constructing lipids
+    enumeration  Generator.lazyProduct, within lipids
+    records      Generator.*_records, resolving spectra and formatting records
+    spectra      Generator.resolve_spectra, from recipes or Fragment classes, within records
+    fragments    each fragment of a spectrum resolved by Fragment classes, within spectra
+    formulas     GL.Formula strings
+    writes       writes to the output file
+
+Stages are timed by replacing these functions while a Profiler is installed, so generation is
+not slowed when it is not. Worker processes of Generator.run_parallel return their times with
+each job. capture='cprofile' or 'pyinstrument' also records a profile of the generating thread.
+'''
+import io
+import json
+import time
+import pstats
+import cProfile
+
+import Lipids.GenerateLipids as GL
+
+captures = ['stages', 'cprofile', 'pyinstrument']
+stages = ['lipids', 'enumeration', 'records', 'spectra', 'fragments', 'formulas', 'writes'] # In the order summarised
+top = 10 # Slowest classes, fragments and functions in the summary
+
+def summary_path(file_name):
+    return f'{file_name}.profile.json'
+
+def capture_path(file_name, capture):
+    return f"{file_name}.{'prof' if capture == 'cprofile' else 'profile.html'}"
+
+def name(function):
+    return getattr(function, '__name__', repr(function))
+
+class Profiler:
+    '''
+    Times the stages of generation while installed, see install() and remove().
+    times is {(stage, class or fragment name, or None): [seconds, calls]}.
+    '''
+    def __init__(self, capture='stages'):
+        if capture not in captures: raise ValueError(f"Unknown profile '{capture}', choose from {', '.join(captures)}")
+        if capture == 'pyinstrument':
+            try: import pyinstrument
+            except ImportError: raise ValueError("Profiling with 'pyinstrument' needs it installed, pip install pyinstrument") from None
+        self.capture = capture
+        self.times = {}
+        self.replaced = [] # (owner, attribute, original) of each replaced function
+        self.profiler = None
+        self.t0, self.seconds = None, 0
+
+    def add(self, stage, key, seconds, calls=1):
+        times = self.times.get((stage, key))
+        if times is None: times = self.times[(stage, key)] = [0.0, 0]
+        times[0] += seconds
+        times[1] += calls
+
+    def merge(self, times):
+        '''Adds times from a worker process.'''
+        for (stage, key), (seconds, calls) in times.items(): self.add(stage, key, seconds, calls)
+
+    def take(self):
+        '''Times since the last take, for a worker to return with its job.'''
+        times, self.times = self.times, {}
+        return times
+
+    # ~ # ~ # ~ # Timed replacements
+
+    def iterate(self, stage, key, iterator):
+        '''Yields from iterator, timing each item it produces.'''
+        clock = time.perf_counter
+        while True:
+            t0 = clock()
+            try: item = next(iterator)
+            except StopIteration:
+                self.add(stage, key, clock() - t0, 0)
+                return
+            self.add(stage, key, clock() - t0)
+            yield item
+
+    def replace(self, owner, attribute, function):
+        self.replaced.append((owner, attribute, owner.__dict__[attribute]))
+        setattr(owner, attribute, function)
+
+    def install(self, generator):
+        '''Replaces the functions of each stage, then starts capturing if asked.'''
+        profiler, clock = self, time.perf_counter
+        generatorType = type(generator)
+        generate_class, lazyProduct, formula = generatorType.generate_class, generatorType.lazyProduct, GL.Formula.__str__
+        generator_spectra = generatorType.resolve_spectra
+
+        def timed_generate_class(self, cls, start=0, stop=None, species=False):
+            return profiler.iterate('lipids', cls.__name__, generate_class(self, cls, start, stop, species))
+        def timed_lazyProduct(self, constituentList, start=0, stop=None):
+            return profiler.iterate('enumeration', None, lazyProduct(self, constituentList, start, stop))
+        def timed_records(records):
+            def timed(self, lipid):
+                return profiler.iterate('records', type(lipid).__name__, records(self, lipid))
+            return timed
+        def timed_spectra(self, lipid, adduct):
+            t0 = clock()
+            generator_spectra(self, lipid, adduct)
+            profiler.add('spectra', type(lipid).__name__, clock() - t0)
+        def resolve_spectra(lipid, adduct, spectra={}): # As GL.Lipid.resolve_spectra, timing each fragment
+            x = []
+            for fragment, intensity in spectra.items():
+                t1 = clock()
+                fgmt = fragment(lipid, adduct, intensity)
+                profiler.add('fragments', name(fragment), clock() - t1)
+                try: x.extend(fgmt)
+                except:
+                    try: x.append(fgmt)
+                    except: print('Error assigning', fragment)
+            lipid.spectra[adduct] = sorted(set(x), reverse=True)
+        def timed_formula(self):
+            t0 = clock()
+            string = formula(self)
+            profiler.add('formulas', None, clock() - t0)
+            return string
+
+        self.replace(generatorType, 'generate_class', timed_generate_class)
+        self.replace(generatorType, 'lazyProduct', timed_lazyProduct)
+        for recordsMethod, noun, header in generatorType.formats.values():
+            self.replace(generatorType, recordsMethod, timed_records(getattr(generatorType, recordsMethod)))
+        self.replace(generatorType, 'resolve_spectra', timed_spectra)
+        self.replace(GL.Lipid, 'resolve_spectra', resolve_spectra)
+        self.replace(GL.Formula, '__str__', timed_formula)
+
+        self.t0 = clock()
+        if self.capture == 'cprofile':
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        elif self.capture == 'pyinstrument':
+            import pyinstrument
+            self.profiler = pyinstrument.Profiler()
+            self.profiler.start()
+
+    def remove(self):
+        '''Stops capturing and restores the replaced functions.'''
+        if self.capture == 'cprofile' and self.profiler: self.profiler.disable()
+        elif self.capture == 'pyinstrument' and self.profiler: self.profiler.stop()
+        if self.t0 is not None: self.seconds += time.perf_counter() - self.t0
+        self.t0 = None
+        for owner, attribute, original in reversed(self.replaced): setattr(owner, attribute, original)
+        self.replaced = []
+
+    def file(self, file):
+        '''file, with its writes timed.'''
+        return TimedFile(file, self)
+
+    # ~ # ~ # ~ # Summary
+
+    def summary(self):
+        '''Times of each stage, class and fragment, slowest first, and the slowest functions if captured.'''
+        totals, classes, fragments = {stage:{'seconds':0.0, 'calls':0} for stage in stages}, {}, {}
+        for (stage, key), (seconds, calls) in self.times.items():
+            total = totals[stage]
+            total['seconds'] += seconds
+            total['calls'] += calls
+            if stage == 'fragments': fragments[key] = {'seconds':seconds, 'calls':calls}
+            elif key is not None: classes.setdefault(key, {})[stage] = {'seconds':seconds, 'calls':calls}
+        slowest = lambda times: dict(sorted(times.items(), key=lambda item: -item[1]['seconds']))
+        result = {'seconds':self.seconds, 'capture':self.capture, 'stages':totals,
+                  'classes':dict(sorted(classes.items(), key=lambda item: -item[1].get('records', {'seconds':0})['seconds'])),
+                  'fragments':slowest(fragments)}
+        if self.capture == 'cprofile' and self.profiler:
+            stats = pstats.Stats(self.profiler, stream=io.StringIO()).sort_stats('cumulative')
+            result['functions'] = [{'function':f'{file}:{line}({function})', 'calls':calls, 'seconds':cumulative}
+                                   for (file, line, function), (primitive, calls, total, cumulative, callers)
+                                   in sorted(stats.stats.items(), key=lambda item: -item[1][3])[:top]]
+        return result
+
+    def save(self, file_name):
+        '''Writes the summary, and the captured profile if any, beside file_name. Returns the summary.'''
+        result = self.summary()
+        if self.capture == 'cprofile' and self.profiler: self.profiler.dump_stats(capture_path(file_name, self.capture))
+        elif self.capture == 'pyinstrument' and self.profiler:
+            with open(capture_path(file_name, self.capture), 'w') as file: file.write(self.profiler.output_html())
+        with open(summary_path(file_name), 'w') as file: json.dump(result, file, indent=2)
+        return result
+
+class TimedFile:
+    '''Forwards to a file, timing its writes. The binary buffer of a text file is timed as well.'''
+    def __init__(self, file, profiler):
+        self.file = file
+        self.profiler = profiler
+
+    def write(self, data):
+        t0 = time.perf_counter()
+        written = self.file.write(data)
+        self.profiler.add('writes', None, time.perf_counter() - t0)
+        return written
+
+    @property
+    def buffer(self):
+        return TimedFile(self.file.buffer, self.profiler)
+
+    def __getattr__(self, attribute):
+        return getattr(self.file, attribute)
+
+def describe(summary):
+    '''Lines of a summary for a console, e.g. Page 5's.'''
+    seconds = summary['seconds'] or 1e-9
+    lines = [f"Profile of {summary['seconds']:.2f} s, stages are cumulative:"]
+    for stage, times in summary['stages'].items():
+        lines.append(f"- {stage} - {times['seconds']:.2f} s ({100*times['seconds']/seconds:.0f}%), {times['calls']:,} calls")
+    lines.append('Slowest classes (records):')
+    for cls, stages in list(summary['classes'].items())[:top]:
+        records = stages.get('records', {'seconds':0, 'calls':0})
+        lines.append(f"- {cls} - {records['seconds']:.2f} s, {records['calls']:,} records")
+    lines.append('Slowest fragments:')
+    for fragment, times in list(summary['fragments'].items())[:top]:
+        lines.append(f"- {fragment} - {times['seconds']:.2f} s, {1e6*times['seconds']/max(times['calls'], 1):.1f} us per call")
+    if summary.get('functions'): lines.append('Slowest functions (cumulative):')
+    for function in summary.get('functions', []):
+        lines.append(f"- {function['function']} - {function['seconds']:.2f} s, {function['calls']:,} calls")
+    return lines
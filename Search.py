@@ -0,0 +1,283 @@
+'''
+Searches experimental MS2 spectra against spectra generated in-process, without writing a library first.
+
+    library = SpectralLibrary.from_generator(generator) # A Library.Generator, spectra from Lipid.resolve_spectra
+    for title, precursor, mz, intensity in read_queries('queries.mgf'):
+        hits = library.search(mz, intensity, precursor, precursorTolerance=10, fragmentTolerance=0.01, method='entropy')
+
+Reference spectra are indexed by precursor m/z, and by fragment in an inverted index of m/z bins,
+so only references within the precursor window (or sharing a fragment, for open searches) are scored.
+Scores are the cosine of square-root intensities ('dot'), or unweighted spectral entropy similarity
+('entropy', Li et al. 2021). search_file scores an MGF or MSP file with a pool of worker processes.
+'''
+import csv
+import math
+import multiprocessing
+import numpy as np
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+methods = ['dot', 'entropy']
+chunkSize = 200 # Query spectra per job when searching with more than one process
+
+def read_queries(file_name):
+    '''Yields (title, precursor m/z or None, m/z, intensity) for each spectrum of an MGF or MSP file.'''
+    with open(file_name) as file:
+        if file_name.lower().endswith('.mgf'): yield from read_mgf(file)
+        else: yield from read_msp(file)
+
+def read_mgf(file):
+    title, precursor, peaks, inside = '', None, [], False
+    for line in file:
+        line = line.strip()
+        if line == 'BEGIN IONS': title, precursor, peaks, inside = '', None, [], True
+        elif line == 'END IONS':
+            if inside: yield spectrum(title, precursor, peaks)
+            inside = False
+        elif inside and '=' in line and not line[0].isdigit():
+            key, value = line.split('=', 1)
+            if key.upper() == 'TITLE': title = value
+            elif key.upper() == 'PEPMASS': precursor = float(value.split()[0])
+        elif inside and line: peaks.append(line.split()[:2])
+
+def read_msp(file):
+    title, precursor, peaks, remaining = '', None, [], 0
+    for line in file:
+        line = line.strip()
+        if remaining:
+            if line:
+                peaks.append(line.split()[:2])
+                remaining -= 1
+                if not remaining: yield spectrum(title, precursor, peaks)
+            continue
+        if ':' not in line: continue
+        key, value = (x.strip() for x in line.split(':', 1))
+        key = key.upper()
+        if key == 'NAME': title, precursor, peaks = value, None, []
+        elif key in ('PRECURSORMZ', 'PEPMASS'): precursor = float(value)
+        elif key == 'NUM PEAKS':
+            remaining = int(value)
+            if not remaining: yield spectrum(title, precursor, peaks)
+
+def spectrum(title, precursor, peaks):
+    peaks = np.array(peaks, dtype=float).reshape(-1, 2)
+    return title, precursor, peaks[:, 0], peaks[:, 1]
+
+def prepare(mz, intensity):
+    '''Peaks with intensity, sorted by m/z, with their intensities scaled for each method.'''
+    mz, intensity = np.asarray(mz, dtype=float), np.asarray(intensity, dtype=float)
+    keep = intensity > 0
+    order = np.argsort(mz[keep], kind='stable')
+    mz, intensity = mz[keep][order], intensity[keep][order]
+    if not len(mz): return mz, {method:intensity for method in methods}
+    root = np.sqrt(intensity)
+    return mz, {'dot':root/np.linalg.norm(root), 'entropy':intensity/intensity.sum()}
+
+def xlog2x(x):
+    return x*np.log2(x)
+
+class SpectralLibrary:
+    '''
+    Reference spectra with a precursor index and an inverted fragment index.
+    binWidth is the width in Da of the fragment bins, fragment tolerances may be wider.
+    Spectra are added with add(), then indexed by build(), which search() calls if needed.
+    '''
+    def __init__(self, binWidth=0.01):
+        self.binWidth = binWidth
+        self.names, self.adducts, self.classes = [], [], []
+        self.precursors, self.spectra = [], []
+        self.built = False
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, name, adduct, lipidClass, precursor, mz, intensity):
+        self.names.append(name)
+        self.adducts.append(adduct)
+        self.classes.append(lipidClass)
+        self.precursors.append(precursor)
+        self.spectra.append((mz, intensity))
+        self.built = False
+
+    @classmethod
+    def from_generator(cls, generator, binWidth=0.01):
+        '''Library of every spectrum of a Library.Generator, as it would write to an .MSP file.'''
+        library = cls(binWidth)
+        for lipid in generator.generate_range():
+            for key, record, count in generator.search_records(lipid):
+                if record: library.add(*record)
+        library.build()
+        return library
+
+    def build(self):
+        '''Sorts precursors, and concatenates peaks by reference and by fragment bin.'''
+        self.precursorMz = np.array(self.precursors, dtype=float)
+        self.precursorOrder = np.argsort(self.precursorMz, kind='stable')
+        self.precursorSorted = self.precursorMz[self.precursorOrder]
+
+        peaks = [prepare(mz, intensity) for mz, intensity in self.spectra]
+        counts = np.array([len(mz) for mz, weights in peaks], dtype=np.int64)
+        self.peakStart = np.concatenate([[0], np.cumsum(counts)])
+        self.peakMz = np.concatenate([mz for mz, weights in peaks]) if peaks else np.zeros(0)
+        self.peakWeights = {method:np.concatenate([weights[method] for mz, weights in peaks]) if peaks else np.zeros(0) for method in methods}
+        self.peakReference = np.repeat(np.arange(len(peaks)), counts)
+
+        bins = np.floor(self.peakMz/self.binWidth).astype(np.int64) # Inverted index, references of each fragment bin
+        order = np.argsort(bins, kind='stable')
+        self.bins, self.binReferences = bins[order], self.peakReference[order]
+        self.built = True
+
+    # ~ # ~ # ~ # Candidates
+
+    def precursor_candidates(self, precursor, tolerance):
+        '''References with a precursor within tolerance (ppm) of precursor.'''
+        shift = precursor*tolerance/1000000
+        start = np.searchsorted(self.precursorSorted, precursor - shift, 'left')
+        stop = np.searchsorted(self.precursorSorted, precursor + shift, 'right')
+        return np.sort(self.precursorOrder[start:stop])
+
+    def fragment_candidates(self, mz, tolerance, minimumPeaks=1, limit=2000):
+        '''
+        References with at least minimumPeaks fragment bins within tolerance (Da) of the peaks mz.
+        Only the limit references sharing the most bins are kept, headgroup fragments are shared by whole classes.
+        '''
+        reach = max(1, math.ceil(tolerance/self.binWidth))
+        queryBins = np.unique((np.floor(mz/self.binWidth).astype(np.int64)[:, None] + np.arange(-reach, reach+1)).ravel())
+        start = np.searchsorted(self.bins, queryBins, 'left')
+        stop = np.searchsorted(self.bins, queryBins, 'right')
+        counts = stop - start
+        postings = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(start, counts)
+        shared = np.bincount(self.binReferences[postings], minlength=len(self))
+        candidates = np.nonzero(shared >= minimumPeaks)[0]
+        if len(candidates) > limit:
+            candidates = np.sort(candidates[np.argsort(-shared[candidates], kind='stable')[:limit]])
+        return candidates
+
+    # ~ # ~ # ~ # Scoring
+
+    def score(self, candidates, mz, weights, tolerance, method):
+        '''Similarity and number of matched peaks of each candidate, against query peaks mz with weights.'''
+        counts = self.peakStart[candidates+1] - self.peakStart[candidates]
+        owner = np.repeat(np.arange(len(candidates)), counts)
+        peaks = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(self.peakStart[candidates], counts)
+        if not len(peaks) or not len(mz): return np.zeros(len(candidates)), np.zeros(len(candidates), dtype=np.int64)
+
+        referenceMz = self.peakMz[peaks] # Nearest query peak to each reference peak
+        right = np.clip(np.searchsorted(mz, referenceMz), 0, len(mz)-1)
+        left = np.clip(right-1, 0, len(mz)-1)
+        nearest = np.where(np.abs(mz[left]-referenceMz) <= np.abs(mz[right]-referenceMz), left, right)
+        matched = np.abs(mz[nearest]-referenceMz) <= tolerance
+        owner, peaks, nearest = owner[matched], peaks[matched], nearest[matched]
+
+        p, q = self.peakWeights[method][peaks], weights[nearest]
+        if method == 'dot': contribution = p*q
+        else: contribution = (xlog2x(p+q) - xlog2x(p) - xlog2x(q))/2
+
+        # A query peak counts once for each candidate, with its best reference peak
+        order = np.lexsort((-contribution, nearest, owner))
+        owner, nearest, contribution = owner[order], nearest[order], contribution[order]
+        first = np.ones(len(owner), dtype=bool)
+        first[1:] = (owner[1:] != owner[:-1]) | (nearest[1:] != nearest[:-1])
+        owner, contribution = owner[first], contribution[first]
+        return (np.bincount(owner, weights=contribution, minlength=len(candidates)),
+                np.bincount(owner, minlength=len(candidates)))
+
+    def search(self, mz, intensity, precursor=None, precursorTolerance=10, fragmentTolerance=0.01,
+               method='dot', top=5, minimumPeaks=1, openLimit=2000):
+        '''
+        Best top references for one query spectrum, as (reference, score, matched peaks), best first.
+        With a precursor, references within precursorTolerance (ppm) are scored, otherwise the openLimit
+        references sharing the most fragment bins with the query. fragmentTolerance is in Da.
+        '''
+        if method not in methods: raise ValueError(f"Unknown similarity '{method}', choose from {', '.join(methods)}")
+        if not self.built: self.build()
+        mz, weights = prepare(mz, intensity)
+        if not len(mz): return []
+
+        if precursor is not None: candidates = self.precursor_candidates(precursor, precursorTolerance)
+        else: candidates = self.fragment_candidates(mz, fragmentTolerance, minimumPeaks, openLimit)
+        if not len(candidates): return []
+
+        scores, matched = self.score(candidates, mz, weights[method], fragmentTolerance, method)
+        keep = matched >= minimumPeaks
+        candidates, scores, matched = candidates[keep], scores[keep], matched[keep]
+        best = np.lexsort((candidates, -scores))[:top]
+        return [(int(candidates[i]), float(scores[i]), int(matched[i])) for i in best]
+
+    def __getstate__(self): # Worker processes only need the built arrays
+        state = self.__dict__.copy()
+        state['spectra'] = []
+        return state
+
+# ~ # ~ # ~ # Searching a file
+
+header = ['Query', 'Query Precursor m/z', 'Rank', 'Name', 'Adduct', 'Class', 'Library Precursor m/z', 'Precursor Error (ppm)',
+          'Score', 'Matched Peaks']
+
+def search_rows(library, queries, openSearch, settings):
+    '''Result rows for a list of (title, precursor, m/z, intensity) queries.'''
+    rows = []
+    for title, precursor, mz, intensity in queries:
+        hits = library.search(mz, intensity, None if openSearch else precursor, **settings)
+        for rank, (reference, score, matched) in enumerate(hits, 1):
+            libraryPrecursor = library.precursors[reference]
+            error = round((libraryPrecursor - precursor)/precursor*1000000, 2) if precursor else ''
+            rows.append([title, precursor if precursor is not None else '', rank, library.names[reference], library.adducts[reference],
+                         library.classes[reference], libraryPrecursor, error, round(score, 4), matched])
+        if not hits: rows.append([title, precursor if precursor is not None else ''] + ['']*(len(header)-2))
+    return rows
+
+def search_file(library, input_file, output_file, processes=1, openSearch=False, **settings):
+    '''
+    Searches every spectrum of an MGF or MSP file, and writes the best matches of each to output_file as .CSV.
+    openSearch ignores the precursor of each query, settings are as SpectralLibrary.search. Queries are split into jobs of chunkSize spectra between processes,
+    and written in file order. Returns the number of query spectra, and the number with at least one match.
+    '''
+    if not library.built: library.build()
+    searched = matched = 0
+    with open(output_file, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(header)
+
+        def write(queries, rows):
+            nonlocal searched, matched
+            searched += len(queries)
+            matched += sum(1 for row in rows if row[2] == 1) # Best match of each query
+            writer.writerows(rows)
+
+        if processes > 1:
+            with ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context('spawn'),
+                                     initializer=initialise_worker, initargs=(library,)) as pool:
+                pending = deque()
+                for queries in chunks(read_queries(input_file)): # Bounded number of jobs in flight, as Library.run_parallel
+                    pending.append((queries, pool.submit(search_job, queries, openSearch, settings)))
+                    if len(pending) >= 2*processes:
+                        queries, future = pending.popleft()
+                        write(queries, future.result())
+                while pending:
+                    queries, future = pending.popleft()
+                    write(queries, future.result())
+        else:
+            for queries in chunks(read_queries(input_file)):
+                write(queries, search_rows(library, queries, openSearch, settings))
+    return searched, matched
+
+def chunks(queries):
+    chunk = []
+    for query in queries:
+        chunk.append(query)
+        if len(chunk) == chunkSize:
+            yield chunk
+            chunk = []
+    if chunk: yield chunk
+
+# Worker processes for search_file, each holding a copy of the library.
+
+worker = None
+
+def initialise_worker(library):
+    global worker
+    worker = library
+
+def search_job(queries, openSearch, settings):
+    return search_rows(worker, queries, openSearch, settings)
@@ -52,7 +52,7 @@ class PredefinedFragment(QDialog):
             f = getattr(GL, frag[0][0:-1]) if frag[0][-1] == 'x' else frag[1]
             
             # check if unique fragment, isinstance excludes custom fragments from the list
-            if f not in [key for key  in self.lipid.adducts[self.adduct] if not isinstance(key, GL.Fragment)]:
+            if f not in [key for key  in self.lipid.adductSpectra()[self.adduct] if not isinstance(key, GL.Fragment)]:
                 try: 
 
                     # First try if fragment can be made
@@ -174,13 +174,13 @@ class CustomisedFragment(QDialog):
         if not self.massBox.text() or not self.formulaBox.text():
             pass
         else:
-            self.lipid.adducts[self.adduct][self.fragment] = 0
+            self.lipid.adductSpectra()[self.adduct][self.fragment] = 0
             self.done(1)
             self.close()
 
     def updateBoxes(self):
         self.massBox.setText(str(self.fragment.MZ()))
-        self.formulaBox.setText(''.join(''.join((key, str(val))) for (key, val ) in self.fragment.Formula().items() if val !=0))
+        self.formulaBox.setText(str(self.fragment.Formula()))
 
     def updateFragmentString(self):
         
@@ -374,22 +374,22 @@ class LipidWindow(QDialog):
         adductType = self.adductBox.currentText() # Adduct
         lipidClass = self.lipidBox.currentData() # Lipid
         row = int(index.row()) # Location of edit in table
-        adducts = copy.deepcopy(self.lipid.adducts) # Spectra
+        adducts = copy.deepcopy(self.lipid.adductSpectra()) # Spectra
         data = self.table.tdata[row] # Edited data from table
         adducts[adductType][data.fragmentType] = data.intensity
         if self.classEdit:
             lipidClass.adducts = adducts # Overwrite Class
             self.buildLipid() # Rebuild Lipid
         else:
-            self.lipid.adducts = adducts # Overwrite Lipid
+            self.lipid.editedAdducts = adducts # Overwrite Lipid
             self.updateSpectra(self.lipid)
 
     def updateSpectra(self, lipid=None):
 
         try:
             adduct = self.adductBox.currentText()
-            lipid.resolve_spectra(adduct, lipid.adducts[adduct])
-            formula = ''.join(''.join((key, str(val))) for (key, val) in lipid.formula.items())
+            lipid.resolve_spectra(adduct, lipid.adductSpectra()[adduct])
+            formula = str(lipid.formula)
             name = lipid.name+' '+adduct+' '+formula
             mz = GL.MA(lipid, adduct, 0).mass
             frags = lipid.spectra[adduct]
@@ -474,7 +474,7 @@ class LipidWindow(QDialog):
             if selection.text() == 'Add Predefined Fragment':
                 fragment = EF.PredefinedFragment(self.lipid, self.adductBox.currentText())
                 if fragment.exec() > 0:
-                    self.lipid.adducts[self.adductBox.currentText()][fragment.selection] = 0
+                    self.lipid.adductSpectra()[self.adductBox.currentText()][fragment.selection] = 0
                     self.updateSpectra(self.lipid)
 
             elif selection.text() == 'Add Customised Fragment':
@@ -528,7 +528,7 @@ class LipidWindow(QDialog):
                         f"MW: {self.lipid.mass}\n"
                         f"PRECURSORMZ: {GL.MA(self.lipid, adduct, 0).mass}\n"
                         f"COMPOUNDCLASS: {self.lipid.lipid_class}\n"
-                        f"FORMULA: {''.join(''.join((key, str(val))) for (key, val) in self.lipid.formula.items())}\n"
+                        f"FORMULA: {self.lipid.formula}\n"
                         f"SMILES: {self.lipid.ambiguoussmiles if self.lipid.ambiguoussmiles else self.lipid.smiles}\n"
                         f"COMMENT: LSG in-silico\n" 
                         f"RETENTIONTIME: 0.00\n" # Pointless
@@ -554,8 +554,8 @@ class LipidWindow(QDialog):
         try:
             file = open(f'{saveLocation}\{templateName}.pkl', 'wb')
             data = {'lipidClass':self.lipid.__class__, 
-                    'adducts':{adduct:GL.adducts[adduct] for adduct in self.lipid.adducts}, 
-                    'spectra':self.lipid.adducts}
+                    'adducts':{adduct:GL.adducts[adduct] for adduct in self.lipid.adductSpectra()}, 
+                    'spectra':self.lipid.adductSpectra()}
             print(data)
             dill.dump(data, file)
             print('data dumped')
@@ -1,9 +1,9 @@
 import os
-import re
 import random
 
 import Wizard.Draw as dM
 import Wizard.EditTail as ET
+import Library
 import ResourcePath as RP
 import Lipids.GenerateLipids as GL
 
@@ -93,26 +93,8 @@ class Page(QWizardPage):
         file_name, filter = QFileDialog.getOpenFileName(filter="Tail List (*.txt)", selectedFilter='')
 
         if file_name and os.path.exists(file_name):
-            open_file = open(file_name, 'r')
-            lines = [line.strip() for line in open_file.readlines()]
-            lines = [re.split(r'\s{1,}', line) for line in lines]
-            for line in lines:
-                type=line[2]
-                if type in ['Acyl', 'Ether', 'Vinyl']:
-                    try:
-                        tail = GL.sn(c=int(line[0]), d=int(line[1]),
-                                     type=line[2],   me=int(line[3]),
-                                     oh=int(line[4]),dt=int(line[5]))
-                        self.getTail(tail)
-                    except: continue
-                elif type in GL.baseTypes:
-                    try:
-                        base = GL.base(c=int(line[0]),
-                                       type=line[2],
-                                       dt=int(line[5]))
-                        self.getTail(base)
-                    except: continue        
-            open_file.close()
+            for tail in Library.read_tail_list(file_name):
+                self.getTail(tail)
 
     def exportTailList(self):
         file_name, filter = QFileDialog.getSaveFileName(filter="Tail List (*.txt)", selectedFilter='')
@@ -1,9 +1,12 @@
+import Library
+import Estimate
 import ResourcePath as RP
 import Wizard.EditLipidAdduct as LAEW
+import Lipids.GenerateLipids as GL
 
 from PySide6.QtGui import QPixmap, QCursor, QColor
 from PySide6.QtCore import Property, Qt, Signal
-from PySide6.QtWidgets import QPushButton, QCheckBox, QTreeWidget, QTreeWidgetItem, QVBoxLayout, QWizard, QWizardPage, QMenu, QApplication
+from PySide6.QtWidgets import QPushButton, QCheckBox, QLabel, QTreeWidget, QTreeWidgetItem, QVBoxLayout, QWizard, QWizardPage, QMenu, QApplication
 
 class Page(QWizardPage):
     '''
@@ -37,6 +40,7 @@ class Page(QWizardPage):
         self.specificOrganisation.setChecked(True)
         self.specificOrganisation.setVisible(False)
         self.registerField('specificOrganisation', self.specificOrganisation)
+        self.specificOrganisation.toggled.connect(self.updateEstimate)
 
         self.treeView = QTreeWidget()
         self.treeView.setContextMenuPolicy(Qt.CustomContextMenu)
@@ -52,6 +56,9 @@ class Page(QWizardPage):
 
         self.vLayout.addWidget(self.treeView)
 
+        self.estimateLabel = QLabel() # Size of the selection, updated as boxes are ticked
+        self.vLayout.addWidget(self.estimateLabel)
+
         self.modifybutton = QPushButton("Modify Lipid Templates")
         self.modifybutton.clicked.connect(self.editLipid)
         self.vLayout.addWidget(self.modifybutton)
@@ -64,6 +71,31 @@ class Page(QWizardPage):
                 item.setBackground(0, QColor('#c7ecee'))
             self.completeChanged.emit()
         except: pass # Sometimes QtCore.QModelIndex passed
+        self.updateEstimate()
+
+    def updateEstimate(self):
+        '''Counts the lipids and spectra of the selected classes and adducts, without generating them.'''
+        selected = {item.lipidClass:{adduct.text(0):adduct.fragmentList for adduct in adducts} for item, adducts in self.treeData().items()}
+        classes_to_generate = list(selected) # Classes are left as they are, until generated from Page 5
+        if not classes_to_generate:
+            self.estimateLabel.setText('')
+            return
+
+        tails_to_generate = [int(self.field('cmin') or 0), int(self.field('cmax') or 0),
+                             int(self.field('dmin') or 0), int(self.field('dmax') or 0),
+                             int(self.field('omax') or 0), int(self.field('Umax') or 0)]
+        base_types = list({base for cls in classes_to_generate if issubclass(cls, GL.Sphingolipid) for base in cls.base_types})
+        if self.field('ceramideVariability') is False:
+            bases_to_generate = [18, 18, base_types]
+        else: bases_to_generate = [max(tails_to_generate[0], 7), max(tails_to_generate[1], 7), base_types]
+
+        try:
+            generator = Library.Generator(None, "MSP (*.msp)", classes_to_generate, tails_to_generate, bases_to_generate,
+                                          False, False, [], self.field('tailSpecific'), self.field('tailList'),
+                                          self.specificOrganisation.isChecked())
+            estimate = Estimate.estimate(generator, samples=0, adducts=selected)
+            self.estimateLabel.setText(f'{estimate.lipids:,} lipids, {estimate.spectra:,} spectra')
+        except Exception: self.estimateLabel.setText('') # Tails not yet defined
 
     def updateCheckedState(self):
         if QApplication.mouseButtons() == Qt.LeftButton:
@@ -151,6 +183,8 @@ class Page(QWizardPage):
             self.specificOrganisation.setVisible(False)
             self.specificOrganisation.setChecked(True)
 
+        self.updateEstimate()
+
         return super().initializePage()
 
     def isComplete(self):
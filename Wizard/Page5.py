@@ -1,6 +1,9 @@
 import os
 import time
 import SaveAs
+import Library
+import Estimate
+import Profiling
 import ResourcePath as RP
 import Lipids.GenerateLipids as GL
 
@@ -8,7 +11,7 @@ from PySide6.QtGui import QPixmap
 from PySide6.QtCore import QThread
 from PySide6.QtWidgets import QFileDialog
 from PySide6.QtWidgets import QProgressBar
-from PySide6.QtWidgets import QPlainTextEdit, QPushButton, QVBoxLayout, QWizard, QWizardPage
+from PySide6.QtWidgets import QPlainTextEdit, QPushButton, QCheckBox, QSpinBox, QDoubleSpinBox, QComboBox, QVBoxLayout, QHBoxLayout, QWizard, QWizardPage
 
 class Page(QWizardPage):
     '''
@@ -44,7 +47,56 @@ class Page(QWizardPage):
         
         self.generatebutton.clicked.connect(self.save_as)
 
-        self.vLayout.addWidget(self.generatebutton)
+        # Stops generation after the current job, the file written so far is complete and can be resumed.
+        self.cancelbutton = QPushButton("Cancel")
+        self.cancelbutton.setEnabled(False)
+        self.cancelbutton.clicked.connect(self.cancel)
+
+        # Number of processes used to generate the library. Output is identical regardless.
+        self.processes = QSpinBox()
+        self.processes.setPrefix('Processes: ')
+        self.processes.setRange(1, os.cpu_count() or 1)
+        self.processes.setValue(1) # Until the library is estimated, see estimateSize
+        self.processes.setToolTip('Number of processes used to generate the library.\n'
+                                  'The file generated is identical regardless of the number used.')
+
+        # Orbitrap inclusion lists only, precursors within this window of an earlier precursor are left out.
+        self.mergePPM = QDoubleSpinBox()
+        self.mergePPM.setPrefix('Merge within: ')
+        self.mergePPM.setSuffix(' ppm')
+        self.mergePPM.setRange(0, 100)
+        self.mergePPM.setDecimals(1)
+        self.mergePPM.setToolTip('Orbitrap inclusion lists only.\n'
+                                 'Precursors within this many ppm of an earlier precursor are merged into it.\n'
+                                 'At 0 ppm only identical precursor masses are merged.')
+
+        # Records of each class are kept in the Cache folder, and reused while the class and settings are unchanged.
+        self.incremental = QCheckBox('Incremental')
+        self.incremental.setToolTip('Keep the records of each class, and only regenerate classes\n'
+                                    'whose template, adducts, tails or settings have changed since.\n'
+                                    'The file generated is identical to a full build.')
+
+        # Time spent in each stage, lipid class and fragment is printed to console, and saved beside the file.
+        self.profile = QCheckBox('Profile')
+        self.profile.setToolTip('Time each stage of generation, lipid class and fragment type.\n'
+                                'A summary is printed when complete, and saved beside the file as .profile.json')
+
+        # Skyline transition lists only, also written as a file per lipid class or polarity.
+        self.split = QComboBox()
+        self.split.addItems(['One file', 'Split by class', 'Split by polarity'])
+        self.split.setToolTip('Skyline transition lists only.\n'
+                              'Also write the transitions of each lipid class or polarity to their own file\n'
+                              'beside the full list, e.g. lipids.PC.csv, so they can be imported in parallel.')
+
+        self.hLayout = QHBoxLayout()
+        self.hLayout.addWidget(self.generatebutton, 1)
+        self.hLayout.addWidget(self.cancelbutton)
+        self.hLayout.addWidget(self.processes)
+        self.hLayout.addWidget(self.mergePPM)
+        self.hLayout.addWidget(self.split)
+        self.hLayout.addWidget(self.incremental)
+        self.hLayout.addWidget(self.profile)
+        self.vLayout.addLayout(self.hLayout)
 
         self.output_console = QPlainTextEdit()
         self.output_console.setStyleSheet("""QPlainTextEdit {
@@ -78,7 +130,14 @@ class Page(QWizardPage):
     def unsupported_fileType(self):
         self.generatorThread.exit()
         self.progress_bar.setMaximum(1)
+        self.progress_bar.resetFormat()
         self.generatebutton.setEnabled(True)
+        self.cancelbutton.setEnabled(False)
+        self.processes.setEnabled(True)
+        self.mergePPM.setEnabled(True)
+        self.split.setEnabled(True)
+        self.incremental.setEnabled(True)
+        self.profile.setEnabled(True)
         self.output_console.appendPlainText('Unsupported file type')
         try :self.generatorThread.exit()
         except: pass
@@ -88,27 +147,62 @@ class Page(QWizardPage):
         self.t1 = time.time()
         self.progress_bar.setMaximum(1)
         self.progress_bar.setValue(1)
+        self.progress_bar.resetFormat()
         self.generatebutton.setEnabled(True)
+        self.cancelbutton.setEnabled(False)
+        self.processes.setEnabled(True)
+        self.mergePPM.setEnabled(True)
+        self.split.setEnabled(True)
+        self.incremental.setEnabled(True)
+        self.profile.setEnabled(True)
         self.output_console.appendPlainText(f"Generated {self.generatorObject.count} {self.generatorObject.noun} in {self.t1-self.t0:.4f} seconds!")
+        if self.generatorObject.cancelled:
+            self.output_console.appendPlainText("Cancelled, the file holds everything generated until then. Generate to the same file again to resume.")
+        if self.generatorObject.collapsed:
+            self.output_console.appendPlainText(f"Collapsed {self.generatorObject.collapsed} spectra into species-level spectra")
+        if self.generatorObject.reused:
+            self.output_console.appendPlainText(f"Reused {self.generatorObject.reused} of {len(self.classes_to_generate)} classes from cache")
+        if self.generatorObject.megabytes: # Only measured where output is buffered
+            self.output_console.appendPlainText(f"Wrote {self.generatorObject.megabytes:.1f} MB at {self.generatorObject.throughput:.1f} MB/s")
+        if self.generatorObject.profile:
+            for line in Profiling.describe(self.generatorObject.profile): self.output_console.appendPlainText(line)
+            self.output_console.appendPlainText(f"Profile saved to {Profiling.summary_path(self.generatorObject.file_name)}")
+        for file_name in self.generatorObject.split_files:
+            self.output_console.appendPlainText(f"Split into {file_name}")
         try :self.generatorThread.exit()
         except: pass
 
     def classCompleted(self, cls):
-        consoleText = self.output_console.toPlainText()
         try: name = cls.givenName
         except: name = cls.__name__
-        consoleText = consoleText.replace('- '+name+' ', '- '+name+' - Completed')
-        self.output_console.setPlainText(consoleText)
+        self.output_console.appendPlainText('- '+name+' - Completed')
+
+    def updateStatus(self, done, total, count, rate, remaining):
+        '''Progress bar shows combinations done, with records written, records per second and time remaining.'''
+        self.progress_bar.setMaximum(1000) # Totals may exceed the range of the bar
+        self.progress_bar.setValue(int(1000*done/total) if total else 0)
+        eta = f'{int(remaining)//3600}:{int(remaining)%3600//60:02}:{int(remaining)%60:02}' if remaining is not None else '-:--:--'
+        noun = getattr(self.generatorObject.library, 'noun', 'records')
+        self.progress_bar.setFormat(f"%p%  -  {count:,} {noun}  -  {rate:,.0f} {noun}/s  -  ETA {eta}")
+
+    def cancel(self):
+        self.cancelbutton.setEnabled(False)
+        self.output_console.appendPlainText('Cancelling...')
+        self.generatorObject.cancel()
 
     def save_as(self):
         '''Popup 'Save as' dialogue box'''
         # Create save location
-        file_name, filter = QFileDialog.getSaveFileName(filter="MSP (*.msp);;Orbitrap Inclusion (*.csv);;Skyline Transition (*.csv)", selectedFilter='')
+        file_name, filter = QFileDialog.getSaveFileName(filter="MSP (*.msp);;Orbitrap Inclusion (*.csv);;Skyline Transition (*.csv);;Isotope Envelope (*.csv);;LSG Library (*.lsgl)", selectedFilter='')
 
         if file_name:
-            if os.path.exists(file_name): # If save location exists, override
+            if Library.resumes(file_name, filter, Library.checkpointInterval, self.field('lipidSpecific')): # Stopped before completion
+                self.output_console.appendPlainText('Resuming {} from its last checkpoint, if settings are unchanged...'.format(file_name))
+            elif os.path.exists(file_name): # If save location exists, override
                 self.output_console.appendPlainText('Overwriting {}...'.format(file_name))
-                try:os.remove(file_name) # Removes if exists
+                try:
+                    os.remove(file_name) # Removes if exists
+                    if os.path.exists(Library.checkpoint_path(file_name)): os.remove(Library.checkpoint_path(file_name)) # Stale
                 except PermissionError:
                     self.output_console.appendPlainText("Could not overwrite file. File may be in use.")
                     pass
@@ -116,16 +210,16 @@ class Page(QWizardPage):
 
             try:
                 self.progress_bar.setValue(0) # Sets loading animation
-                self.progress_bar.setMaximum(0) # for progress bar
-                consoleText = self.output_console.toPlainText()
-                consoleText = consoleText.replace(' - Completed', ' ')
-                self.output_console.setPlainText(consoleText)
+                self.progress_bar.setMaximum(0) # for progress bar, until the first status
 
                 self.generatorThread = QThread() # Generator on second thread so GUI doesn't lag!
                 self.generatorObject = SaveAs.Generator(file_name, filter,
                     self.classes_to_generate, self.tails_to_generate, self.bases_to_generate, 
                     self.field('isomerism'), self.field('lipidSpecific'), self.field('lipidList'),
-                    self.field('tailSpecific'), self.field('tailList'), self.field('specificOrganisation'))
+                    self.field('tailSpecific'), self.field('tailList'), self.field('specificOrganisation'), self.processes.value(),
+                    ppm=self.mergePPM.value(), cacheFolder=RP.exe_path('Cache') if self.incremental.isChecked() else None,
+                    checkpointInterval=Library.checkpointInterval, profile='stages' if self.profile.isChecked() else None,
+                    split=[None, *Library.splits][self.split.currentIndex()])
                 self.generatorObject.moveToThread(self.generatorThread)
                 self.generatorObject.fileError.connect(self.unsupported_fileType)
                 self.generatorThread.started.connect(self.generatorObject.run)
@@ -134,8 +228,15 @@ class Page(QWizardPage):
                 self.generatorObject.finished.connect(self.completeChanged)
                 self.generatorThread.finished.connect(self.generatorThread.deleteLater)
                 self.generatorObject.progress.connect(self.classCompleted)
+                self.generatorObject.status.connect(self.updateStatus)
                 self.generatorThread.start()
                 self.generatebutton.setEnabled(False)
+                self.cancelbutton.setEnabled(True)
+                self.processes.setEnabled(False)
+                self.mergePPM.setEnabled(False)
+                self.split.setEnabled(False)
+                self.incremental.setEnabled(False)
+                self.profile.setEnabled(False)
                 self.completeChanged.emit()
                 self.t0 = time.time()
                 self.hasGenerated = True
@@ -207,11 +308,28 @@ class Page(QWizardPage):
                 if self.field('hydroxytickbox'): # Include any hydroxy tails in console too!
                     self.output_console.appendPlainText('Oxidised tails included.\n')
 
+            self.estimateSize()
+
    
         self.progress_bar.reset()
 
         return super().initializePage()
 
+    def estimateSize(self):
+        '''Prints the number of lipids and spectra to console, and the size of the library in each format.'''
+        try:
+            generator = Library.Generator(None, "MSP (*.msp)", self.classes_to_generate, self.tails_to_generate, self.bases_to_generate,
+                                          self.field('isomerism'), False, [], self.field('tailSpecific'), self.field('tailList'),
+                                          self.field('specificOrganisation'))
+            estimate = Estimate.estimate(generator, samples=0)
+            self.output_console.appendPlainText(f'Estimated {estimate.lipids:,} lipids, {estimate.spectra:,} spectra:')
+            self.processes.setValue(self.processes.maximum() if estimate.spectra >= Library.parallelSpectra else 1)
+            for filter in Library.Generator.formats:
+                estimate = Estimate.estimate(generator, filter=filter)
+                self.output_console.appendPlainText(f'- {filter} - {estimate.records:,} {estimate.noun}, '
+                                                    f'{Estimate.describe(estimate.bytes)}')
+        except Exception as error: self.output_console.appendPlainText(f'Could not estimate library size: {error}')
+
     def nextId(self):
         return -1
 
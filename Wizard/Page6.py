@@ -1,16 +1,16 @@
 
-from scipy.stats import multinomial
 
-from collections import Counter
 import ResourcePath as RP
 import Lipids.GenerateLipids as GL
-from Lipids.GenerateLipids import elements
+import Lipids.Isotopes as Isotopes
+import Lipids.PrecursorIndex as PI
+import Annotate
 import Wizard.EditLipidAdduct as LAEW
 import Wizard.Spectra as Spectra
 
 from PySide6.QtCore import QObject, Signal, QThread, Qt, Signal, Property, QMimeData
 from PySide6.QtGui import QDoubleValidator, QCursor, QColor, QStandardItem, QStandardItemModel
-from PySide6.QtWidgets import QProgressBar,  QPlainTextEdit, QPushButton, QVBoxLayout, QHBoxLayout, QLineEdit, QComboBox, QWizardPage, QTreeWidget, QTreeWidgetItem, QMenu, QSplitter, QWidget, QApplication, QDialog, QTableView, QHeaderView, QSlider, QLabel
+from PySide6.QtWidgets import QProgressBar,  QPlainTextEdit, QPushButton, QVBoxLayout, QHBoxLayout, QLineEdit, QComboBox, QWizardPage, QTreeWidget, QTreeWidgetItem, QMenu, QSplitter, QWidget, QApplication, QDialog, QTableView, QHeaderView, QSlider, QLabel, QFileDialog
 
 class Page(QWizardPage):
     '''
@@ -130,6 +130,11 @@ class Page(QWizardPage):
         self.modifybutton.clicked.connect(self.editLipid)
         self.hLayout2.addWidget(self.modifybutton)
 
+        self.annotateButton = QPushButton("Annotate Mass List")
+        self.annotateButton.setToolTip('Search every m/z of a CSV or TSV feature table, and save the candidates')
+        self.annotateButton.clicked.connect(self.annotateMassList)
+        self.hLayout2.addWidget(self.annotateButton)
+
 
 
         self.progress_bar = QProgressBar()
@@ -181,6 +186,7 @@ class Page(QWizardPage):
     def generatorComplete(self):
 
         self.guesstimateButton.setEnabled(True)
+        self.annotateButton.setEnabled(True)
         self.treeView.setEnabled(True)
         self.modifybutton.setEnabled(True)
         self.errorType.setEnabled(True)
@@ -374,6 +380,7 @@ class Page(QWizardPage):
         else:
 
             self.guesstimateButton.setEnabled(False)
+            self.annotateButton.setEnabled(False)
             self.treeView.setEnabled(False)
             self.modifybutton.setEnabled(False)
             self.errorType.setEnabled(False)
@@ -402,6 +409,49 @@ class Page(QWizardPage):
             self.generatorThread.start()
             self.completeChanged.emit()
 
+    def annotateMassList(self):
+
+        self.updateConsole()
+        errorValid, error, _ = self.errorInput.validator().validate(self.errorInput.text(), 0)
+
+        if errorValid != QDoubleValidator.Acceptable or (float(error) > 2 and self.errorType.currentText() == "Da") or (float(error) > 100 and self.errorType.currentText() == "ppm"):
+            self.output_console.appendHtml(f"{self.yellow}Please specify valid error ( 0 - 100 ppm, 0 - 2 Da).\n")
+            return
+        elif len(self.classes_to_generate) < 1:
+            self.output_console.appendHtml(f"{self.yellow}Please select at least one lipid or adduct.\n")
+            return
+
+        input_file, filter = QFileDialog.getOpenFileName(filter="Feature Table (*.csv *.tsv *.txt)", selectedFilter='')
+        if not input_file: return
+        output_file, filter = QFileDialog.getSaveFileName(filter="Annotated Features (*.csv)", selectedFilter='')
+        if not output_file: return
+
+        self.guesstimateButton.setEnabled(False)
+        self.annotateButton.setEnabled(False)
+        self.treeView.setEnabled(False)
+        self.modifybutton.setEnabled(False)
+        self.errorType.setEnabled(False)
+        self.errorInput.setEnabled(False)
+        self.massInput.setEnabled(False)
+        self.ionType.setEnabled(False)
+        self.reviewButton.setEnabled(False)
+        self.hasGenerated = False
+        self.candidatesString = []
+        self.candidatesData = []
+
+        self.progress_bar.setValue(0)
+        self.progress_bar.setMaximum(0)
+
+        self.generatorObject = Annotator(input_file, output_file, float(error), self.errorType.currentText(), self.classes_to_generate,
+                                         self.ionType.currentText(), self.tails_to_generate, self.bases_to_generate)
+        self.generatorObject.moveToThread(self.generatorThread)
+        self.generatorThread.started.connect(self.generatorObject.run)
+        self.generatorObject.consoleOutput.connect(self.appendToConsole)
+        self.generatorObject.finished.connect(self.generatorComplete)
+        self.generatorObject.finished.connect(self.generatorObject.deleteLater)
+        self.generatorThread.start()
+        self.completeChanged.emit()
+
     def determineMassBounds(self, mass, error, errorType):
         if errorType == 'ppm':
             massShift = mass*(error / 1000000)
@@ -468,7 +518,7 @@ class Generator(QObject):
         #                           int(self.field('omax') or 0), int(self.field('Umax') or 0)]
 
         self.classes_to_generate = classes_to_generate
-        self.cmin, self.cmax, self.dmin, self.dmax, self.omax, self.Umax = tails_to_generate
+        self.tails_to_generate = tails_to_generate
         self.b2G = bases_to_generate
         self.ionMode = ionMode
 
@@ -487,150 +537,79 @@ class Generator(QObject):
         
         #import pydevd;pydevd.settrace(suspend=False)
 
-        prevNumKeys = 0
-
-        for lipidClass in self.classes_to_generate:
-
-            constituents = lipidClass.tailOrganisation # List of tails and organisation: ['B', 'AA', 'A'], indicates a sphingoid Base, -
-
-            numKeys = 0
-            for x in constituents: # ie, for 'B', 'AA', 'A' in ['B', 'AA', 'A']
-                group = dict(Counter(x)) # {'B':1}, {'A':2}, {'A':1}
-
-                for key in group:
-                    numKeys += group[key]
-
-            constituentList = [] # a combination of two tails, and another tail independent of the previous combination is needed.
-            minimumUnits = []
-
-            for x in constituents:
-                group = dict(Counter(x))
-
-                for key in group:
-                    if key == 'B':
-                        self.bases = GL.generate_base_tails(self.b2G)
-                        basesToUse = list(self.flatten([self.bases[basetype] if basetype in self.bases.keys() else self.bases[basetype] for basetype in lipidClass.base_types]))
-                        basesToUse.sort()
-                        [constituentList.append(basesToUse) for n in range(group[key])]
-                        [minimumUnits.append(basesToUse) for n in range(group[key])]
-                    elif key == 'A':
-                        if numKeys != prevNumKeys:
-                            self.acyls = GL.generate_tails([self.cmin, (self.cmax*numKeys), self.dmin, self.dmax*numKeys, self.omax*numKeys, self.Umax*numKeys], 'Acyl')
-                            self.acyls.sort()
-                        [constituentList.append(self.acyls) for n in range(group[key])]
-                        [minimumUnits.append([GL.sn(1, type='Acyl')]) for n in range(group[key])]
-                    elif key == 'O':                       
-                        self.ethers = GL.generate_tails([self.cmin, (self.cmax*numKeys), self.dmin, self.dmax*numKeys, self.omax*numKeys, self.Umax*numKeys], 'Ether')
-                        self.ethers.sort()
-                        [constituentList.append(self.ethers) for n in range(group[key])]
-                        [minimumUnits.append([GL.sn(1, type='Ether')]) for n in range(group[key])]
-                    elif key == 'P':                      
-                        self.vinyls = GL.generate_tails([self.cmin, (self.cmax*numKeys), self.dmin, self.dmax*numKeys, self.omax*numKeys, self.Umax*numKeys], 'Vinyl')
-                        self.vinyls.sort()
-                        [constituentList.append(self.vinyls) for n in range(group[key])]
-                        [minimumUnits.append([GL.sn(1, type='Vinyl')]) for n in range(group[key])]
-                    else: pass
-
-            tailComb = [tailType[0] for tailType in constituentList]
-            minLipid = lipidClass(*tailComb)
-            tailComb[-1] = constituentList[-1][-1]
-            maxLipid = lipidClass(*tailComb)
-
-            for adduct in self.classes_to_generate[lipidClass]:
-
-                if self.ionMode == '-' and GL.adducts[adduct][2] > 0:
-                    continue
-                if self.ionMode == '+' and GL.adducts[adduct][2] < 0:
-                    continue
-
-                minLipidMass = GL.MA(minLipid, adduct, 0).mass
-                maxLipidMass = GL.MA(maxLipid, adduct, 0).mass
-                lD = self.candidateMaxMass - minLipidMass # distance to lower threshold from candidate
-                uD = maxLipidMass - self.candidateMinMass # distance to upper threshold from candidate
-
-                if lD < 0 or uD < 0: # negative distance means candidate is outside of thresholds.
-                    continue
-                else:
-                    tailComb = [tailType[0] for tailType in minimumUnits] # Gotta 
-                    candidates = self.binSearchBetweenVals(self.candidateMinMass, self.candidateMaxMass, lipidClass, constituentList, minimumUnits, adduct)
-                    for candidate in candidates:
-                        
-                        tailComb[-1] = constituentList[-1][candidate]
-                        candidate = lipidClass(*tailComb)
-                        candidateMass = GL.MA(candidate, adduct, 0).mass
-                        candidateFormula = candidate.formula.copy()
-                        candidateFormula += GL.adducts[adduct][3]
-                        cleanedFormula = ''.join(''.join((key, str(val if val > 1 else ''))) for (key, val) in candidateFormula.items()) 
-                        if GL.adducts[adduct][2] > 0: candidateCharge = f"{abs(GL.adducts[adduct][2])}+" if abs(GL.adducts[adduct][2]) > 1 else "+"
-                        else: candidateCharge = f"{abs(GL.adducts[adduct][2])}-" if abs(GL.adducts[adduct][2]) > 1 else "-"
-
-                        className = candidate.lipid_class
-                        tailName = self.addTailNames(candidate)
-                        massDiff = self.diffPPM(candidateMass, self.targetMass)
-
-                        self.consoleOutput.emit(f"{self.yellow}> {self.white}{className} {tailName}, "
-                                                        f"{self.orange}{adduct}, {self.yellow}[{cleanedFormula}]{candidateCharge}, " 
-                                                        f"{self.green}{candidateMass}, {self.white}({massDiff} ppm)")
-                        
-                        self.candidateData.emit([f"{className} {tailName}", f"{adduct}", f"[{cleanedFormula}]", candidateFormula, candidateCharge, abs(GL.adducts[adduct][2]), candidateMass, massDiff])
+        # Built once per selection of classes, adducts and tails, then kept in memory and on disk.
+        index = PI.PrecursorIndex.cached(self.classes_to_generate, self.tails_to_generate, self.b2G)
+        classOrder = list(self.classes_to_generate)
+        candidates = index.query(self.candidateMinMass, self.candidateMaxMass)
+        candidates.sort(key=lambda candidate: (classOrder.index(candidate[0]), self.classes_to_generate[candidate[0]].index(candidate[1]), candidate[3]))
 
-        self.finished.emit()
-        return
+        for lipidClass, adduct, candidate, candidateMass in candidates:
 
-    def flatten(self, data):
-        if isinstance(data, tuple) or isinstance(data, list):
-            for x in data: yield from self.flatten(x)
-        else: yield data
+            if self.ionMode == '-' and GL.adducts[adduct][2] > 0:
+                continue
+            if self.ionMode == '+' and GL.adducts[adduct][2] < 0:
+                continue
+
+            candidateFormula = candidate.formula.copy()
+            candidateFormula += GL.adducts[adduct][3]
+            cleanedFormula = ''.join(''.join((key, str(val if val > 1 else ''))) for (key, val) in candidateFormula.items()) 
+            if GL.adducts[adduct][2] > 0: candidateCharge = f"{abs(GL.adducts[adduct][2])}+" if abs(GL.adducts[adduct][2]) > 1 else "+"
+            else: candidateCharge = f"{abs(GL.adducts[adduct][2])}-" if abs(GL.adducts[adduct][2]) > 1 else "-"
 
-    def binSearchBetweenVals(self, leftLimit, rightLimit, lipidClass, constituents, minimum, adduct):
+            className = candidate.lipid_class
+            tailName = PI.sumComposition(candidate)
+            massDiff = self.diffPPM(candidateMass, self.targetMass)
 
-        def binSearch(arr, target, low):
+            self.consoleOutput.emit(f"{self.yellow}> {self.white}{className} {tailName}, "
+                                            f"{self.orange}{adduct}, {self.yellow}[{cleanedFormula}]{candidateCharge}, " 
+                                            f"{self.green}{candidateMass}, {self.white}({massDiff} ppm)")
             
-            high = len(arr)
-            while low < high:
-                mid = (low + high) // 2
-                tailComb[-1] = constituents[-1][mid]
-                candidate = lipidClass(*tailComb)
-                candidateMass = GL.MA(candidate, adduct, 0).mass
-                if candidateMass < target:
-                    low = mid + 1
-                else:
-                    high = mid
-            return low
-
-        tailComb = [tailType[0] for tailType in minimum]
-        maxKey = len(constituents[-1])
-        arr = list(range(maxKey))
-
-        # Find first element >= lhs
-        leftIndex = binSearch(arr, leftLimit, 0)
-
-        # Find first element > rhs
-        rightIndex = binSearch(arr, rightLimit, leftIndex)
-
-        # Return elements between lhs and rhs
-        return arr[leftIndex:rightIndex]
-
-    def addTailNames(self, lipid):
-        c =  sum(snx.c  for snx in lipid.tails if snx.type != 'Headgroup')
-        d =  sum(snx.d  for snx in lipid.tails if snx.type != 'Headgroup')
-        me = sum(snx.me for snx in lipid.tails if snx.type != 'Headgroup')
-        oh = sum(snx.oh for snx in lipid.tails if snx.type != 'Headgroup')
-        dt = sum(snx.dt for snx in lipid.tails if snx.type != 'Headgroup')
-
-        name = f"{c}:{d}"
-        
-        if me > 0: # Methyl branching of fatty acid
-            name += f";{me}-M" 
-        if oh > 0: # Hydroxy functionalisation of fatty acid
-            name += f";O{oh}"
-        if dt > 0: # deuterium labelled fatty acids
-            name += f"(D{dt})" # Deuterium doesn't update smiles currently.
-        return name
-    
+            self.candidateData.emit([f"{className} {tailName}", f"{adduct}", f"[{cleanedFormula}]", candidateFormula, candidateCharge, abs(GL.adducts[adduct][2]), candidateMass, massDiff])
+
+        self.finished.emit()
+        return
+
     def diffPPM(self, candidate, target):
         return round(((candidate - target)/(target)) * 1000000, 2)
 
+class Annotator(QObject):
+    '''
+    Annotates every m/z of a feature table, see Annotate.annotate.
+    '''
+    consoleOutput = Signal(str)
+    finished = Signal()
+
+    def __init__(self, input_file, output_file, error, errorType, classes_to_generate, ionMode, tails_to_generate, bases_to_generate):
+        super().__init__()
+
+        self.input_file = input_file
+        self.output_file = output_file
+        self.error = error
+        self.errorType = errorType
+        self.classes_to_generate = classes_to_generate
+        self.ionMode = ionMode
+        self.tails_to_generate = tails_to_generate
+        self.b2G = bases_to_generate
+
+        self.white =    "<span style=' font-size:8pt; color:white;' >"
+        self.red =      "<span style=' font-size:8pt; color:red;' >"
+        self.yellow =   "<span style=' font-size:8pt; color:yellow;' >"
+        self.green =    "<span style=' font-size:8pt; color:limegreen;' >"
+
+    def run(self):
+
+        try:
+            index = PI.PrecursorIndex.cached(self.classes_to_generate, self.tails_to_generate, self.b2G)
+            features, annotated = Annotate.annotate(index, self.input_file, self.output_file, self.error, self.errorType, self.ionMode,
+                                                    lambda read: self.consoleOutput.emit(f"{self.yellow}> {self.white}{read} features searched"))
+        except (ValueError, OSError) as error:
+            self.consoleOutput.emit(f"{self.red}Could not annotate {self.input_file}: {error}")
+        else:
+            self.consoleOutput.emit(f"{self.yellow}> {self.green}{annotated} of {features} features annotated, {self.white}saved to {self.output_file}")
+
+        self.finished.emit()
+        return
+
 class NewWindow(QDialog):
     '''
     Window showing lipid classes, permits editing
@@ -688,6 +667,13 @@ class NewWindow(QDialog):
 
         self.valueLabel.setText(str(self.resSlider.sliderPosition()))
 
+        self.isotopeMode = QComboBox()
+        self.isotopeMode.addItem('Fine structure', 'fine')
+        self.isotopeMode.addItem('Nominal mass', 'nominal')
+        self.isotopeMode.setToolTip('Show every isotopologue, or sum isotopologues by nominal mass')
+        self.isotopeMode.currentIndexChanged.connect(self.changeIsotopeMode)
+        self.hLayout.addWidget(self.isotopeMode)
+
         self.candidateTable = QTableView()
         tableData = QStandardItemModel(len(candidates), 2, parent=None)
         headers = ['Candidate', 'Diff (ppm)']
@@ -743,6 +729,10 @@ class NewWindow(QDialog):
                 item.setData(tdata[row])
                 self.tableData.setItem(row, col, item)
                   
+    def changeIsotopeMode(self):
+        selection = self.candidateTable.selectionModel().selection()
+        if not selection.isEmpty(): self.updateSpectra(selection)
+
     def changeResolution(self):
             self.valueLabel.setText(str(self.resSlider.sliderPosition()))
             if self.spectra.curveDisplayed:
@@ -758,64 +748,9 @@ class NewWindow(QDialog):
                         self.tableData.setItem(row, col, item)
 
 
-    def sumContributions(self, elementContributions):
-        
-        def recursionLoop(depth, sum, intensity):
-            if depth == len(elementContributions):
-                contributions.append([sum, intensity])
-                return
-            for isotope in elementContributions[depth]:
-                recursionLoop(depth + 1,
-                                    sum + isotope[0],
-                                    intensity * isotope[1])
-        contributions = []
-        recursionLoop(0, 0, 1)
-        return contributions
-
-    def findArrangements(self, count, numIsotopes):
-        
-        arrangements = []
-        stack = [(0, [], count)]
-
-        while stack:
-            index, current, remaining = stack.pop()
-
-            if len(current) == numIsotopes:
-                if remaining == 0:
-                    arrangements.append(current)
-                continue
-
-            for i in range(0, remaining + 1):
-                stack.append((index + 1, current + [i], remaining - i))
-
-        return arrangements
-
     def determineIsotopeSpectra(self, formula, charge, threshold):
+        return Isotopes.isotopeSpectra(formula, charge, threshold, self.isotopeMode.currentData())
 
-        isotopeSpectra = []
-        
-        for element, count in formula.items():
-
-            elementContributions = [] # Probability dist of isotope combs for element.
-            mn = multinomial(count, [i[1] for i in elements[element]])
-            uniqueArrangements = self.findArrangements(count, len(elements[element]))
-
-            for comb in uniqueArrangements:
-                intensity = mn.pmf(comb)
-            
-                if intensity > threshold:
-                    mass = sum(val * isotope[0] for val, isotope in zip(comb, elements[element]))
-                    elementContributions.append([mass, intensity])
-            
-            isotopeSpectra.append(elementContributions)
-
-        isotopeSpectra = self.sumContributions(isotopeSpectra)
-        eMassDiff = -elements['e'][0][0]*charge # Difference in mass caused by charge
-        normalisationFactor = max([i[1] for i in isotopeSpectra]) # Most abundant mass should be 100% abn.
-        isotopeSpectra = [[round((i[0] + eMassDiff)/abs(charge), 6), 100*(i[1]/normalisationFactor)] for i in isotopeSpectra if i[1] > threshold]
-
-        return isotopeSpectra
-    
     def copyData(self):
             
             menu = QMenu()
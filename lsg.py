@@ -0,0 +1,330 @@
+'''
+Generate lipid libraries without the GUI, and without importing Qt.
+
+    python -m lsg generate --classes PC,PE --adducts "[M+H]+,[M+Na]+" --tails 12:0-24:6 --format msp --output lipids.msp
+    python -m lsg annotate --classes PC,PE,TG --tails 12:0-24:6 --ppm 5 features.csv -o annotated.csv
+    python -m lsg search --classes PC,PE --tails 14:0-22:6 --method entropy spectra.mgf -o matches.csv
+    python -m lsg export lipids.lsgl -o lipids.msp
+    python -m lsg classes
+
+Or from Python:
+
+    import lsg
+    lsg.generate('lipids.msp', ['PC', 'PE'], adducts=['[M+H]+'], tails='12:0-24:6')
+
+Enumeration and output are the same as the wizard, see Library.Generator.
+'''
+import os
+import re
+import sys
+import argparse
+import multiprocessing
+import Library
+import Annotate
+import Search
+import Compiled
+import Profiling
+import ResourcePath as RP
+import Lipids.GenerateLipids as GL
+import Lipids.Isotopes as Isotopes
+from Lipids.PrecursorIndex import PrecursorIndex
+
+formats = {'msp':"MSP (*.msp)", 'orb':"Orbitrap Inclusion (*.csv)", 'sky':"Skyline Transition (*.csv)",
+           'iso':"Isotope Envelope (*.csv)", 'lsgl':"LSG Library (*.lsgl)"}
+
+def find_classes(names, classes=None):
+    '''Lipid classes by class name or given name, e.g. 'PC' or 'Acylsphingosine'.'''
+    classes = classes or Library.lipid_classes()
+    lookup = {}
+    for cls in classes:
+        lookup[cls.__name__.lower()] = cls
+        lookup[getattr(cls, 'givenName', cls.__name__).lower()] = cls
+    for name in names:
+        if name.strip().lower() not in lookup: raise ValueError(f'Unknown lipid class: {name}')
+    return [lookup[name.strip().lower()] for name in names]
+
+def parse_tails(tails):
+    '''Tail range as 'cmin:dmin-cmax:dmax', e.g. '12:0-24:6'.'''
+    match = re.fullmatch(r'\s*(\d+):(\d+)\s*-\s*(\d+):(\d+)\s*', tails)
+    if not match: raise ValueError(f"Tail range '{tails}' should be given as cmin:dmin-cmax:dmax, e.g. 12:0-24:6")
+    cmin, dmin, cmax, dmax = (int(x) for x in match.groups())
+    return cmin, cmax, dmin, dmax
+
+def bases(classes, cmin, cmax, varyBases=False):
+    '''Sphingoid bases to generate for classes, as Page 5.'''
+    base_types = [] # Every base type used by the sphingolipid classes
+    for cls in classes:
+        if issubclass(cls, GL.Sphingolipid): base_types.extend(cls.base_types)
+    base_types = sorted(set(base_types)) # Sorted so the output does not depend on hash order
+    if varyBases: return [max(cmin, 7), max(cmax, 7), base_types]
+    return [18, 18, base_types]
+
+def generate(file_name, classes, adducts=None, tails='12:0-24:6', omax=0, Umax=0, format='msp', tailList=None,
+             varyBases=False, specificOrganisation=True, processes=1, overwrite=False, templates=None, progress=None,
+             bufferSize=Library.bufferSize, ppm=0, bloomCapacity=0, report=None, isotopePeaks=4, cacheFolder=None,
+             checkpointInterval=None, status=None, profile=None, split=None):
+    '''
+    Generates a library of the given lipid classes and writes it to file_name.
+    classes are lipid classes or their names, adducts defaults to every adduct of each class.
+    tails is a 'cmin:dmin-cmax:dmax' range, omax and Umax are the maximum hydroxylation and deuteration.
+    tailList is a list of GL.sn and GL.base, or a tail list file exported from the wizard, to use instead of tails.
+    ppm merges orbitrap inclusion precursors within ppm of an earlier precursor.
+    bloomCapacity, if given, tracks species-level spectra in a Bloom filter sized for that many spectra.
+    isotopePeaks is the number of peaks of each precursor envelope, for the 'iso' format.
+    cacheFolder, if given, keeps the records of each class there, and only regenerates classes that have changed.
+    checkpointInterval, if given, checkpoints the output every so many seconds, and continues an earlier run
+    of the same settings to file_name from its last checkpoint.
+    progress is called with each lipid class as it is completed, report with the finished Library.Generator.
+    status is called with (combinations done, total, records written, records/s, seconds remaining) as it runs.
+    profile, one of Profiling.captures, times each stage of generation and saves a summary beside file_name,
+    with a cProfile or pyinstrument capture if asked. The summary is the generator's profile.
+    split, 'class' or 'polarity' for the 'sky' format only, also writes the transitions into a file per class or polarity
+    beside file_name, listed in the generator's splitFiles.
+    Returns the number of records written.
+    '''
+    if format not in formats: raise ValueError(f"Unknown format '{format}', choose from {', '.join(formats)}")
+    available = Library.lipid_classes()
+    Library.load_templates(available, templates or RP.exe_path('Templates'))
+    classes = [find_classes([cls], available)[0] if isinstance(cls, str) else cls for cls in classes]
+
+    for cls in classes: # Same as selecting adducts on Page 3
+        cls.adducts_to_generate = {adduct:cls.adducts[adduct] for adduct in (adducts or cls.adducts) if adduct in cls.adducts}
+    for adduct in adducts or []:
+        if not any(adduct in cls.adducts for cls in classes):
+            raise ValueError(f"Adduct '{adduct}' is not available for {', '.join(cls.__name__ for cls in classes)}")
+
+    cmin, cmax, dmin, dmax = parse_tails(tails)
+    if isinstance(tailList, str): tailList = Library.read_tail_list(tailList)
+
+    bases_to_generate = bases(classes, cmin, cmax, varyBases)
+    if profile: Profiling.Profiler(profile) # Raises before the file is created if it can not be captured
+    if split and split not in Library.splits: raise ValueError(f"Unknown split '{split}', choose from {', '.join(Library.splits)}")
+    if split and format != 'sky': raise ValueError('Only Skyline transition lists (sky) can be split')
+
+    if os.path.exists(file_name) and not Library.resumes(file_name, formats[format], checkpointInterval, False):
+        if not overwrite: raise FileExistsError(f'{file_name} already exists')
+        os.remove(file_name)
+        if os.path.exists(Library.checkpoint_path(file_name)): os.remove(Library.checkpoint_path(file_name)) # Stale
+
+    generator = Library.Generator(file_name, formats[format], classes, [cmin, cmax, dmin, dmax, omax, Umax], bases_to_generate,
+                                  False, False, [], bool(tailList), tailList or [], specificOrganisation, processes, bufferSize, ppm, bloomCapacity,
+                                  isotopePeaks, cacheFolder, checkpointInterval, profile, split=split)
+    errors = []
+    generator.fileError.connect(lambda: errors.append(file_name))
+    if progress: generator.progress.connect(progress)
+    if status: generator.status.connect(status)
+    generator.run()
+    if errors: raise RuntimeError(f'Could not generate {file_name}')
+    if report: report(generator)
+    return generator.count
+
+def annotate(input_file, output_file, classes, adducts=None, tails='12:0-24:6', omax=0, Umax=0, varyBases=False,
+             tolerance=10, unit='ppm', ionMode='+/-', overwrite=False, templates=None, progress=None):
+    '''
+    Annotates the m/z of each feature in input_file, a CSV or TSV feature table, with every precursor
+    of the given lipid classes and adducts within tolerance (ppm or Da), as the wizard's mass search.
+    Tails and bases are as generate(). ionMode '+' or '-' limits candidates to one polarity.
+    Returns the number of features, and the number with at least one candidate.
+    '''
+    available = Library.lipid_classes()
+    Library.load_templates(available, templates or RP.exe_path('Templates'))
+    classes = [find_classes([cls], available)[0] if isinstance(cls, str) else cls for cls in classes]
+    classes_to_generate = {cls:[adduct for adduct in (adducts or cls.adducts) if adduct in cls.adducts] for cls in classes}
+    for adduct in adducts or []:
+        if not any(adduct in cls.adducts for cls in classes):
+            raise ValueError(f"Adduct '{adduct}' is not available for {', '.join(cls.__name__ for cls in classes)}")
+
+    if os.path.exists(output_file) and not overwrite: raise FileExistsError(f'{output_file} already exists')
+    cmin, cmax, dmin, dmax = parse_tails(tails)
+    index = PrecursorIndex.cached(classes_to_generate, [cmin, cmax, dmin, dmax, omax, Umax], bases(classes, cmin, cmax, varyBases))
+    return Annotate.annotate(index, input_file, output_file, tolerance, unit, ionMode, progress)
+
+def search(input_file, output_file, classes, adducts=None, tails='12:0-24:6', omax=0, Umax=0, varyBases=False,
+           specificOrganisation=True, method='dot', precursorTolerance=10, fragmentTolerance=0.01, openSearch=False,
+           top=5, minimumPeaks=1, processes=1, overwrite=False, templates=None):
+    '''
+    Scores each spectrum of input_file, an MGF or MSP file, against the spectra of the given lipid classes and adducts,
+    generated in memory as generate() would write them. Writes the top matches of each spectrum to output_file as .CSV.
+    method is 'dot' or 'entropy'. precursorTolerance is in ppm and fragmentTolerance in Da.
+    openSearch ignores query precursors, and scores every spectrum sharing a fragment with the query.
+    Returns the number of query spectra, and the number with at least one match.
+    '''
+    if method not in Search.methods: raise ValueError(f"Unknown similarity '{method}', choose from {', '.join(Search.methods)}")
+    available = Library.lipid_classes()
+    Library.load_templates(available, templates or RP.exe_path('Templates'))
+    classes = [find_classes([cls], available)[0] if isinstance(cls, str) else cls for cls in classes]
+    for cls in classes: # Same as selecting adducts on Page 3
+        cls.adducts_to_generate = {adduct:cls.adducts[adduct] for adduct in (adducts or cls.adducts) if adduct in cls.adducts}
+    for adduct in adducts or []:
+        if not any(adduct in cls.adducts for cls in classes):
+            raise ValueError(f"Adduct '{adduct}' is not available for {', '.join(cls.__name__ for cls in classes)}")
+
+    if os.path.exists(output_file) and not overwrite: raise FileExistsError(f'{output_file} already exists')
+    cmin, cmax, dmin, dmax = parse_tails(tails)
+    GL.fragmentCache.clear() # As Library.Generator.run
+    generator = Library.Generator(None, formats['msp'], classes, [cmin, cmax, dmin, dmax, omax, Umax], bases(classes, cmin, cmax, varyBases),
+                                  False, False, [], False, [], specificOrganisation)
+    library = Search.SpectralLibrary.from_generator(generator, max(fragmentTolerance, 0.001))
+    return Search.search_file(library, input_file, output_file, processes, openSearch, method=method, precursorTolerance=precursorTolerance,
+                              fragmentTolerance=fragmentTolerance, top=top, minimumPeaks=minimumPeaks)
+
+def export(file_name, output_file, overwrite=False):
+    '''Writes the spectra of a compiled library (.lsgl) to output_file as .MSP. Returns the number of spectra.'''
+    library = Compiled.CompiledLibrary(file_name)
+    if os.path.exists(output_file):
+        if overwrite: os.remove(output_file)
+        else: raise FileExistsError(f'{output_file} already exists')
+    return library.to_msp(output_file)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='lsg', description='Lipid Spectrum Generator')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    listing = commands.add_parser('classes', help='List lipid classes and their adducts')
+    listing.add_argument('--templates', help='Folder of modified lipid templates, defaults to the Templates folder')
+
+    command = commands.add_parser('generate', help='Generate a library')
+    command.add_argument('--classes', required=True, help='Comma separated lipid classes, e.g. PC,PE,TG')
+    command.add_argument('--adducts', help='Comma separated adducts, e.g. "[M+H]+,[M+Na]+". Defaults to every adduct of each class')
+    command.add_argument('--tails', default='12:0-24:6', help='Tail range as cmin:dmin-cmax:dmax (default 12:0-24:6)')
+    command.add_argument('--omax', type=int, default=0, help='Maximum hydroxylation of tails')
+    command.add_argument('--deuterium', type=int, default=0, help='Maximum deuteration of tails')
+    command.add_argument('--tail-list', help='Tail list exported from the wizard, used instead of --tails')
+    command.add_argument('--vary-bases', action='store_true', help='Vary ceramide base length with fatty acids')
+    command.add_argument('--ignore-headgroup-isomerism', action='store_true',
+                         help='Treat fatty acyls on the headgroup and glycerol backbone as equivalent')
+    command.add_argument('--format', choices=list(formats), default='msp',
+                         help='msp library, orbitrap inclusion list, skyline transition list, precursor isotope envelopes '
+                              'or compiled library (lsgl, see lsg export)')
+    command.add_argument('--output', '-o', required=True)
+    command.add_argument('--overwrite', action='store_true')
+    command.add_argument('--processes', type=int, default=1)
+    command.add_argument('--templates', help='Folder of modified lipid templates, defaults to the Templates folder')
+    command.add_argument('--buffer-size', type=int, default=Library.bufferSize, help='Bytes of output held before writing to file')
+    command.add_argument('--merge-ppm', type=float, default=0,
+                         help='Orbitrap inclusion lists only, merge precursors within this many ppm of an earlier precursor')
+    command.add_argument('--isotope-peaks', type=int, default=4, help='Isotope envelopes only, peaks per precursor (default 4)')
+    command.add_argument('--bloom-capacity', type=int, default=0,
+                         help='Track species-level spectra in a fixed size Bloom filter for this many spectra, for very large runs')
+    command.add_argument('--cache', help='Folder to keep the records of each class in, so only changed classes are regenerated')
+    command.add_argument('--resume', action='store_true',
+                         help='Checkpoint the output, and continue a stopped run of the same settings from its last checkpoint')
+    command.add_argument('--split', choices=Library.splits,
+                         help='Skyline transition lists only, also write a file per lipid class or polarity for parallel import')
+    command.add_argument('--profile', nargs='?', const='stages', choices=Profiling.captures,
+                         help='Time each stage, lipid class and fragment type, optionally with a cProfile or pyinstrument capture')
+    annotation = commands.add_parser('annotate', help='Annotate the m/z of a feature table with lipid precursors')
+    annotation.add_argument('input', help='CSV or TSV feature table, with an m/z column and optionally a polarity column')
+    annotation.add_argument('--output', '-o', required=True)
+    annotation.add_argument('--classes', required=True, help='Comma separated lipid classes, e.g. PC,PE,TG')
+    annotation.add_argument('--adducts', help='Comma separated adducts, e.g. "[M+H]+,[M+Na]+". Defaults to every adduct of each class')
+    annotation.add_argument('--tails', default='12:0-24:6', help='Tail range as cmin:dmin-cmax:dmax (default 12:0-24:6)')
+    annotation.add_argument('--omax', type=int, default=0, help='Maximum hydroxylation of tails')
+    annotation.add_argument('--deuterium', type=int, default=0, help='Maximum deuteration of tails')
+    annotation.add_argument('--vary-bases', action='store_true', help='Vary ceramide base length with fatty acids')
+    tolerance = annotation.add_mutually_exclusive_group()
+    tolerance.add_argument('--ppm', type=float, default=10, help='Permitted error in ppm (default 10)')
+    tolerance.add_argument('--da', type=float, help='Permitted error in Da, instead of ppm')
+    annotation.add_argument('--ion-mode', choices=['+/-', '+', '-'], default='+/-',
+                            help='Polarity of candidates, for tables without a polarity column')
+    annotation.add_argument('--overwrite', action='store_true')
+    annotation.add_argument('--templates', help='Folder of modified lipid templates, defaults to the Templates folder')
+    searching = commands.add_parser('search', help='Search MS2 spectra against generated spectra, without writing a library')
+    searching.add_argument('input', help='MGF or MSP file of query spectra')
+    searching.add_argument('--output', '-o', required=True)
+    searching.add_argument('--classes', required=True, help='Comma separated lipid classes, e.g. PC,PE,TG')
+    searching.add_argument('--adducts', help='Comma separated adducts, e.g. "[M+H]+,[M+Na]+". Defaults to every adduct of each class')
+    searching.add_argument('--tails', default='12:0-24:6', help='Tail range as cmin:dmin-cmax:dmax (default 12:0-24:6)')
+    searching.add_argument('--omax', type=int, default=0, help='Maximum hydroxylation of tails')
+    searching.add_argument('--deuterium', type=int, default=0, help='Maximum deuteration of tails')
+    searching.add_argument('--vary-bases', action='store_true', help='Vary ceramide base length with fatty acids')
+    searching.add_argument('--ignore-headgroup-isomerism', action='store_true',
+                           help='Treat fatty acyls on the headgroup and glycerol backbone as equivalent')
+    searching.add_argument('--method', choices=Search.methods, default='dot',
+                           help='Cosine of square-root intensities, or spectral entropy similarity (default dot)')
+    searching.add_argument('--ppm', type=float, default=10, help='Precursor tolerance in ppm (default 10)')
+    searching.add_argument('--fragment-tolerance', type=float, default=0.01, help='Fragment tolerance in Da (default 0.01)')
+    searching.add_argument('--open', action='store_true', help='Ignore query precursors, score spectra sharing fragments')
+    searching.add_argument('--top', type=int, default=5, help='Matches written per query (default 5)')
+    searching.add_argument('--min-peaks', type=int, default=1, help='Fewest matched fragments of a match (default 1)')
+    searching.add_argument('--processes', type=int, default=1)
+    searching.add_argument('--overwrite', action='store_true')
+    searching.add_argument('--templates', help='Folder of modified lipid templates, defaults to the Templates folder')
+    exporting = commands.add_parser('export', help='Write a compiled library (.lsgl) as an MSP library')
+    exporting.add_argument('input', help='Compiled library, generated with --format lsgl')
+    exporting.add_argument('--output', '-o', required=True)
+    exporting.add_argument('--overwrite', action='store_true')
+    args = parser.parse_args(argv)
+
+    if args.command == 'classes':
+        classes = Library.lipid_classes()
+        Library.load_templates(classes, args.templates or RP.exe_path('Templates'))
+        for cls in classes:
+            print(f"{cls.__name__:<20} {', '.join(cls.adducts)}")
+        return 0
+
+    if args.command == 'annotate':
+        try:
+            features, annotated = annotate(args.input, args.output, args.classes.split(','), args.adducts.split(',') if args.adducts else None,
+                                           args.tails, args.omax, args.deuterium, args.vary_bases,
+                                           args.da if args.da is not None else args.ppm, 'Da' if args.da is not None else 'ppm',
+                                           args.ion_mode, args.overwrite, args.templates)
+        except (ValueError, OSError) as error:
+            parser.exit(1, f'lsg: error: {error}\n')
+        print(f'Annotated {annotated} of {features} features in {args.output}', file=sys.stderr)
+        return 0
+
+    if args.command == 'export':
+        try: count = export(args.input, args.output, args.overwrite)
+        except (ValueError, OSError) as error:
+            parser.exit(1, f'lsg: error: {error}\n')
+        print(f'Exported {count} spectra to {args.output}', file=sys.stderr)
+        return 0
+
+    if args.command == 'search':
+        try:
+            searched, matched = search(args.input, args.output, args.classes.split(','), args.adducts.split(',') if args.adducts else None,
+                                       args.tails, args.omax, args.deuterium, args.vary_bases, not args.ignore_headgroup_isomerism,
+                                       args.method, args.ppm, args.fragment_tolerance, args.open, args.top, args.min_peaks,
+                                       args.processes, args.overwrite, args.templates)
+        except (ValueError, OSError) as error:
+            parser.exit(1, f'lsg: error: {error}\n')
+        print(f'Matched {matched} of {searched} spectra in {args.output}', file=sys.stderr)
+        return 0
+
+    def classCompleted(cls):
+        print(f"- {getattr(cls, 'givenName', cls.__name__)} - Completed", file=sys.stderr)
+
+    def completionText(generator):
+        print(f'Generated {generator.count} {generator.noun} in {args.output}', file=sys.stderr)
+        if generator.collapsed:
+            print(f'Collapsed {generator.collapsed} spectra into species-level spectra', file=sys.stderr)
+        if generator.reused:
+            print(f'Reused {generator.reused} of {len(generator.classes_to_generate)} classes from {args.cache}', file=sys.stderr)
+        cache = GL.fragmentCache.info() # Filled in worker processes when there is more than one
+        if cache['hits'] or cache['misses']:
+            print(f"Fragment cache: {cache['hits']} hits, {cache['misses']} misses", file=sys.stderr)
+        cache = Isotopes.envelopeCache.info()
+        if cache['hits'] or cache['misses']:
+            print(f"Isotope envelope cache: {cache['hits']} hits, {cache['misses']} misses", file=sys.stderr)
+        if generator.megabytes:
+            print(f'Wrote {generator.megabytes:.1f} MB at {generator.throughput:.1f} MB/s', file=sys.stderr)
+        if generator.profile:
+            print('\n'.join(Profiling.describe(generator.profile)), file=sys.stderr)
+            print(f'Profile saved to {Profiling.summary_path(args.output)}', file=sys.stderr)
+        if generator.splitFiles:
+            print(f"Split into {len(generator.splitFiles)} files: {', '.join(generator.splitFiles)}", file=sys.stderr)
+
+    try:
+        generate(args.output, args.classes.split(','), args.adducts.split(',') if args.adducts else None,
+                 args.tails, args.omax, args.deuterium, args.format, args.tail_list, args.vary_bases,
+                 not args.ignore_headgroup_isomerism, args.processes, args.overwrite, args.templates, classCompleted,
+                 args.buffer_size, args.merge_ppm, args.bloom_capacity, completionText, args.isotope_peaks, args.cache,
+                 Library.checkpointInterval if args.resume else None, profile=args.profile, split=args.split)
+    except (ValueError, OSError, RuntimeError) as error:
+        parser.exit(1, f'lsg: error: {error}\n')
+    return 0
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,30 @@
+import os
+import sys
+import csv
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import lsg
+import Lipids.GenerateLipids as GL
+
+def test_features_match_generated_precursors(tmp_path):
+    '''Precursors of an inclusion list are each annotated with their class and adduct, and species no tails form are not.'''
+    lsg.generate(str(tmp_path/'lipids.orb'), ['PC', 'PE'], tails='12:0-14:1', format='orb')
+    with open(tmp_path/'lipids.orb', newline='') as file: precursors = list(csv.reader(file))[1:]
+
+    PC, = lsg.find_classes(['PC'])
+    impossible = GL.MA(PC(GL.sn(1, type='Acyl'), GL.sn(12, type='Acyl')), '[M+H]+', 0).mass # PC 13:0, a tail of 1:0
+    with open(tmp_path/'features.csv', 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['m/z', 'polarity'])
+        writer.writerows([row[0], row[5]] for row in precursors)
+        writer.writerow([impossible, 'positive'])
+
+    features, annotated = lsg.annotate(str(tmp_path/'features.csv'), str(tmp_path/'annotated.csv'), ['PC', 'PE'],
+                                       tails='12:0-14:1', tolerance=1)
+    assert (features, annotated) == (len(precursors) + 1, len(precursors))
+
+    with open(tmp_path/'annotated.csv', newline='') as file: rows = list(csv.reader(file))[1:]
+    found = {(row[2], row[4], round(float(row[7]), 4)) for row in rows if row[2]}
+    assert {(row[3], row[11], round(float(row[0]), 4)) for row in precursors} <= found
+    assert rows[-1][2:] == ['']*7
@@ -0,0 +1,28 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import lsg
+import Library
+from Library import BloomFilter
+
+def test_no_false_negatives():
+    '''Every key added is found, and few of the keys not added are.'''
+    bloom = BloomFilter(10000, errorRate=1e-3)
+    keys = [(f'PC {c}:{d}', adduct) for c in range(1000) for d in range(5) for adduct in ('[M+H]+', '[M+Na]+')]
+    for key in keys: bloom.add(key)
+    assert all(key in bloom for key in keys) and len(bloom) == len(keys)
+    assert sum((f'PE {c}:0', '[M+H]+') in bloom for c in range(10000)) < 100
+
+def test_exact_without_capacity(tmp_path):
+    '''Without a capacity species are registered in an exact set, and with one the library written is the same.'''
+    generator = Library.Generator(os.devnull, None, [], [14, 16, 0, 0, 0, 0], [18, 18, []], False, False, [], False, [], False)
+    assert type(generator.ambiguityRegistry()) is set
+    generator.bloomCapacity = 1000
+    assert type(generator.ambiguityRegistry()) is BloomFilter
+
+    for capacity in [0, 100000]:
+        lsg.generate(str(tmp_path/f'{capacity}.msp'), ['PC', 'TG', 'CL'], tails='14:0-18:1', specificOrganisation=False,
+                     bloomCapacity=capacity) # Species-level spectra, each looked up in the registry
+    assert (tmp_path/'0.msp').read_bytes() == (tmp_path/'100000.msp').read_bytes()
@@ -0,0 +1,15 @@
+import os
+import sys
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Lipids.GenerateLipids import Formula
+
+def test_equality():
+    '''Formulas equal dicts and Counters of the same counts, and nothing else.'''
+    formula = Formula({'C':3, 'H':8, 'O':3})
+    assert formula == Formula(formula) == {'C':3, 'H':8, 'O':3} == Counter({'C':3, 'H':8, 'O':3})
+    assert formula != {'C':3, 'H':8}
+    assert formula != {'Xx':1}
+    assert Formula() != None and Formula() != 0 and Formula() != 5
@@ -0,0 +1,31 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Library import MassIndex
+
+def test_exact_without_ppm():
+    '''Without ppm only masses written are found.'''
+    index = MassIndex()
+    index.add(760.585)
+    assert 760.585 in index and 760.5851 not in index and index.sorted == []
+
+def test_ppm_window():
+    '''Masses inside or at ppm of a written mass, above or below it, are merged, and those outside are not.'''
+    for written in [499999.0, 500001.0]: # ppm of the mass looked up, 1 Da at 500,000, exact in floating point
+        index = MassIndex(ppm=2)
+        index.add(written)
+        assert 500000.0 in index # At
+        assert (written + 500000.0)/2 in index # Inside
+        assert written - 1.5 not in index and written + 1.5 not in index # Outside, either side
+        assert len(index) == 1
+
+def test_order_of_writing():
+    '''Masses written in any order are kept sorted, and each is merged against its nearest neighbour.'''
+    index = MassIndex(ppm=2)
+    for mass in [500010.0, 500000.0, 500020.0, 500005.0]: index.add(mass)
+    assert index.sorted == [500000.0, 500005.0, 500010.0, 500020.0]
+    assert 500006.0 in index and 500019.0 in index and 500015.0 not in index
+    index.add(500005.0) # Written again, not listed twice
+    assert index.sorted == [500000.0, 500005.0, 500010.0, 500020.0] and len(index) == 4
@@ -0,0 +1,14 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import lsg
+import Lipids.PrecursorIndex as PI
+
+def test_only_formable_sum_compositions():
+    '''PC from 12:0-14:0 tails is 24:0 to 28:0, not 13:0 (one tail of 1:0) to 29:0.'''
+    PC, = lsg.find_classes(['PC'])
+    index = PI.PrecursorIndex({PC:['[M+H]+']}, [12, 14, 0, 0, 0, 0], lsg.bases([PC], 12, 14, True))
+    names = sorted(PI.sumComposition(index.candidate(i)[2]) for i in range(len(index)))
+    assert names == ['24:0', '25:0', '26:0', '27:0', '28:0']
@@ -0,0 +1,28 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import lsg
+import Library
+import Lipids.GenerateLipids as GL
+
+@pytest.mark.parametrize('name', ['PC', 'TG', 'CL', 'HexCer', 'NAPE'])
+def test_species_as_collapsed_lipids(name):
+    '''The species enumerated by sum composition are the first lipid of each species-level name, in the same order.'''
+    cls, = lsg.find_classes([name])
+    cls.adducts_to_generate = dict(cls.adducts) # As lsg.generate, every adduct
+    generator = Library.Generator(os.devnull, None, [cls], [14, 18, 0, 2, 0, 0], [16, 18, GL.baseTypes],
+                                  False, False, [], False, [], False)
+    generator.generate_tail_lists()
+
+    expected, names, total = [], set(), 0
+    for lipid in generator.generate_class(cls): # Every lipid, collapsed by species-level name
+        species = f'{lipid.lipid_class} {generator.addTailNames(lipid)}'
+        total += 1
+        if species not in names:
+            names.add(species)
+            expected.append(lipid.name)
+    assert [lipid.name for lipid in generator.generate_class(cls, species=True)] == expected
+    assert generator.collapsed == len(cls.adducts)*(total - len(expected)) # Lipids not built, once per adduct
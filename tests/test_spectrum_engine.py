@@ -0,0 +1,30 @@
+import os
+import sys
+import pytest
+import itertools
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import lsg
+import Library
+import Lipids.GenerateLipids as GL
+from Lipids.SpectrumEngine import SpectrumTemplate, verify
+
+@pytest.mark.parametrize('name', ['PC', 'TG', 'CL', 'HexCer', 'NAPE'])
+def test_template_spectra_match_fragments(name):
+    '''Vectorised spectra of every tail combination of 14:0-16:1 tails agree with Lipid.resolve_spectra.'''
+    cls, = lsg.find_classes([name])
+    generator = Library.Generator(os.devnull, None, [cls], [14, 16, 0, 1, 0, 0], [18, 18, GL.baseTypes],
+                                  False, False, [], False, [], True)
+    generator.generate_tail_lists()
+    pools = [pool for pool, r in generator.generate_constituents(cls) for _ in range(r)]
+    indices = list(itertools.product(*[range(len(pool)) for pool in pools]))
+
+    verified = 0
+    for adduct in cls.adducts:
+        try: template = SpectrumTemplate(cls, adduct, pools)
+        except ValueError: continue # Fragments of this adduct can not be separated by tail position
+        result = verify(template, indices)
+        assert (adduct, result['mismatched']) == (adduct, 0)
+        verified += 1
+    assert verified